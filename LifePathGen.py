@@ -1,24 +1,63 @@
-import pickle
+import json
 import os.path
-import urllib.request
+import sys
+import time
 import random
 from collections import defaultdict
 import argparse
-from LifePathLibs import CharacterSheet, Talent
-from LifePathLibs import LifePathTables, MinValDict
+from LifePathLibs import EligibleTalents, PurchaseFrontier
+from LifePathLibs import CharacterRecord, describe_character, un_camel, articelize
+from LifePathLibs import LifePathTables, MinValDict, bonus_damage_steps, compile_tables, load_table_store
+from LifePathLibs import GenerationProfile, profile_modes
+from LifePathLibs import ReplayRecord, ReplayError, read_replay_log, replay_record
+from LifePathLibs import ChoicePolicy, UniformChoices, ScriptedChoices, InteractiveChoices, choice_kinds
+# Everything else (the sheet and roster writers, the network random sources, statistics and multiprocessing)
+# is imported where it is used, so that startup only pays for what a run needs
 
-# Needs 3 formatted int values: number to generate, min value, max value. 13, 1, 20 for 13d20
-rand_api_path = "https://www.random.org/integers/?num=%d&min=%d&max=%d&col=1&base=10&format=plain&rnd=new"
 attribute_names = ['Agility', 'Awareness', 'Brawn', 'Coordination', 'Intelligence', 'Personality', 'Willpower']
 
 
+def empty_skill():
+    return {'exp': 0, 'foc': 0}
+
+
+def call_step(step, *args):
+    return step(*args)
+
+
 class CharacterMaker:
-    def __init__(self, table_store: LifePathTables, true_random=False, full_auto=False, verbose=False, xp:int=0):
-        self.table_store = table_store
+    def __init__(self, table_store: LifePathTables, true_random=False, full_auto=False, verbose=False, xp:int=0,
+                 name: str=None, profile: GenerationProfile=None, choices=None, constrained=None, xp_goals=(),
+                 policy: ChoicePolicy=None, seed: int=None):
+        # With a profile, table lookups go through a counting proxy and each step is timed
+        self.profile = profile
+        self.table_store = profile.tables(table_store) if profile is not None else table_store
         self.true_random = true_random
-        self.full_auto = full_auto
         self.verbose = verbose
         self.xp = xp
+        # Seed the RNG was reset to before generation (if known), and the index picked at every choice, for replay.
+        # Scripted choices replace the prompts when replaying an interactive character.
+        self.seed = seed
+        self.choice_log = []
+        # The policy makes the choices and names the character: at random in full-auto mode, by prompting otherwise
+        if choices is not None:
+            policy = ScriptedChoices(choices)
+        elif policy is None:
+            policy = UniformChoices() if full_auto else InteractiveChoices()
+        self.policy = policy
+        self._policy_random = None
+        # Replays redraw full-auto choices from the seed, so choices a policy cannot redraw are recorded like an
+        # interactive character's, and fed back
+        self.full_auto = full_auto and policy.redraws
+        # Constrained generation (ConstrainedPaths) plans the dice and the attribute and skill choices of a life path
+        # that meets its constraints, and the character follows the plan
+        if constrained is not None and (not full_auto or true_random or not policy.redraws):
+            raise ValueError("Constrained generation requires full_auto mode with the local random generator")
+        self.constrained = constrained
+        self.constraints = constrained.constraints.specs if constrained is not None else ()
+        self.plan = None
+        # XP goals (see objective_from_specs) replace the random XP spend with the best build for them
+        self.xp_goals = tuple(xp_goals)
 
         self.homeland = ''
         self.caste = ''
@@ -47,13 +86,15 @@ class CharacterMaker:
         self.talents = {}
         self.equipment = []
         self.attributes = {att: 7 for att in attribute_names}
-        self.skills = defaultdict(lambda: {'exp': 0, 'foc': 0})
+        self.skills = defaultdict(empty_skill)
+        self.eligible_talents = None
         self.languages = []
         self.xp_spent = 0
         self.xp_spends = []
         self.standing = 0
 
-        self.name = ''
+        self.name = name or ''
+        self.prompt_name = name is None
         self.vigor = 0
         self.resolve = 0
         self.gold = 0
@@ -66,9 +107,27 @@ class CharacterMaker:
 
         self.__generate_steps_rand()
 
+    def __getstate__(self):
+        # The table store is shared by every character and far larger than the character itself, so it is dropped
+        # when pickling (e.g. when returning characters from worker processes).
+        state = self.__dict__.copy()
+        state['table_store'] = None
+        state['eligible_talents'] = None
+        state['profile'] = None
+        state['constrained'] = None
+        state['plan'] = None
+        state['policy'] = None
+        state['_policy_random'] = None
+        state['skills'] = dict(self.skills)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.skills = defaultdict(empty_skill, state['skills'])
+
     def calc_bonus_damage(self):
         d_vals = MinValDict()
-        d_vals.update({8: 0, 9: 1, 11: 2, 13: 3, 15: 5, 25: 6})
+        d_vals.update(bonus_damage_steps)
         self.bonus_melee = d_vals[self.attributes['Brawn']]
         self.bonus_ranged = d_vals[self.attributes['Awareness']]
         self.bonus_presence = d_vals[self.attributes['Personality']]
@@ -85,22 +144,15 @@ class CharacterMaker:
             return 7
 
     def select_print(self, msg):
-        if not self.full_auto:
+        if self.policy.interactive:
             print(msg)
 
     def auto_print(self, msg):
         if self.verbose:
             print(msg)
 
-    @staticmethod
-    def un_camel(text):
-        return text[0].lower() + text[1:] if text else ''
-
-    @staticmethod
-    def articelize(text):
-        if not text:
-            return ''
-        return "an %s" % text if text[0].lower() in ('a', 'e', 'i', 'o', 'u') else "a %s" % text
+    un_camel = staticmethod(un_camel)
+    articelize = staticmethod(articelize)
 
     def skill_cost(self, skill):
         return {'exp': (200 * (skill['exp'] + 1)), 'foc': (200 * (skill['foc'] + 1))}
@@ -109,7 +161,21 @@ class CharacterMaker:
         return 100 * (attribute_level + 1)
 
     def allowed_talents(self):
-        return list(filter(lambda t: t.is_allowed(self.talents, self.skills), self.table_store.talents.values()))
+        if self.eligible_talents is None:
+            self.eligible_talents = EligibleTalents(self.table_store.talents, self.table_store.talent_index,
+                                                    self.talents, self.skills)
+        return self.eligible_talents.allowed()
+
+    def add_talent(self, name: str, description):
+        self.talents[name] = description
+        if self.eligible_talents is not None:
+            self.eligible_talents.talent_added(name, description)
+
+    def raise_skill(self, skill: str, exp: int, foc: int):
+        self.skills[skill]['exp'] += exp
+        self.skills[skill]['foc'] += foc
+        if self.eligible_talents is not None:
+            self.eligible_talents.skill_changed(skill, self.skills[skill])
 
     def affordable_purchases(self):
         affordable_talents = {t: t.cost(self.skills) for t in self.allowed_talents() if t.cost(self.skills) <= self.xp}
@@ -128,51 +194,71 @@ class CharacterMaker:
             all_affordable['attributes'] = affordable_attributes
         return all_affordable
 
-    def select_from_choices(self, prompt, choices: list):
+    def select_from_choices(self, prompt, choices: list, kind: str=None):
+        # kind names the sort of choice (e.g. 'best_attribute', 'elective_skill'), so a plan can make it
         if not isinstance(choices, list):
             choices = list(choices)
-        if self.full_auto:
-            auto_choice = choices[arbitrary_random(0, len(choices)-1)]
-            self.auto_print("Automatically selecting %s from choices: %s" % (auto_choice, ', '.join(choices)))
-            return auto_choice
-        else:
-            nums = [str(n + 1) for n in range(len(choices))]
-            vals = {n: choice for n, choice in zip(nums, choices)}
-            select_vals = sorted(['[%s]: %s' % (n, choice) for n, choice in vals.items()])
-            input_prompt = '%s\n%s\nYour choice: ' % (prompt, '\n'.join(select_vals))
-            selected = input(input_prompt)
-            while selected not in choices + nums:
-                print('Selected value: "%s" not valid, choose a value from the following:\n%s.' %
-                      (selected, ', '.join(choices)))
-                selected = input(input_prompt)
-            return selected if selected in choices else vals[selected]
+        if self.plan is not None:
+            choice_num = self.plan.pick(kind)
+            if choice_num is not None:
+                self.choice_log.append(choice_num)
+                self.auto_print("Selecting %s from choices: %s" % (choices[choice_num], ', '.join(choices)))
+                return choices[choice_num]
+        choice_num = self.policy.choose(self, prompt, choices, kind)
+        self.choice_log.append(choice_num)
+        if not self.policy.interactive:
+            self.auto_print("Automatically selecting %s from choices: %s" % (choices[choice_num], ', '.join(choices)))
+        return choices[choice_num]
+
+    def policy_random(self) -> random.Random:
+        # Policies that are not redrawn from the seed on replay draw from a stream of their own, so the rolls after
+        # their choices and the name are the same whether they are made or fed back
+        if self._policy_random is None:
+            self._policy_random = random.Random('policy:%d' % self.seed) if self.seed is not None else random.Random()
+        return self._policy_random
 
     def __generate_steps_rand(self):
-        rand_vals = roll_dice('14d20', true_random=self.true_random)
-
-        self.step1_homeland(rand_vals.pop() + rand_vals.pop())
-        self.step2_attributes((rand_vals.pop(), rand_vals.pop()))
-        self.step3_caste(rand_vals.pop())
-        self.step4_story(rand_vals.pop())
-        self.step5_archetype(rand_vals.pop())
-        self.step6_nature(rand_vals.pop())
-        self.step7_education(rand_vals.pop())
-        self.step8_war_story(rand_vals.pop())
-        self.step9_finishing_touches(rand_vals)
-        self.step10_calcs_and_naming()
-        self.step11_randomize_xp()
+        profile = self.profile
+        run_step = call_step if profile is None else profile.timed
+        if profile is not None:
+            if self.true_random:
+                from LifePathLibs import get_random_source
+                profile.character_started(get_random_source())
+            else:
+                profile.character_started(None)
+        if self.constrained is not None:
+            self.plan = self.constrained.plan(random)
+            rand_vals = list(self.plan.dice)
+        else:
+            rand_vals = roll_dice('14d20', true_random=self.true_random)
+
+        run_step(self.step1_homeland, rand_vals.pop() + rand_vals.pop())
+        run_step(self.step2_attributes, (rand_vals.pop(), rand_vals.pop()))
+        run_step(self.step3_caste, rand_vals.pop())
+        run_step(self.step4_story, rand_vals.pop())
+        run_step(self.step5_archetype, rand_vals.pop())
+        run_step(self.step6_nature, rand_vals.pop())
+        run_step(self.step7_education, rand_vals.pop())
+        run_step(self.step8_war_story, rand_vals.pop())
+        run_step(self.step9_finishing_touches, rand_vals)
+        run_step(self.step10_calcs_and_naming)
+        if self.constrained is not None:
+            self.constrained.check(self)
+            self.plan = None
+        run_step(self.step11_randomize_xp)
+        if profile is not None:
+            profile.character_done(self)
 
     def add_skill(self, skill: str, exp: int, foc: int):
         if 'character’s career skill' in skill:
             self.auto_print("Boosting career skill %s" % self.career_skill)
-            self.skills[self.career_skill]['exp'] += exp
-            self.skills[self.career_skill]['foc'] += foc
+            self.raise_skill(self.career_skill, exp, foc)
         elif "random career skill" in skill:
             self.auto_print("Adding random career skill from education")
-            self.add_random_career_skill(roll_dice('1d20', self.true_random))
+            self.add_random_career_skill(self.plan.roll() if self.plan is not None else
+                                         roll_dice('1d20', self.true_random))
         else:
-            self.skills[skill]['exp'] += exp
-            self.skills[skill]['foc'] += foc
+            self.raise_skill(skill, exp, foc)
 
     def clean_step(self, step_info):
         if isinstance(step_info, str):
@@ -189,7 +275,7 @@ class CharacterMaker:
         talent_src_skills = []
         if 'careertalent' in values:
             talent, page = values['careertalent'].split('(')
-            self.talents[talent.strip()] = page.strip().replace(')', '')
+            self.add_talent(talent.strip(), page.strip().replace(')', ''))
         if 'careerskill' in values:
             self.career_skill = values['careerskill'].split('in the ')[1].replace(' skill', '')
             self.add_skill(self.career_skill, 2, 2)  # Career skill is +2/+2
@@ -205,20 +291,20 @@ class CharacterMaker:
                 "Select 2 elective skills to each get +1EXP/+1FOC. %s grants you the following elective skills:\n%s" %
                 (skill_type, ', '.join(elective_skills)))
             for order in ('first', 'second'):
-                skill_elect = self.select_from_choices("Select the %s skill to get +1EXP/+1FOC:\n" % order, elective_skills)
+                skill_elect = self.select_from_choices("Select the %s skill to get +1EXP/+1FOC:\n" % order, elective_skills,
+                                                       'elective_skill')
                 self.add_skill(skill_elect, 1, 1)
                 elective_skills.remove(skill_elect)
         if 'talent' in values:
             skill_choices = [s.replace("your character’s career skill", self.career_skill)
                              .replace("a random career skill (roll on Archetype table)", self.ex_random_skill)
                              for s in talent_src_skills]
-            talent_choices = {v.name: v for (k, v) in self.table_store.talents.items() if v.is_allowed(self.talents, self.skills)
-                              and v.matches_skills(skill_choices)}
-            talent_names = list(set(talent_choices.keys()))
+            talent_choices = {v.name: v for v in self.allowed_talents() if v.matches_skills(skill_choices)}
+            talent_names = list(talent_choices.keys())
             selected_talent = self.select_from_choices(
                 "Choose any one talent associated with one of the following skills:\n%s" %
-                ', '.join(talent_names), talent_names)
-            self.talents[selected_talent] = talent_choices[selected_talent].description
+                ', '.join(talent_names), talent_names, 'talent')
+            self.add_talent(selected_talent, talent_choices[selected_talent].description)
         if 'equipment' in values:
             self.equipment += values['equipment'].split('\n')
         if 'attributeimprovement' in values:
@@ -236,17 +322,18 @@ class CharacterMaker:
         # Homeland, Talent, Languages
         homeland_info = self.clean_step(self.table_store.homelands.get(rand_val))
         self.homeland = homeland_info[0]
-        self.talents[homeland_info[1]] = self.table_store.homelands_talents.get(homeland_info[1])
+        self.add_talent(homeland_info[1], self.table_store.homelands_talents.get(homeland_info[1]))
         self.languages.append(homeland_info[2])
 
     def step2_attributes(self, rand_vals):
         optionals = []
-        aspects = set()
+        aspects = []
         mandatories = []
         for val in rand_vals:
             aspect, mandatory1, mandatory2, optional1, optional2 = self.clean_step(self.table_store.attributes.get(val))
             optionals.append((aspect, optional1, optional2))
-            aspects.add(aspect)
+            if aspect not in aspects:
+                aspects.append(aspect)
             mandatories.append(mandatory1)
             mandatories.append(mandatory2)
         for aspect in aspects:
@@ -256,12 +343,15 @@ class CharacterMaker:
         if not same:
             aspect_txt = "your character is both %s" % ' and '.join(aspects)
             self.select_print('Because %s, your mandatory attributes are:\n%s' % (aspect_txt, ', '.join(mandatories)))
-        best = self.select_from_choices('Select your "best" mandatory attribute (+3 to attribute):\n', mandatories)
+        best = self.select_from_choices('Select your "best" mandatory attribute (+3 to attribute):\n', mandatories,
+                                         'best_attribute')
         mandatories.remove(best)
-        worst = self.select_from_choices('Select your "worst" mandatory attribute (+1 to attribute):\n', mandatories)
+        worst = self.select_from_choices('Select your "worst" mandatory attribute (+1 to attribute):\n', mandatories,
+                                          'worst_attribute')
         while worst == best:
             self.select_print("You cannot select the same trait as best and worst")
-            worst = self.select_from_choices('Select your "worst" mandatory attribute (+1 to attribute):\n', mandatories)
+            worst = self.select_from_choices('Select your "worst" mandatory attribute (+1 to attribute):\n', mandatories,
+                                          'worst_attribute')
         mandatories.remove(worst)
         if same:
             help_txt = "Because your character only has one aspect, both attributes get +2 as well"
@@ -273,7 +363,7 @@ class CharacterMaker:
             self.attributes[other] += 2
         for aspect, optional1, optional2 in optionals:
             choice = self.select_from_choices("Select either %s or %s to get another +1:\n" % (optional1, optional2),
-                                              (optional1, optional2))
+                                              (optional1, optional2), 'optional_attribute')
             self.attributes[choice] += 1
 
     def step3_caste(self, rand_val):
@@ -282,7 +372,7 @@ class CharacterMaker:
         self.caste = caste_info[0]
         self.caste_description = self.table_store.castes_descriptions.get(self.caste)
         for talent in caste_info[1].split(','):
-            self.talents[talent] = self.table_store.castes_talents.get(talent)
+            self.add_talent(talent, self.table_store.castes_talents.get(talent))
         self.add_skill(caste_info[2], 1, 1)
         self.standing += int(caste_info[3])
 
@@ -341,62 +431,106 @@ class CharacterMaker:
         self.resolve = self.attributes.get('Willpower') + self.skills.get('Discipline', {}).get('exp', 0)
         self.gold = self.attributes.get('Personality') + self.skills.get('Society', {}).get('exp', 0)
         self.height = "%d'%d\"" % (self.rand_foot(arbitrary_random()), arbitrary_random(0, 11))
-        self.gender = self.select_from_choices("Select your character's gender:", ["Male", "Female"])
+        self.gender = self.select_from_choices("Select your character's gender:", ["Male", "Female"], 'gender')
         self.calc_bonus_damage()
-        pronoun = "him" if self.gender == "Male" else "her"
-        self.name = input("Enter a name for your character to save %s, or leave blank and character will be printed in "
-                          "the terminal but not saved:" % pronoun)
+        if self.prompt_name:
+            self.name = self.policy.name(self)
         self.age = arbitrary_random(15, 40)
 
+    def purchase_frontier(self) -> PurchaseFrontier:
+        frontier = PurchaseFrontier(self.xp)
+        for talent in self.allowed_talents():
+            frontier.set_cost('talents', talent, talent.cost(self.skills))
+        for skill_name, skill in self.skills.items():
+            self.update_skill_costs(frontier, skill_name)
+        for att_name, att_level in self.attributes.items():
+            frontier.set_cost('attributes', att_name, self.att_cost(att_level))
+
+        def talent_eligibility_changed(key, allowed):
+            talent = self.table_store.talents[key]
+            if allowed:
+                frontier.set_cost('talents', talent, talent.cost(self.skills))
+            else:
+                frontier.remove('talents', talent)
+        self.eligible_talents.listener = talent_eligibility_changed
+        return frontier
+
+    def update_skill_costs(self, frontier: PurchaseFrontier, skill_name: str):
+        next_costs = self.skill_cost(self.skills[skill_name])
+        frontier.set_cost('skill_exp', skill_name, next_costs['exp'])
+        frontier.set_cost('skill_foc', skill_name, next_costs['foc'])
+
+    def can_afford_purchases(self):
+        # Talents are the cheapest possible purchase: tier 1 costs 200, less 25 per point of focus in its skill.
+        # Checking that bound first means the talent tree is never loaded when there is no XP to spend.
+        max_foc = max((s['foc'] for s in self.skills.values()), default=0)
+        return self.xp >= 200 - 25 * max_foc
+
     def step11_randomize_xp(self):
-        all_affordable = self.affordable_purchases()
-        while all_affordable:
-            upg_type = random.sample(list(all_affordable), 1)[0]
-            upg_key = random.sample(all_affordable[upg_type].keys(), 1)[0]
-            upg_cost = all_affordable[upg_type][upg_key]
-            level_str = ''
+        if self.xp_goals:
+            self.spend_xp_on_goals()
+            return
+        if not self.can_afford_purchases():
+            return
+        frontier = self.purchase_frontier()
+        try:
+            self.spend_xp(frontier)
+        finally:
+            self.eligible_talents.listener = None
+
+    def spend_xp(self, frontier: PurchaseFrontier):
+        purchase = frontier.choose()
+        while purchase:
+            upg_type, upg_key, upg_cost = purchase
+            self.buy(upg_type, upg_key, upg_cost)
             if upg_type == 'attributes':
-                self.attributes[upg_key] += 1
-                level_str = "Spent %d xp to raise the value of the %s attribute by 1 point" % (upg_cost, upg_key)
-            elif upg_type == 'talents':
-                self.talents[upg_key.name] = upg_key.description
-                level_str = "Spent %d xp to purchase the talent %s" % (upg_cost, upg_key)
-            elif 'exp' in upg_type:
-                self.skills[upg_key]['exp'] += 1
-                level_str = "Spent %d xp to raise exp in the %s skill by 1 point" % (upg_cost, upg_key)
-            elif 'foc' in upg_type:
-                self.skills[upg_key]['foc'] += 1
-                level_str = "Spent %d xp to raise foc in the %s skill by 1 point" % (upg_cost, upg_key)
-            self.xp -= upg_cost
-            self.xp_spent += upg_cost
-            self.xp_spends.append(level_str)
-            all_affordable = self.affordable_purchases()
+                frontier.set_cost('attributes', upg_key, self.att_cost(self.attributes[upg_key]))
+            elif upg_type in ('skill_exp', 'skill_foc'):
+                self.update_skill_costs(frontier, upg_key)
+            if upg_type == 'skill_foc':
+                # Talent costs are discounted by the focus in the talent's own skill
+                for key in self.table_store.talent_index.by_skill.get(upg_key, ()):
+                    if key in self.eligible_talents.eligible:
+                        talent = self.table_store.talents[key]
+                        frontier.set_cost('talents', talent, talent.cost(self.skills))
+            frontier.spend(upg_cost)
+            purchase = frontier.choose()
+
+    def buy(self, upg_type: str, upg_key, upg_cost: int):
+        if upg_type == 'attributes':
+            self.attributes[upg_key] += 1
+            level_str = "Spent %d xp to raise the value of the %s attribute by 1 point" % (upg_cost, upg_key)
+        elif upg_type == 'talents':
+            self.add_talent(upg_key.name, upg_key.description)
+            level_str = "Spent %d xp to purchase the talent %s" % (upg_cost, upg_key)
+        elif upg_type == 'skill_exp':
+            self.raise_skill(upg_key, 1, 0)
+            level_str = "Spent %d xp to raise exp in the %s skill by 1 point" % (upg_cost, upg_key)
+        else:
+            self.raise_skill(upg_key, 0, 1)
+            level_str = "Spent %d xp to raise foc in the %s skill by 1 point" % (upg_cost, upg_key)
+        self.xp -= upg_cost
+        self.xp_spent += upg_cost
+        self.xp_spends.append(level_str)
+
+    def spend_xp_on_goals(self):
+        """Spends XP on the build that best meets the XP goals, found by XpOptimizer. Each talent is only bought once
+        the character meets its pre-requisites."""
+        from LifePathLibs import objective_from_specs, optimize_xp
+        plan = optimize_xp(self, objective_from_specs(self.xp_goals))
+        for upg_type, upg_key, upg_cost in plan.purchases:
+            if upg_type == 'talents' and not upg_key.is_allowed(self.talents, self.skills):
+                raise ValueError("Optimized XP plan buys %s before meeting its pre-requisites" % upg_key)
+            self.buy(upg_type, upg_key, upg_cost)
 
     def __str__(self):
-        char_str = "\nYou are %s from the land of %s.\n" % (self.articelize(self.un_camel(self.caste)), self.homeland) + \
-            "You are generally considered to be %s.\n" % (', and '.join(self.attribute_aspects)) +\
-            "Your past has been defined by %s. %s\nBut you also know that %s.\n" % \
-                   (self.caste_story, self.caste_story_description, self.un_camel(self.nature_description)) +\
-            'You describe your education as having been %s. %s.\n' % (self.education, self.education_description) +\
-            "Your life has changed since you become %s. These days, %s.\n" % \
-                   (self.articelize(self.archetype), self.un_camel(self.archetype_description)) +\
-            "Recently, you find your life increasingly defined by %s and your %s nature.\n" \
-                   % (self.un_camel(self.trait), self.un_camel(self.nature)) +\
-            "But you will never forget your time at war, when you %s.\n" % self.war_story +\
-            "------------------------------------------\n" +\
-            "Your stats are as follows:\n" +\
-            "Homeland:\n\t%s\n" % self.homeland +\
-            "Languages Spoken:\n\t%s\n" % ','.join(self.languages) +\
-            "Social Standing:\n\t%d\n" % self.standing +\
-            "Attributes:\n\t%s\n" % '\n\t'.join(["%s - %s" % (k, v) for (k, v) in self.attributes.items()]) +\
-            "Talents:\n\t%s\n" % '\n\t'.join(["%s: %s" % (k, v) for k, v in self.talents.items()]) +\
-            "Skills:\n\t%s\n" % '\n\t'.join(['%s: %s' % (k, '%d EXP/%d FOC' % (v['exp'], v['foc']))
-                                             for (k, v) in self.skills.items()]) +\
-            "Equipment:\n\t%s\n" % '\n\t'.join(self.equipment) +\
-            "\n--------------------------------\n%s" % self.finishing_touches +\
-            "\nExperience Points: %d/%d" % (self.xp_spent, self.xp_spent+self.xp) +\
-            "\n------------Level Ups-------------\n%s" % '\n'.join(self.xp_spends)
-        return char_str
+        return describe_character(self)
+
+    def to_record(self) -> CharacterRecord:
+        return CharacterRecord.from_character(self)
+
+    def to_replay(self) -> ReplayRecord:
+        return replay_record(self)
 
 
 def roll_dice(roll_type: str, true_random=False):
@@ -406,35 +540,155 @@ def roll_dice(roll_type: str, true_random=False):
 
 def arbitrary_random(min_val=1, max_val=20, num_vals=1, true_random=False):
     if true_random:
-        with urllib.request.urlopen(rand_api_path % (num_vals, min_val, max_val)) as randoms:
-            nums = [int(n) for n in randoms.read().strip().split(b'\n')]
+        from LifePathLibs import get_random_source
+        nums = get_random_source().randints(min_val, max_val, num_vals)
     else:
         nums = [random.randint(min_val, max_val) for i in range(num_vals)]
     r_val = nums[0] if num_vals == 1 else nums
     return r_val
 
 
-def gen_character(true_random=False, full_auto=False, verbose=False, xp:int=0):
-    script_dir = os.path.dirname(os.path.realpath(__file__))
-    table_file = os.path.join(script_dir, 'LifePathLibs', 'tables.dat')
-    table_store = LifePathTables()
-    with open(table_file, 'rb') as table_store_in:
-        table_dict = pickle.load(table_store_in)
-        table_store.read_raw_table_dict(table_dict)
-    char_maker = CharacterMaker(table_store, true_random=true_random, full_auto=full_auto, verbose=verbose, xp=xp)
+def gen_character(true_random=False, full_auto=False, verbose=False, xp:int=0, table_store: LifePathTables=None,
+                  name: str=None, profile: GenerationProfile=None, constrained=None, xp_goals=(),
+                  policy: ChoicePolicy=None, seed: int=None):
+    if table_store is None:
+        table_store = load_table_store()
+    char_maker = CharacterMaker(table_store, true_random=true_random, full_auto=full_auto, verbose=verbose, xp=xp,
+                                name=name, profile=profile, constrained=constrained, xp_goals=xp_goals, policy=policy,
+                                seed=seed)
     return char_maker
 
 
+def character_seeds(master_seed: int, n: int):
+    """Derives a reproducible seed for each of n characters from a single master seed."""
+    seed_rng = random.Random(master_seed)
+    for i in range(n):
+        yield seed_rng.getrandbits(64)
+
+
+def seeded_character(table_store: LifePathTables, seed: int, **char_args):
+    random.seed(seed)
+    return gen_character(table_store=table_store, seed=seed, **char_args)
+
+
+def constrained_paths(table_store: LifePathTables, specs):
+    """The ConstrainedPaths for constraint specs, raising a ConstraintError if they cannot be parsed or met."""
+    from LifePathLibs import Constraints, ConstrainedPaths, LifePathModel
+    return ConstrainedPaths(LifePathModel(table_store), Constraints(specs))
+
+
+def replay_character(record: ReplayRecord, table_store: LifePathTables=None, constrained=None) -> CharacterMaker:
+    """Regenerates the character a replay record was made from. A full-auto character redraws its choices from the
+    seed, and those are checked against the recorded ones; an interactive one has its recorded choices fed back in
+    place of the prompts. A constrained character is redrawn under its constraints, from constrained if given (the
+    ConstrainedPaths for them) or else built afresh."""
+    if table_store is None:
+        table_store = load_table_store()
+    if record.constraints and constrained is None:
+        constrained = constrained_paths(table_store, record.constraints)
+    random.seed(record.seed)
+    char = CharacterMaker(table_store, full_auto=record.full_auto, xp=record.xp, name=record.name,
+                          choices=None if record.full_auto else record.choices,
+                          constrained=constrained if record.constraints else None, xp_goals=record.xp_goals,
+                          seed=record.seed)
+    if tuple(char.choice_log) != record.choices:
+        raise ReplayError("Replayed character made different choices from the recording")
+    return char
+
+
+def replay_batch(log_path: str, table_store: LifePathTables=None):
+    """Yields the characters of a replay log, regenerated one at a time."""
+    if table_store is None:
+        table_store = load_table_store()
+    constrained = {}
+    for record in read_replay_log(log_path):
+        if record.constraints and record.constraints not in constrained:
+            constrained[record.constraints] = constrained_paths(table_store, record.constraints)
+        yield replay_character(record, table_store, constrained.get(record.constraints))
+
+
+# Per-process state for parallel generation, set up once by _init_worker when each worker starts
+_worker_table_store = None
+_worker_char_args = {}
+_worker_compact = False
+
+
+def _init_worker(char_args: dict, random_source, compact=False):
+    global _worker_table_store, _worker_char_args, _worker_compact
+    _worker_table_store = load_table_store()
+    _worker_char_args = char_args
+    _worker_compact = compact
+    if random_source is not None:
+        from LifePathLibs import set_random_source
+        set_random_source(random_source)
+
+
+def _gen_worker_character(seed: int):
+    char = seeded_character(_worker_table_store, seed, **_worker_char_args)
+    return char.to_record() if _worker_compact else char
+
+
+def generate_batch(n: int, true_random=False, full_auto=False, verbose=False, xp:int=0,
+                   table_store: LifePathTables=None, name: str=None, seed: int=None, workers: int=1,
+                   profile: GenerationProfile=None, compact=False, constrained=None, xp_goals=(),
+                   policy: ChoicePolicy=None):
+    """Yields n characters as they are generated, loading the tables once and sharing them across the batch.
+
+    Each character is generated from its own seed derived from the batch seed (a random one if none is given), so the
+    same seed always gives the same roster whether it is generated serially or spread over several worker processes,
+    and every character can be replayed. Parallel generation
+    requires full_auto, since the workers cannot prompt for input. A profile collects timings and counters for every
+    character, and is only supported for serial generation. With compact, each character is yielded as a
+    CharacterRecord, which is far smaller to keep or to send back from a worker process. With constrained (a
+    ConstrainedPaths), every character meets its constraints before XP; this requires full_auto. With xp_goals, XP
+    is spent on the best build for them instead of at random. A policy (a ChoicePolicy) makes the choices and names
+    the characters in place of the full-auto or interactive default; a stateful one is shared by the whole batch."""
+    char_args = {'true_random': true_random, 'full_auto': full_auto, 'verbose': verbose, 'xp': xp, 'name': name,
+                 'constrained': constrained, 'xp_goals': xp_goals, 'policy': policy}
+    if seed is None:
+        seed = random.getrandbits(64)
+    if workers > 1:
+        if not full_auto or policy is not None and policy.interactive:
+            raise ValueError("Parallel generation requires full_auto mode")
+        if profile is not None:
+            raise ValueError("Profiling is only supported for serial generation")
+        import multiprocessing
+        from LifePathLibs import get_random_source
+        chunk_size = max(1, min(64, n // (workers * 4)))
+        with multiprocessing.Pool(workers, initializer=_init_worker,
+                                  initargs=(char_args, get_random_source() if true_random else None, compact)) as pool:
+            yield from pool.imap(_gen_worker_character, character_seeds(seed, n), chunk_size)
+        return
+    if table_store is None:
+        table_store = load_table_store()
+    char_args['profile'] = profile
+    for char_seed in character_seeds(seed, n):
+        char = seeded_character(table_store, char_seed, **char_args)
+        yield char.to_record() if compact else char
+
+
 def parse_args():
     parser = argparse.ArgumentParser(description="Conan character generator parsed from PDF with some hand-fiddling "
                                                  "to clean things up.")
     parser.add_argument('-f', "--full-auto", action='store_true', default=False,
                         help="Turns on full-auto mode. In this mode, the generator will automatically make all "
-                             "selections randomly or psuedo-randomly with no user input.")
+                             "selections randomly or psuedo-randomly with no user input. Characters are not prompted "
+                             "for a name (see --names), so they are printed rather than saved.")
     parser.add_argument('-t', "--true-random", action='store_true', default=False,
                         help="Enables truly random usage (from random.org). This makes the code a bit slower since the "
                              "random numbers are coming over the web, but if you want true randomness, enable it. The"
                              "default is to use psuedo-random numbers from Python.")
+    parser.add_argument("--random-url", type=str, default=None,
+                        help="URL template for the true-random source, in place of random.org. It must take the same "
+                             "three %%d values (count, min, max) and return one integer per line. Numbers are fetched "
+                             "in large blocks and buffered locally.")
+    parser.add_argument("--prefetch", action='store_true', default=False,
+                        help="Fetch true-random numbers in the background over a persistent connection, requesting the "
+                             "next block while the current one is still in use.")
+    parser.add_argument("--random-deadline", type=float, default=None,
+                        help="With --prefetch, the longest to wait (in seconds) on a late block of random numbers "
+                             "before falling back to local psuedo-random numbers until it arrives. By default "
+                             "generation always waits.")
     parser.add_argument('-v', "--verbose", action="store_true", default=False,
                         help="Turn on verbose printing. when using full-auto mode, this will log automatic choices.")
     parser.add_argument('-o', "--out-dir", type=str, default=os.path.dirname(os.path.realpath(__file__)),
@@ -442,23 +696,233 @@ def parse_args():
     parser.add_argument('-x', "--xp", type=int, default=0,
                         help="Specify a value of XP to randomly spend on skill, talent and attribute upgrades "
                              "for your character")
-    return parser.parse_args()
-
-
-def main():
-    args = parse_args()
-    char = gen_character(args.true_random, args.full_auto, args.verbose, args.xp)
+    parser.add_argument('-n', "--count", type=int, default=1,
+                        help="Number of characters to generate. The tables are only loaded once for the whole batch, "
+                             "and the generation rate is reported at the end.")
+    parser.add_argument("--archive", type=str, default=None,
+                        help="Write every generated character's FG XML into a single archive instead of separate files. "
+                             "The format follows the extension: .zip, .tar, .tar.gz/.tgz or .tar.bz2.")
+    parser.add_argument("--jsonl", type=str, default=None,
+                        help="Write a structured JSON record per generated character, one per line, to this file "
+                             "(or to stdout for '-') instead of printing or saving each character.")
+    parser.add_argument("--replay-log", type=str, default=None,
+                        help="Write a compact replay record (seed, choices and name, a few dozen bytes) for each "
+                             "generated character to this file, instead of printing or saving it. Characters made "
+                             "with --true-random cannot be replayed.")
+    parser.add_argument("--replay", type=str, default=None,
+                        help="Regenerate the characters recorded in a replay log instead of generating new ones, "
+                             "then print, save or export them as usual.")
+    parser.add_argument("--columnar", type=str, default=None,
+                        help="Append every generated character to a columnar roster in this directory (created if "
+                             "missing), instead of printing or saving it: fixed-width attribute and skill columns, "
+                             "dictionary-encoded life path steps and encoded talent and equipment lists, all of which "
+                             "can be memory-mapped for analysis.")
+    parser.add_argument("--corpus", type=str, default=None,
+                        help="Add every generated character to this indexed corpus file (created if missing), "
+                             "instead of printing or saving it. With --query, the corpus to search.")
+    parser.add_argument('-q', "--query", action='append', default=None, metavar='SPEC',
+                        help="Print (or save or export) the characters in --corpus that match this query instead of "
+                             "generating new ones; repeat to combine. Queries take the --require syntax over the "
+                             "finished characters: homeland=Cimmeria, talent=Blood on Steel, Melee>=2, Melee.foc>=1, "
+                             "Brawn>=10, standing<=2.")
+    parser.add_argument('-w', "--workers", type=int, default=1,
+                        help="Number of worker processes to spread batch generation over. Requires full-auto mode.")
+    parser.add_argument('-s', "--seed", type=int, default=None,
+                        help="Master seed for the batch. Each character gets its own seed derived from this one, so "
+                             "the same seed produces the same characters regardless of the number of workers.")
+    parser.add_argument("--compile-tables", action='store_true', default=False,
+                        help="Compile the life path and talent tables into a pre-normalized artifact for fast startup, "
+                             "then exit. The generator also does this automatically whenever the artifact is missing "
+                             "or older than the source tables.")
+    parser.add_argument('-r', "--require", action='append', default=None, metavar='CONSTRAINT',
+                        help="Only generate characters whose life path (before XP) meets this constraint; repeat for "
+                             "more. Steps take entries (homeland=Cimmeria, caste=Farmer|Herder, archetype!=Pirate); "
+                             "attributes, skills and standing take bounds (Brawn>=10, Sorcery.foc>=2, standing<=2), "
+                             "and a bare skill name means any expertise in it. Rolls and choices are drawn given the "
+                             "constraints, so rare characters take no longer than common ones, and constraints no "
+                             "character can meet are reported before generating. Requires --full-auto.")
+    parser.add_argument("--optimize", action='append', default=None, metavar='GOAL',
+                        help="Spend XP on the build that best meets this goal instead of at random; repeat for more. "
+                             "A skill (Melee) values the chance of passing tests with it, an attribute (Willpower) "
+                             "its value, and talent=Name buys that talent and its pre-requisites first if they can be "
+                             "afforded. Requires --xp.")
+    parser.add_argument("--names", action='store_true', default=False,
+                        help="Name characters from syllables for their homeland instead of prompting for a name (or, "
+                             "in full-auto mode, leaving them unnamed). Named characters are saved, not printed.")
+    parser.add_argument("--weight", action='append', default=None, metavar='KIND:CHOICE=WEIGHT',
+                        help="In full-auto mode, make a choice more or less likely than the others (which weigh 1), "
+                             "e.g. gender:Female=3 or talent:Agile=0; repeat for more. Kinds: %s." %
+                             ', '.join(choice_kinds))
+    parser.add_argument("--stats", type=int, default=None, metavar='N',
+                        help="Statistics mode: generate N full-auto characters (before XP) in bulk with NumPy and print "
+                             "a JSON report of the distribution of every life path step, the final attributes and "
+                             "skills, and the derived stats. Uses --seed if given. Requires NumPy.")
+    parser.add_argument("--exact", action='store_true', default=False,
+                        help="Print a JSON report of the exact probabilities of every life path step, the caste and "
+                             "story pairs, the mandatory attributes, the final attributes and the bonus damage, "
+                             "computed directly from the tables. Laid out like the --stats report, so the two can "
+                             "be checked against each other.")
+    parser.add_argument("--profile", action='store_true', default=False,
+                        help="Time each generation step and count table lookups, talent eligibility checks, XP spend "
+                             "iterations and remote random fetches, then print a summary to stderr.")
+    parser.add_argument("--profile-character", type=str, default=None, choices=profile_modes,
+                        help="Generate a single character under cProfile or tracemalloc (after the tables are loaded) "
+                             "and print the top entries to stderr, or save them with --profile-dump.")
+    parser.add_argument("--profile-dump", type=str, default=None,
+                        help="File to save the --profile-character result to, as pstats data or a tracemalloc "
+                             "snapshot.")
+    args = parser.parse_args()
+    if args.profile and args.workers > 1:
+        parser.error("--profile cannot be combined with --workers")
+    if args.stats is not None and args.true_random:
+        parser.error("--stats draws its rolls from NumPy and cannot be combined with --true-random")
+    if args.workers > 1 and not args.full_auto:
+        parser.error("--workers requires --full-auto")
+    if args.query and not args.corpus:
+        parser.error("--query requires --corpus")
+    if args.replay_log and args.true_random:
+        parser.error("--replay-log cannot be combined with --true-random")
+    if args.require and (not args.full_auto or args.true_random or args.replay or args.stats is not None or
+                         args.exact or args.profile_character):
+        parser.error("--require requires --full-auto, and cannot be combined with --true-random, --replay, --stats, "
+                     "--exact or --profile-character")
+    return args
+
+
+def save_or_print(char: CharacterMaker, out_dir: str):
     if char.name:
+        from LifePathLibs import CharacterSheet
         sheet = CharacterSheet(char)
-        out_dir = args.out_dir
         f_name = "FG_import_" + char.name.replace(' ', '') + '.xml'
         save_file = os.path.join(out_dir, f_name)
         print(save_file)
         with open(save_file, 'w') as xml_out:
-            xml_out.write(sheet.create_fg_xml())
+            sheet.write_fg_xml(xml_out)
     else:
         print(char)
 
 
+def main():
+    args = parse_args()
+    if args.compile_tables:
+        compile_tables()
+        return
+    if args.exact:
+        from LifePathLibs import ExactDistributions
+        print(json.dumps(ExactDistributions(load_table_store()).report(), indent=2, ensure_ascii=False))
+        return
+    if args.stats is not None:
+        from LifePathLibs import life_path_stats
+        start = time.perf_counter()
+        try:
+            report = life_path_stats(load_table_store(), args.stats, seed=args.seed)
+        except ImportError as e:
+            sys.exit(str(e))
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        elapsed = time.perf_counter() - start
+        print("Sampled %d characters in %.2fs" % (args.stats, elapsed), file=sys.stderr)
+        return
+    if args.prefetch or args.random_url:
+        from LifePathLibs import EntropyPool, AsyncPrefetchSource, set_random_source, rand_api_path
+        api_path = args.random_url or rand_api_path
+        if args.prefetch:
+            set_random_source(AsyncPrefetchSource(api_path, deadline=args.random_deadline))
+        else:
+            set_random_source(EntropyPool(api_path))
+    policy = None
+    if args.weight:
+        from LifePathLibs import WeightedChoices, weights_from_specs
+        if not args.full_auto:
+            sys.exit("--weight requires --full-auto")
+        try:
+            policy = WeightedChoices(weights_from_specs(args.weight))
+        except ValueError as e:
+            sys.exit(str(e))
+    if args.names:
+        from LifePathLibs import SyllableNames
+        if policy is None:
+            policy = UniformChoices() if args.full_auto else InteractiveChoices()
+        policy.names = SyllableNames()
+    if args.profile_character:
+        from LifePathLibs import profile_call
+        table_store = load_table_store()
+        char = profile_call(lambda: gen_character(args.true_random, args.full_auto, args.verbose, args.xp,
+                                                  table_store=table_store, policy=policy),
+                            args.profile_character, args.profile_dump)
+        save_or_print(char, args.out_dir)
+        return
+    constrained = None
+    if args.require:
+        from LifePathLibs import ConstraintError
+        try:
+            constrained = constrained_paths(load_table_store(), args.require)
+        except ConstraintError as e:
+            sys.exit(str(e))
+        print("The constraints are met by 1 in %.1f characters" % (1 / constrained.probability), file=sys.stderr)
+    xp_goals = ()
+    if args.optimize:
+        from LifePathLibs import objective_from_specs
+        try:
+            objective_from_specs(args.optimize)
+        except ValueError as e:
+            sys.exit(str(e))
+        xp_goals = tuple(args.optimize)
+    profile = GenerationProfile() if args.profile else None
+    roster_writers = []
+    if args.archive:
+        from LifePathLibs import ArchiveRosterWriter
+        roster_writers.append(ArchiveRosterWriter(args.archive))
+    if args.jsonl:
+        from LifePathLibs import JsonLinesRosterWriter
+        roster_writers.append(JsonLinesRosterWriter(args.jsonl))
+    if args.replay_log:
+        from LifePathLibs import ReplayLogWriter
+        roster_writers.append(ReplayLogWriter(args.replay_log))
+    if args.columnar:
+        from LifePathLibs import ColumnarRosterWriter
+        roster_writers.append(ColumnarRosterWriter(args.columnar))
+    if args.corpus and not args.query:
+        from LifePathLibs import CorpusRosterWriter
+        roster_writers.append(CorpusRosterWriter(args.corpus))
+    if args.query:
+        from LifePathLibs import CharacterCorpus, ConstraintError
+        corpus = CharacterCorpus.load(args.corpus)
+        query_start = time.perf_counter()
+        try:
+            ids = corpus.query(*args.query)
+        except ConstraintError as e:
+            sys.exit(str(e))
+        print("%d of %d characters match (%.1f ms)" % (len(ids), len(corpus),
+                                                       (time.perf_counter() - query_start) * 1e3), file=sys.stderr)
+        chars = (corpus.records[char_id] for char_id in ids)
+    elif args.replay:
+        chars = replay_batch(args.replay)
+    else:
+        chars = generate_batch(args.count, args.true_random, args.full_auto, args.verbose, args.xp,
+                               seed=args.seed, workers=args.workers, profile=profile, compact=args.workers > 1,
+                               constrained=constrained, xp_goals=xp_goals, policy=policy)
+    start = time.perf_counter()
+    generated = 0
+    try:
+        for char in chars:
+            for roster_writer in roster_writers:
+                roster_writer.add(char)
+            if not roster_writers:
+                save_or_print(char, args.out_dir)
+            generated += 1
+    finally:
+        for roster_writer in roster_writers:
+            roster_writer.close()
+    if args.prefetch:
+        from LifePathLibs import get_random_source
+        get_random_source().close()
+    if profile is not None:
+        print(profile.format_summary(), file=sys.stderr)
+    if generated > 1:
+        elapsed = time.perf_counter() - start
+        print("Generated %d characters in %.2fs (%.1f characters/sec)" %
+              (generated, elapsed, generated / elapsed if elapsed else 0.0), file=sys.stderr)
+
+
 if __name__ == '__main__':
     main()
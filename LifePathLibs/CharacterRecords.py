@@ -0,0 +1,145 @@
+import sys
+from array import array
+from LifePathLibs.SkillMaps import Skills, Attributes
+
+skill_names = tuple(s.value for s in Skills)
+skill_positions = {name: i for i, name in enumerate(skill_names)}
+attribute_positions = {a.value: i for i, a in enumerate(Attributes)}
+# Attributes are listed alphabetically, the same order as a CharacterMaker's attribute dict
+attribute_layout = tuple((name, attribute_positions[name]) for name in sorted(attribute_positions))
+
+
+def shared(value):
+    """Interns strings, including those inside tuples, so that equal text is stored once however many records hold
+    it."""
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, tuple):
+        return tuple(shared(v) for v in value)
+    return value
+
+
+# Tuples that few distinct values cover (aspects, languages) are also shared outright between records
+_common_tuples = {}
+
+
+def common_tuple(values) -> tuple:
+    values = shared(tuple(values))
+    return _common_tuples.setdefault(values, values)
+
+
+def small_array(values: list) -> array:
+    """Unsigned array of the values, one byte each unless XP has pushed one past 255."""
+    return array('B' if max(values, default=0) < 256 else 'H', values)
+
+
+def un_camel(text):
+    return text[0].lower() + text[1:] if text else ''
+
+
+def articelize(text):
+    if not text:
+        return ''
+    return "an %s" % text if text[0].lower() in ('a', 'e', 'i', 'o', 'u') else "a %s" % text
+
+
+def describe_character(char) -> str:
+    """The printed character summary, for a CharacterMaker or a CharacterRecord."""
+    char_str = "\nYou are %s from the land of %s.\n" % (articelize(un_camel(char.caste)), char.homeland) + \
+        "You are generally considered to be %s.\n" % (', and '.join(char.attribute_aspects)) +\
+        "Your past has been defined by %s. %s\nBut you also know that %s.\n" % \
+               (char.caste_story, char.caste_story_description, un_camel(char.nature_description)) +\
+        'You describe your education as having been %s. %s.\n' % (char.education, char.education_description) +\
+        "Your life has changed since you become %s. These days, %s.\n" % \
+               (articelize(char.archetype), un_camel(char.archetype_description)) +\
+        "Recently, you find your life increasingly defined by %s and your %s nature.\n" \
+               % (un_camel(char.trait), un_camel(char.nature)) +\
+        "But you will never forget your time at war, when you %s.\n" % char.war_story +\
+        "------------------------------------------\n" +\
+        "Your stats are as follows:\n" +\
+        "Homeland:\n\t%s\n" % char.homeland +\
+        "Languages Spoken:\n\t%s\n" % ','.join(char.languages) +\
+        "Social Standing:\n\t%d\n" % char.standing +\
+        "Attributes:\n\t%s\n" % '\n\t'.join(["%s - %s" % (k, v) for (k, v) in char.attributes.items()]) +\
+        "Talents:\n\t%s\n" % '\n\t'.join(["%s: %s" % (k, v) for k, v in char.talents.items()]) +\
+        "Skills:\n\t%s\n" % '\n\t'.join(['%s: %s' % (k, '%d EXP/%d FOC' % (v['exp'], v['foc']))
+                                         for (k, v) in char.skills.items()]) +\
+        "Equipment:\n\t%s\n" % '\n\t'.join(char.equipment) +\
+        "\n--------------------------------\n%s" % char.finishing_touches +\
+        "\nExperience Points: %d/%d" % (char.xp_spent, char.xp_spent+char.xp) +\
+        "\n------------Level Ups-------------\n%s" % '\n'.join(char.xp_spends)
+    return char_str
+
+
+class CharacterRecord:
+    """Compact, picklable copy of a finished character. Skills are exp/foc arrays indexed by the Skills enum, with the
+    order the character gained them kept alongside for rendering, and attributes are an array indexed by the
+    Attributes enum. Strings are interned, so the text taken from the tables is shared by every record. It renders the
+    same text, sheet and JSON record as the CharacterMaker it was built from."""
+    text_fields = ('name', 'gender', 'height', 'homeland', 'caste', 'caste_story', 'caste_story_description', 'trait',
+                   'archetype', 'archetype_description', 'career_skill', 'nature', 'nature_description', 'education',
+                   'education_description', 'war_story', 'finishing_touches')
+    number_fields = ('age', 'standing', 'vigor', 'resolve', 'gold', 'bonus_melee', 'bonus_ranged', 'bonus_presence',
+                     'xp', 'xp_spent', 'seed', 'full_auto', 'true_random')
+    tuple_fields = ('equipment', 'xp_spends')
+    common_tuple_fields = ('languages', 'attribute_aspects', 'constraints', 'xp_goals')
+    array_fields = ('attribute_values', 'skill_exp', 'skill_foc', 'choice_log')
+    __slots__ = text_fields + number_fields + tuple_fields + common_tuple_fields + array_fields + \
+        ('talent_names', 'talent_descriptions', 'skill_order')
+
+    @classmethod
+    def from_character(cls, char) -> 'CharacterRecord':
+        record = cls.__new__(cls)
+        for field in cls.text_fields:
+            setattr(record, field, shared(getattr(char, field)))
+        for field in cls.number_fields:
+            setattr(record, field, getattr(char, field))
+        for field in cls.tuple_fields:
+            setattr(record, field, shared(tuple(getattr(char, field))))
+        for field in cls.common_tuple_fields:
+            setattr(record, field, common_tuple(getattr(char, field)))
+        record.talent_names = shared(tuple(char.talents))
+        record.talent_descriptions = shared(tuple(char.talents.values()))
+        attribute_values = [0] * len(attribute_positions)
+        for name, value in char.attributes.items():
+            attribute_values[attribute_positions[name]] = value
+        skill_exp = [0] * len(skill_names)
+        skill_foc = [0] * len(skill_names)
+        order = []
+        for name, skill in char.skills.items():
+            position = skill_positions[name]
+            order.append(position)
+            skill_exp[position] = skill['exp']
+            skill_foc[position] = skill['foc']
+        record.attribute_values = small_array(attribute_values)
+        record.skill_exp = small_array(skill_exp)
+        record.skill_foc = small_array(skill_foc)
+        record.skill_order = bytes(order)
+        record.choice_log = small_array(char.choice_log)  # Kept so that the record can still be replayed
+        return record
+
+    def __getstate__(self):
+        return tuple(getattr(self, field) for field in self.__slots__)
+
+    def __setstate__(self, state):
+        for field, value in zip(self.__slots__, state):
+            if field in self.common_tuple_fields:
+                value = common_tuple(value)
+            elif field not in self.array_fields:
+                value = shared(value)
+            setattr(self, field, value)
+
+    @property
+    def attributes(self) -> dict:
+        return {name: self.attribute_values[position] for name, position in attribute_layout}
+
+    @property
+    def skills(self) -> dict:
+        return {skill_names[p]: {'exp': self.skill_exp[p], 'foc': self.skill_foc[p]} for p in self.skill_order}
+
+    @property
+    def talents(self) -> dict:
+        return dict(zip(self.talent_names, self.talent_descriptions))
+
+    def __str__(self):
+        return describe_character(self)
@@ -0,0 +1,200 @@
+import random
+from abc import ABC, abstractmethod
+from LifePathLibs.GenUtils import flat_name
+from LifePathLibs.Replay import ReplayError
+
+# The sorts of choice a character makes, as passed to CharacterMaker.select_from_choices
+choice_kinds = ('best_attribute', 'worst_attribute', 'optional_attribute', 'elective_skill', 'talent', 'gender')
+
+# Name syllables for the peoples of the homelands: (starts, middles, male endings, female endings)
+name_syllables = {
+    'hyborian': (('Al', 'Ar', 'Bal', 'Cas', 'Con', 'Dex', 'Ed', 'Gal', 'Hel', 'Mar', 'Ner', 'Pro', 'Tar', 'Ther', 'Val',
+                  'Vin'),
+                 ('', 'a', 'e', 'i', 'o', 'ar', 'el', 'in', 'or'),
+                 ('ius', 'us', 'ric', 'an', 'on', 'ald', 'ert', 'o'),
+                 ('ia', 'a', 'ine', 'ella', 'ara', 'isa', 'ena')),
+    'cimmerian': (('Bal', 'Bro', 'Cael', 'Con', 'Cor', 'Dun', 'Fer', 'Gor', 'Kal', 'Mor', 'Nia', 'Tur'),
+                  ('', '', 'a', 'o', 'ra', 'ga'),
+                  ('an', 'ach', 'ric', 'dun', 'gal', 'mac', 'th'),
+                  ('a', 'wyn', 'ith', 'ra', 'na')),
+    'nordheimer': (('Ag', 'As', 'Bjo', 'Gor', 'Ha', 'Har', 'Hor', 'Ing', 'Nial', 'Sig', 'Thor', 'Ulf', 'Vul', 'Wulf'),
+                   ('', '', 'a', 'e', 'ra', 'gi'),
+                   ('rik', 'mund', 'ulf', 'son', 'gar', 'ald', 'heim'),
+                   ('rid', 'hild', 'a', 'dis', 'run', 'frid')),
+    'zingaran': (('Bel', 'Car', 'Mar', 'Ros', 'Sar', 'Tiv', 'Val', 'Vel', 'Zal', 'Zan'),
+                 ('a', 'e', 'i', 'o', 'er', 'an'),
+                 ('enso', 'o', 'ez', 'ardo', 'ino', 'ano'),
+                 ('a', 'ina', 'ela', 'ira', 'ita')),
+    'zamorian': (('Ilz', 'Mal', 'Ner', 'Pel', 'Shev', 'Tau', 'Vas', 'Yar', 'Zam', 'Zel'),
+                 ('a', 'e', 'u', 'iv', 'or'),
+                 ('us', 'ek', 'on', 'al', 'ar'),
+                 ('a', 'ia', 'ela', 'ira', 'esa')),
+    'shemite': (('Ab', 'Akh', 'Ash', 'Bel', 'Ezr', 'Ish', 'Mel', 'Nah', 'Ram', 'Shu', 'Tar'),
+                ('a', 'i', 'u', 'ab', 'ar'),
+                ('al', 'ath', 'ur', 'ek', 'on', 'im'),
+                ('ah', 'ith', 'a', 'ira', 'at')),
+    'stygian': (('Ankh', 'Khe', 'Mer', 'Nef', 'Ptah', 'Ram', 'Sen', 'Set', 'Teb', 'Thot', 'Thu'),
+                ('a', 'e', 'ho', 'ne', 'mo'),
+                ('mon', 'hotep', 'ses', 'kal', 'amun', 'ek'),
+                ('et', 'ara', 'is', 'ephra', 'nut')),
+    'kushite': (('Aja', 'Bom', 'Ka', 'Kwa', 'Mbe', 'Nde', 'Olu', 'Sho', 'Tem', 'Zu'),
+                ('a', 'e', 'i', 'o', 'la', 'mu'),
+                ('ngo', 'ku', 'de', 'bo', 'mba', 'we'),
+                ('ra', 'la', 'ma', 'ni', 'ya')),
+    'turanian': (('Ard', 'Bak', 'Far', 'Jun', 'Kem', 'Kha', 'Mir', 'Ozb', 'Shah', 'Tar', 'Yil'),
+                 ('a', 'i', 'u', 'al', 'ar'),
+                 ('dar', 'an', 'gir', 'mir', 'ek', 'khan'),
+                 ('a', 'ina', 'ara', 'ek', 'ya')),
+    'vendhyan': (('Cha', 'Dev', 'Gov', 'Ind', 'Kun', 'Mal', 'Raj', 'Sur', 'Vis', 'Yas'),
+                 ('a', 'i', 'ra', 'na', 'u'),
+                 ('ndra', 't', 'esh', 'ul', 'dev', 'an'),
+                 ('mina', 'ra', 'ti', 'ni', 'ya')),
+    'khitan': (('Chen', 'Fu', 'Hsu', 'Ka', 'Lin', 'Lo', 'Mei', 'Ming', 'Shan', 'Tsu', 'Wei', 'Yah'),
+               ('',),
+               ('g', 'n', 'kuo', 'tai', 'lung', 'ho'),
+               ('a', 'lin', 'mei', 'yu', 'hua')),
+}
+homeland_peoples = {
+    'hyborian': ('Aquilonia', 'Bossonian Marches', 'Gunderland', 'Nemedia', 'Brythunia', 'Corinthia', 'Border Kingdom',
+                 'Ophir', 'Koth', 'Khoraja'),
+    'cimmerian': ('Cimmeria',),
+    'nordheimer': ('Nordheim: Asgard or Vanaheim', 'Hyperborea'),
+    'zingaran': ('Zingara', 'Argos'),
+    'zamorian': ('Zamora',),
+    'shemite': ('Shem', 'Khauran'),
+    'stygian': ('Stygia',),
+    'kushite': ('Kush', 'Keshan', 'Punt', 'Darfar', 'Zembabwei', 'The Black Kingdoms'),
+    'turanian': ('Turan', 'Hyrkania', 'Iranistan or Afghulistan'),
+    'vendhyan': ('Vendhya',),
+    'khitan': ('Khitai',),
+}
+homeland_syllables = {flat_name(homeland): name_syllables[people] for people, homelands in homeland_peoples.items()
+                      for homeland in homelands}
+
+
+class ChoicePolicy(ABC):
+    """How a character's choices are made and how it is named. choose returns the index of the choice taken; kind is
+    one of choice_kinds. name returns the character's name, or '' to print the character rather than save it, and is
+    only asked for when no name was given up front. Policies with names name characters with it (e.g. a
+    SyllableNames), and otherwise leave them unnamed.
+
+    Policies that draw at random without redrawing their choices from the character's seed on replay use
+    char.policy_random(), a stream of their own derived from the seed, so that they never shift the rolls and the
+    recorded choices can be fed back in their place."""
+    interactive = False  # Prompts and step messages are printed
+    redraws = False  # Choices are redrawn from the character's seed on replay, rather than fed back
+
+    def __init__(self, names=None):
+        self.names = names
+
+    @abstractmethod
+    def choose(self, char, prompt: str, choices: list, kind: str=None) -> int:
+        pass
+
+    def name(self, char) -> str:
+        return self.names(char) if self.names is not None else ''
+
+
+class UniformChoices(ChoicePolicy):
+    """Every choice equally likely, drawn from the same generator as the rolls. This is the full-auto default."""
+    redraws = True
+
+    def choose(self, char, prompt: str, choices: list, kind: str=None) -> int:
+        return random.randint(0, len(choices) - 1)
+
+
+class WeightedChoices(ChoicePolicy):
+    """Choices drawn in proportion to weights, given as {kind: {choice: weight}}. Choices are matched
+    case-insensitively on letters only, and any without a weight weigh 1."""
+    def __init__(self, weights: dict, names=None):
+        super(WeightedChoices, self).__init__(names)
+        self.weights = {kind: {flat_name(choice): weight for choice, weight in choice_weights.items()}
+                        for kind, choice_weights in weights.items()}
+
+    def choose(self, char, prompt: str, choices: list, kind: str=None) -> int:
+        kind_weights = self.weights.get(kind)
+        if not kind_weights:
+            return char.policy_random().randrange(len(choices))
+        weights = [kind_weights.get(flat_name(choice), 1) for choice in choices]
+        if not sum(weights) > 0:
+            raise ValueError("No choice of %s has any weight: %s" % (kind, ', '.join(choices)))
+        return char.policy_random().choices(range(len(choices)), weights)[0]
+
+
+class ScriptedChoices(ChoicePolicy):
+    """Choices taken in turn from a list, each an index or the text of the choice. Replays of interactive characters
+    feed their recorded choices back this way."""
+    def __init__(self, script, names=None):
+        super(ScriptedChoices, self).__init__(names)
+        self.script = iter(script)
+
+    def choose(self, char, prompt: str, choices: list, kind: str=None) -> int:
+        choice = next(self.script, None)
+        if isinstance(choice, str):
+            flat_choices = [flat_name(c) for c in choices]
+            choice = flat_choices.index(flat_name(choice)) if flat_name(choice) in flat_choices else None
+        if choice is None or not 0 <= choice < len(choices):
+            raise ReplayError("Scripted choice %d does not match the choices offered: %s" %
+                              (len(char.choice_log), ', '.join(choices)))
+        return choice
+
+
+class InteractiveChoices(ChoicePolicy):
+    """Prompts for every choice and for the name on the terminal."""
+    interactive = True
+
+    def choose(self, char, prompt: str, choices: list, kind: str=None) -> int:
+        nums = [str(n + 1) for n in range(len(choices))]
+        vals = {n: choice for n, choice in zip(nums, choices)}
+        select_vals = sorted(['[%s]: %s' % (n, choice) for n, choice in vals.items()])
+        input_prompt = '%s\n%s\nYour choice: ' % (prompt, '\n'.join(select_vals))
+        selected = input(input_prompt)
+        while selected not in choices + nums:
+            print('Selected value: "%s" not valid, choose a value from the following:\n%s.' %
+                  (selected, ', '.join(choices)))
+            selected = input(input_prompt)
+        selected = selected if selected in choices else vals[selected]
+        return choices.index(selected)
+
+    def name(self, char) -> str:
+        if self.names is not None:
+            return self.names(char)
+        pronoun = "him" if char.gender == "Male" else "her"
+        return input("Enter a name for your character to save %s, or leave blank and character will be printed in "
+                     "the terminal but not saved:" % pronoun)
+
+
+class SyllableNames:
+    """Names a character from the syllables of its homeland's people: a start, a middle and an ending for its gender.
+    Homelands without syllables of their own use those of the Hyborian kingdoms."""
+    def __init__(self, syllables: dict=None, default: str='hyborian'):
+        self.syllables = homeland_syllables if syllables is None else \
+            {flat_name(homeland): parts for homeland, parts in syllables.items()}
+        self.default = name_syllables[default] if syllables is None else None
+
+    def __call__(self, char) -> str:
+        parts = self.syllables.get(flat_name(char.homeland), self.default)
+        if parts is None:
+            raise ValueError("No name syllables for %s" % char.homeland)
+        starts, middles, male_endings, female_endings = parts
+        rng = char.policy_random()
+        return rng.choice(starts) + rng.choice(middles) + \
+            rng.choice(female_endings if char.gender == 'Female' else male_endings)
+
+
+def weights_from_specs(specs) -> dict:
+    """{kind: {choice: weight}} from specs like 'gender:Female=2' or 'talent:Agile=0.5'."""
+    weights = {}
+    for spec in specs:
+        kind, separator, rest = spec.partition(':')
+        choice, equals, weight = rest.rpartition('=')
+        if not separator or not equals or kind not in choice_kinds:
+            raise ValueError("Cannot parse the weight %r: expected KIND:CHOICE=WEIGHT, where KIND is one of %s" %
+                             (spec, ', '.join(choice_kinds)))
+        try:
+            weights.setdefault(kind, {})[choice] = float(weight)
+        except ValueError:
+            raise ValueError("%r: the weight must be a number" % spec)
+        if weights[kind][choice] < 0:
+            raise ValueError("%r: weights cannot be negative" % spec)
+    return weights
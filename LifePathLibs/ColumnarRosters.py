@@ -0,0 +1,302 @@
+import json
+import mmap
+import os
+import sys
+from array import array
+from LifePathLibs.CharacterRecords import CharacterRecord, common_tuple, shared, small_array, skill_names, \
+    attribute_positions
+from LifePathLibs.RosterExport import RosterWriter
+
+# A columnar roster is a directory holding roster.json (the character count, the dictionaries and the length of each
+# list column) and one file per column, each a flat native-endian array that can be mapped and scanned in place:
+#   value      width fixed-size values per character (attributes and skills are indexed by the SkillMaps enums)
+#   code       one code per character into the column's dictionary (the life path steps and other table text)
+#   list       an offsets file (count + 1 positions) and a values file, e.g. the UTF-8 bytes of each name
+#   code_list  like list, with the values being codes into the column's dictionary (talents, equipment)
+# Appends write the new rows to the end of every file before roster.json is replaced, so readers never see a
+# character whose columns are incomplete.
+roster_version = 3
+meta_file = 'roster.json'
+flag_full_auto = 1
+flag_true_random = 2
+flag_seeded = 4
+
+text_columns = tuple(field for field in CharacterRecord.text_fields if field != 'name')
+number_columns = ('age', 'standing', 'vigor', 'resolve', 'gold', 'bonus_melee', 'bonus_ranged', 'bonus_presence',
+                  'xp', 'xp_spent')
+# Column name -> (kind, typecode, width)
+columns = {field: ('code', 'H', 1) for field in text_columns}
+columns.update({field: ('value', 'i', 1) for field in number_columns})
+columns.update({
+    'seed': ('value', 'Q', 1),
+    'flags': ('value', 'B', 1),
+    # Two bytes, since XP can raise attributes and skills past 255
+    'attributes': ('value', 'H', len(attribute_positions)),
+    'skill_exp': ('value', 'H', len(skill_names)),
+    'skill_foc': ('value', 'H', len(skill_names)),
+    'name': ('list', 'B', None),
+    'skill_order': ('list', 'B', None),
+    'choice_log': ('list', 'H', None),
+    'talents': ('code_list', 'H', None),
+    'equipment': ('code_list', 'H', None),
+    'xp_spends': ('code_list', 'I', None),
+    'languages': ('code_list', 'H', None),
+    'attribute_aspects': ('code_list', 'H', None),
+    'constraints': ('code_list', 'H', None),
+    'xp_goals': ('code_list', 'H', None),
+})
+dictionary_columns = tuple(name for name, (kind, typecode, width) in columns.items() if 'code' in kind)
+
+
+def column_files(name: str) -> dict:
+    kind = columns[name][0]
+    if kind in ('list', 'code_list'):
+        return {'offsets': '%s.offsets' % name, 'values': '%s.values' % name}
+    return {'values': '%s.values' % name}
+
+
+class ColumnarRosterWriter(RosterWriter):
+    """Appends characters (CharacterMakers or CharacterRecords) to a columnar roster, creating it if it does not
+    exist. Rows are buffered per column and appended to the files every chunk_size characters and on close."""
+    def __init__(self, path: str, chunk_size: int=4096):
+        self.path = path
+        self.chunk_size = chunk_size
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, meta_file)
+        if os.path.exists(meta_path):
+            self.meta = read_meta(path)
+        else:
+            self.meta = {'version': roster_version, 'byteorder': sys.byteorder, 'count': 0,
+                         'list_lengths': {name: 0 for name, spec in columns.items() if spec[2] is None},
+                         'dictionaries': {name: [] for name in dictionary_columns}}
+        self.codes = {name: {shared_key(entry): code for code, entry in enumerate(self.meta['dictionaries'][name])}
+                      for name in dictionary_columns}
+        self.list_lengths = dict(self.meta['list_lengths'])
+        self.buffered = 0
+        self.buffers = {}
+        self.new_buffers()
+        # Files written past the committed count by an interrupted append are cut back before appending
+        for name, spec in columns.items():
+            for part, file_name in column_files(name).items():
+                typecode = 'Q' if part == 'offsets' else spec[1]
+                if part == 'offsets':
+                    rows = self.meta['count'] + 1
+                elif spec[2] is None:
+                    rows = self.meta['list_lengths'][name]
+                else:
+                    rows = self.meta['count'] * spec[2]
+                file_path = os.path.join(path, file_name)
+                with open(file_path, 'ab') as column_out:
+                    column_out.truncate(rows * array(typecode).itemsize)
+                if part == 'offsets' and self.meta['count'] == 0:
+                    with open(file_path, 'wb') as column_out:
+                        column_out.write(array('Q', [0]).tobytes())
+
+    def new_buffers(self):
+        self.buffers = {name: (array('Q'), array(spec[1])) if spec[2] is None else array(spec[1])
+                        for name, spec in columns.items()}
+
+    def code(self, name: str, entry) -> int:
+        codes = self.codes[name]
+        key = shared_key(entry)
+        if key not in codes:
+            codes[key] = len(codes)
+            self.meta['dictionaries'][name].append(entry)
+        return codes[key]
+
+    def add(self, char):
+        record = char if isinstance(char, CharacterRecord) else CharacterRecord.from_character(char)
+        buffers = self.buffers
+        for field in text_columns:
+            buffers[field].append(self.code(field, getattr(record, field)))
+        for field in number_columns:
+            buffers[field].append(getattr(record, field))
+        buffers['seed'].append(record.seed or 0)
+        buffers['flags'].append((flag_full_auto if record.full_auto else 0) |
+                                (flag_true_random if record.true_random else 0) |
+                                (flag_seeded if record.seed is not None else 0))
+        for field, values in (('attributes', record.attribute_values), ('skill_exp', record.skill_exp),
+                              ('skill_foc', record.skill_foc)):
+            extend_column(buffers[field], values)
+        lists = {'name': record.name.encode('utf-8'), 'skill_order': record.skill_order,
+                 'choice_log': record.choice_log,
+                 'talents': [self.code('talents', [name, description]) for name, description in
+                             zip(record.talent_names, record.talent_descriptions)]}
+        for field in ('equipment', 'xp_spends', 'languages', 'attribute_aspects', 'constraints', 'xp_goals'):
+            lists[field] = [self.code(field, entry) for entry in getattr(record, field)]
+        for field, values in lists.items():
+            offsets, column_values = buffers[field]
+            extend_column(column_values, values)
+            self.list_lengths[field] += len(values)
+            offsets.append(self.list_lengths[field])
+        self.buffered += 1
+        if self.buffered >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffered:
+            return
+        for name, buffer in self.buffers.items():
+            files = column_files(name)
+            if isinstance(buffer, tuple):
+                append_file(os.path.join(self.path, files['offsets']), buffer[0])
+                buffer = buffer[1]
+            append_file(os.path.join(self.path, files['values']), buffer)
+        self.meta['count'] += self.buffered
+        self.meta['list_lengths'] = dict(self.list_lengths)
+        write_meta(self.path, self.meta)
+        self.buffered = 0
+        self.new_buffers()
+
+    def close(self):
+        self.flush()
+
+
+def extend_column(column: array, values):
+    # Record arrays are as narrow as their values allow, so may not share the column's typecode
+    column.extend(values if not isinstance(values, array) or values.typecode == column.typecode else values.tolist())
+
+
+def shared_key(entry):
+    return tuple(entry) if isinstance(entry, list) else entry
+
+
+def append_file(file_path: str, values: array):
+    with open(file_path, 'ab') as column_out:
+        values.tofile(column_out)
+
+
+def read_meta(path: str) -> dict:
+    with open(os.path.join(path, meta_file), encoding='utf-8') as meta_in:
+        meta = json.load(meta_in)
+    if meta.get('version') != roster_version:
+        raise ValueError("%s is not a columnar roster of a supported version" % path)
+    if meta['byteorder'] != sys.byteorder:
+        raise ValueError("%s was written on a machine of the other byte order" % path)
+    return meta
+
+
+def write_meta(path: str, meta: dict):
+    meta_path = os.path.join(path, meta_file)
+    tmp_path = '%s.%d.tmp' % (meta_path, os.getpid())
+    with open(tmp_path, 'w', encoding='utf-8') as meta_out:
+        json.dump(meta, meta_out, ensure_ascii=False)
+    os.replace(tmp_path, meta_path)
+
+
+class ColumnarRoster:
+    """Read-only view of a columnar roster. Every column file is memory-mapped and exposed as a memoryview of its
+    typed values, without copying; column() gives a whole column for scanning, and roster[i] rebuilds character i as
+    a CharacterRecord, which prints and exports like any other. Characters appended after it was opened are not
+    seen; open it again (or call reopen) to pick them up. Views and arrays taken from its columns must be dropped
+    before it is closed, since they point into the mapped files."""
+    def __init__(self, path: str):
+        self.path = path
+        self.maps = []
+        self.views = {}
+        self.reopen()
+
+    def reopen(self):
+        self.close()
+        self.meta = read_meta(self.path)
+        self.count = self.meta['count']
+        self.dictionaries = {name: [shared(shared_key(entry)) for entry in entries]
+                             for name, entries in self.meta['dictionaries'].items()}
+        for name, (kind, typecode, width) in columns.items():
+            files = column_files(name)
+            if width is None:
+                offsets = self.map_file(files['offsets'], 'Q', self.count + 1)
+                self.views[name] = (offsets, self.map_file(files['values'], typecode, offsets[self.count]))
+            else:
+                self.views[name] = self.map_file(files['values'], typecode, self.count * width)
+
+    def map_file(self, file_name: str, typecode: str, length: int) -> memoryview:
+        size = length * array(typecode).itemsize
+        if not size:
+            return memoryview(array(typecode))
+        with open(os.path.join(self.path, file_name), 'rb') as column_in:
+            mapped = mmap.mmap(column_in.fileno(), 0, access=mmap.ACCESS_READ)
+        self.maps.append(mapped)
+        return memoryview(mapped)[:size].cast(typecode)
+
+    def close(self):
+        # Views have to be released before their maps can be closed
+        for view in self.views.values():
+            for part in view if isinstance(view, tuple) else (view,):
+                part.release()
+        self.views = {}
+        for mapped in self.maps:
+            mapped.close()
+        self.maps = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def column(self, name: str) -> memoryview:
+        """The typed values of a fixed-width or code column: width values per character, in character order."""
+        view = self.views[name]
+        if isinstance(view, tuple):
+            raise ValueError("%s is a list column; use values(%r, i)" % (name, name))
+        return view
+
+    def numpy_column(self, name: str):
+        """A column as a NumPy array sharing the mapped memory, shaped (characters, width) for multi-value columns.
+        Requires NumPy."""
+        import numpy as np
+        width = columns[name][2]
+        values = np.frombuffer(self.column(name), dtype=np.dtype(columns[name][1]))
+        return values.reshape(self.count, width) if width > 1 else values
+
+    def values(self, name: str, i: int) -> memoryview:
+        """The values of list column name for character i."""
+        offsets, values = self.views[name]
+        return values[offsets[i]:offsets[i + 1]]
+
+    def decoded(self, name: str, i: int):
+        """Column name of character i with any dictionary codes replaced by their entries."""
+        kind, typecode, width = columns[name]
+        if kind == 'code':
+            return self.dictionaries[name][self.views[name][i]]
+        if kind == 'code_list':
+            dictionary = self.dictionaries[name]
+            return tuple(dictionary[code] for code in self.values(name, i))
+        if kind == 'list':
+            return self.values(name, i)
+        return self.views[name][i * width:(i + 1) * width] if width > 1 else self.views[name][i]
+
+    def __getitem__(self, i: int) -> CharacterRecord:
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError("character %d is not in a roster of %d" % (i, self.count))
+        record = CharacterRecord.__new__(CharacterRecord)
+        for field in text_columns + number_columns:
+            setattr(record, field, self.decoded(field, i))
+        record.name = str(self.values('name', i), 'utf-8')
+        flags = self.views['flags'][i]
+        record.seed = self.views['seed'][i] if flags & flag_seeded else None
+        record.full_auto = bool(flags & flag_full_auto)
+        record.true_random = bool(flags & flag_true_random)
+        for field in ('equipment', 'xp_spends'):
+            setattr(record, field, self.decoded(field, i))
+        for field in ('languages', 'attribute_aspects', 'constraints', 'xp_goals'):
+            setattr(record, field, common_tuple(self.decoded(field, i)))
+        talents = self.decoded('talents', i)
+        record.talent_names = tuple(name for name, description in talents)
+        record.talent_descriptions = tuple(description for name, description in talents)
+        record.attribute_values = small_array(self.decoded('attributes', i).tolist())
+        record.skill_exp = small_array(self.decoded('skill_exp', i).tolist())
+        record.skill_foc = small_array(self.decoded('skill_foc', i).tolist())
+        record.skill_order = bytes(self.values('skill_order', i))
+        record.choice_log = small_array(self.values('choice_log', i).tolist())
+        return record
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self[i]
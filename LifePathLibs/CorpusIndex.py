@@ -0,0 +1,238 @@
+import os.path
+import pickle
+from collections import defaultdict
+from LifePathLibs.CharacterRecords import CharacterRecord, skill_positions, attribute_layout
+from LifePathLibs.GenUtils import flat_name
+from LifePathLibs.PathConstraints import ConstraintError, spec_pattern, skill_suffix
+from LifePathLibs.RosterExport import RosterWriter
+
+# Postings are bitmaps of character ids held as Python ints, split into blocks of block_bits ids each, so that adding
+# characters only touches the last blocks and compound queries are a handful of big-integer ANDs per block.
+block_shift = 16
+block_bits = 1 << block_shift
+corpus_version = 2
+
+category_fields = ('homeland', 'caste', 'caste_story', 'archetype', 'nature', 'education', 'career_skill', 'gender')
+number_fields = ('standing', 'vigor', 'resolve', 'gold')
+attribute_fields = {flat_name(name): position for name, position in attribute_layout}
+skill_fields = {flat_name(name): position for name, position in skill_positions.items()}
+field_keys = {flat_name(field): field for field in category_fields + number_fields}
+field_keys.update({'talent': 'talent', 'talents': 'talent', 'story': 'caste_story', 'socialstanding': 'standing'})
+
+
+def bitmap_from_ids(ids: list) -> dict:
+    """Block bitmap of an ascending list of ids."""
+    bitmap = {}
+    start = 0
+    while start < len(ids):
+        block = ids[start] >> block_shift
+        bits = bytearray(block_bits >> 3)
+        end = start
+        while end < len(ids) and ids[end] >> block_shift == block:
+            offset = ids[end] & (block_bits - 1)
+            bits[offset >> 3] |= 1 << (offset & 7)
+            end += 1
+        bitmap[block] = int.from_bytes(bits, 'little')
+        start = end
+    return bitmap
+
+
+def union(bitmaps: list) -> dict:
+    merged = {}
+    for bitmap in bitmaps:
+        for block, bits in bitmap.items():
+            merged[block] = merged.get(block, 0) | bits
+    return merged
+
+
+def intersection(bitmaps: list) -> dict:
+    # Smallest first, so that an empty result is found as soon as possible
+    bitmaps = sorted(bitmaps, key=len)
+    merged = dict(bitmaps[0]) if bitmaps else {}
+    for bitmap in bitmaps[1:]:
+        merged = {block: bits & bitmap[block] for block, bits in merged.items() if block in bitmap}
+        merged = {block: bits for block, bits in merged.items() if bits}
+        if not merged:
+            break
+    return merged
+
+
+def difference(bitmap: dict, removed: dict) -> dict:
+    kept = {block: bits & ~removed.get(block, 0) for block, bits in bitmap.items()}
+    return {block: bits for block, bits in kept.items() if bits}
+
+
+def bitmap_count(bitmap: dict) -> int:
+    return sum(bits.bit_count() for bits in bitmap.values())
+
+
+def bitmap_ids(bitmap: dict, limit: int=None) -> list:
+    """The ids in a bitmap in ascending order, up to limit of them. Set bits are found with str.find over each
+    block's binary digits, which is far faster than peeling them off one at a time."""
+    ids = []
+    for block in sorted(bitmap):
+        digits = bin(bitmap[block])[:1:-1]
+        base = block << block_shift
+        position = digits.find('1')
+        while position != -1:
+            if limit is not None and len(ids) >= limit:
+                return ids
+            ids.append(base + position)
+            position = digits.find('1', position + 1)
+    return ids
+
+
+class CharacterCorpus:
+    """Generated characters, kept as CharacterRecords, with secondary indexes for compound queries. Every life path
+    step, the career skill, gender and each talent has a postings bitmap per entry; every attribute, skill expertise
+    and focus, standing and derived stat has one per value, so thresholds are the union of the values they cover.
+
+    Characters can be added at any time (add, or add_batch as each batch finishes); postings for new characters are
+    merged into the indexes in bulk before the next query. Queries take specs like those for constrained generation:
+    'homeland=Cimmeria|Nordheim', 'talent=Blood on Steel', 'archetype!=Pirate', 'Melee>=2' (expertise),
+    'Melee.foc>=1', 'Brawn>=10', 'standing<=2' or a bare skill name for any expertise in it. Values are matched
+    case-insensitively on letters only."""
+    def __init__(self):
+        self.records = []
+        self.postings = defaultdict(dict)  # Field -> value -> block bitmap
+        self.pending = defaultdict(lambda: defaultdict(list))  # Field -> value -> ids not yet in the postings
+        self.flushed = 0
+
+    def __len__(self):
+        return len(self.records)
+
+    def add(self, char) -> int:
+        """Adds a CharacterMaker or CharacterRecord and returns its id."""
+        record = char if isinstance(char, CharacterRecord) else CharacterRecord.from_character(char)
+        char_id = len(self.records)
+        self.records.append(record)
+        pending = self.pending
+        for field in category_fields:
+            pending[field][flat_name(getattr(record, field))].append(char_id)
+        for talent in record.talent_names:
+            pending['talent'][flat_name(talent)].append(char_id)
+        for field in number_fields:
+            pending[field][getattr(record, field)].append(char_id)
+        for name, position in attribute_layout:
+            pending[('attribute', position)][record.attribute_values[position]].append(char_id)
+        # Skills the character does not have are left out, and found by difference
+        for position in record.skill_order:
+            pending[('exp', position)][record.skill_exp[position]].append(char_id)
+            pending[('foc', position)][record.skill_foc[position]].append(char_id)
+        return char_id
+
+    def add_batch(self, chars) -> range:
+        """Adds every character of an iterable and merges them into the indexes. Returns their ids."""
+        start = len(self.records)
+        for char in chars:
+            self.add(char)
+        self.flush()
+        return range(start, len(self.records))
+
+    def flush(self):
+        """Merges the postings of characters added since the last flush into the indexes."""
+        for field, values in self.pending.items():
+            postings = self.postings[field]
+            for value, ids in values.items():
+                added = bitmap_from_ids(ids)
+                bitmap = postings.setdefault(value, {})
+                for block, bits in added.items():
+                    bitmap[block] = bitmap.get(block, 0) | bits
+        self.pending.clear()
+        self.flushed = len(self.records)
+
+    def everyone(self) -> dict:
+        full, rest = divmod(len(self.records), block_bits)
+        bitmap = {block: (1 << block_bits) - 1 for block in range(full)}
+        if rest:
+            bitmap[full] = (1 << rest) - 1
+        return bitmap
+
+    def match(self, spec: str) -> dict:
+        """Bitmap of the characters that meet one spec."""
+        match = spec_pattern.match(spec)
+        if not match:
+            raise ConstraintError("Cannot parse the query %r" % spec)
+        name, op, value = match.groups()
+        field = field_keys.get(flat_name(name))
+        if field in category_fields or field == 'talent':
+            if op not in ('=', '!='):
+                raise ConstraintError("%r: %s takes = or != and one or more values separated by |" % (spec, field))
+            postings = self.postings[field]
+            matched = union([postings.get(flat_name(v), {}) for v in value.split('|')])
+            return matched if op == '=' else difference(self.everyone(), matched)
+        suffix = skill_suffix.search(name)
+        skill_name = flat_name(skill_suffix.sub('', name))
+        if field is None and flat_name(name) in attribute_fields:
+            field = ('attribute', attribute_fields[flat_name(name)])
+        elif field is None and skill_name in skill_fields:
+            field = ('foc' if suffix and suffix.group(1).lower().startswith('foc') else 'exp', skill_fields[skill_name])
+        elif field is None:
+            raise ConstraintError("%r does not name an indexed field. Fields: %s, talent, attributes and skills" %
+                                  (spec, ', '.join(category_fields + number_fields)))
+        if op is None:
+            if field[0] not in ('exp', 'foc'):
+                raise ConstraintError("%r needs a bound, e.g. %s>=10" % (spec, name))
+            op, value = '>=', '1'
+        try:
+            bound = int(value)
+        except ValueError:
+            raise ConstraintError("%r: the bound must be a whole number" % spec)
+        inside = {'>=': lambda v: v >= bound, '>': lambda v: v > bound, '<=': lambda v: v <= bound,
+                  '<': lambda v: v < bound, '=': lambda v: v == bound, '!=': lambda v: v != bound}[op]
+        postings = self.postings[field]
+        if field[0] in ('exp', 'foc') and inside(0):
+            # Skills a character lacks have no postings, so a bound that takes in 0 is everyone outside it
+            return difference(self.everyone(), union([bitmap for v, bitmap in postings.items() if not inside(v)]))
+        return union([bitmap for v, bitmap in postings.items() if inside(v)])
+
+    def select(self, *specs) -> dict:
+        """Bitmap of the characters that meet every spec."""
+        if len(self.records) > self.flushed:
+            self.flush()
+        return intersection([self.match(spec) for spec in specs]) if specs else self.everyone()
+
+    def count(self, *specs) -> int:
+        return bitmap_count(self.select(*specs))
+
+    def query(self, *specs, limit: int=None) -> list:
+        """The ids of the characters that meet every spec, in the order they were added."""
+        return bitmap_ids(self.select(*specs), limit)
+
+    def characters(self, *specs, limit: int=None) -> list:
+        """The CharacterRecords that meet every spec."""
+        return [self.records[char_id] for char_id in self.query(*specs, limit=limit)]
+
+    def save(self, path: str):
+        self.flush()
+        with open(path, 'wb') as corpus_out:
+            pickle.dump((corpus_version, self.records, dict(self.postings)), corpus_out, pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path: str) -> 'CharacterCorpus':
+        with open(path, 'rb') as corpus_in:
+            version, records, postings = pickle.load(corpus_in)
+        if version != corpus_version:
+            raise ValueError("%s is a corpus of an unsupported version" % path)
+        corpus = cls()
+        corpus.records = records
+        corpus.postings.update(postings)
+        corpus.flushed = len(records)
+        return corpus
+
+
+class CorpusRosterWriter(RosterWriter):
+    """Adds each character to a corpus file, creating it if it does not exist yet. Characters are merged into the
+    indexes in batches of batch_size, and the corpus is saved on close."""
+    def __init__(self, path: str, batch_size: int=4096):
+        self.path = path
+        self.corpus = CharacterCorpus.load(path) if os.path.exists(path) else CharacterCorpus()
+        self.batch_size = batch_size
+
+    def add(self, char):
+        self.corpus.add(char)
+        if len(self.corpus) - self.corpus.flushed >= self.batch_size:
+            self.corpus.flush()
+
+    def close(self):
+        self.corpus.save(self.path)
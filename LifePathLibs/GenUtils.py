@@ -1,11 +1,16 @@
 import re
 import pickle
+import random
+from bisect import bisect_left
+from heapq import heappush, heappop
 import os.path
-from collections import defaultdict, Mapping
+from collections import defaultdict
+from collections.abc import Mapping
+from functools import lru_cache
 
 
 class LifePathTables:
-    def __init__(self):
+    def __init__(self, talent_loader=None):
         # 13d20 in total including finishing touches
         # Step 1: Homeland
         self.homelands = MinValDict()  # 2d20
@@ -36,7 +41,58 @@ class LifePathTables:
         self.weapons = MinValDict()  # 1d20
         self.provenance = MinValDict()  # 1d20
 
-        self.talents = import_talents()
+        # The talent tree is only loaded the first time a talent choice or XP spend needs it
+        self._talent_loader = talent_loader or import_talents
+        self._talents = None
+
+    _talent_index = None
+
+    @classmethod
+    def from_tables(cls, tables: dict, talent_loader=None, table_loaders: dict=None):
+        """Builds a table store from tables that are already normalized, e.g. from a compiled artifact. Tables given
+        by name in table_loaders are only loaded the first time they are looked up."""
+        table_store = cls.__new__(cls)
+        vars(table_store).update(tables)
+        table_store._table_loaders = dict(table_loaders or {})
+        table_store._talent_loader = talent_loader or import_talents
+        table_store._talents = None
+        return table_store
+
+    def __getattr__(self, name):
+        # Only reached for attributes that are not set yet, i.e. deferred tables that have not been loaded
+        table_loaders = self.__dict__.get('_table_loaders')
+        if not table_loaders or name not in table_loaders:
+            raise AttributeError("'%s' object has no attribute '%s'" % (type(self).__name__, name))
+        table = table_loaders.pop(name)()
+        setattr(self, name, table)
+        return table
+
+    def table_dict(self) -> dict:
+        """The life path tables themselves, without the talent tree or anything derived from it."""
+        for name in list(self.__dict__.get('_table_loaders') or ()):
+            getattr(self, name)
+        return {k: v for k, v in vars(self).items() if not k.startswith('_')}
+
+    @property
+    def talents(self) -> 'FlatNameDict':
+        if self._talents is None:
+            self._talents = self._talent_loader()
+        return self._talents
+
+    @talents.setter
+    def talents(self, talents: 'FlatNameDict'):
+        self._talents = talents
+        self._talent_index = None
+
+    @property
+    def talents_loaded(self):
+        return self._talents is not None
+
+    @property
+    def talent_index(self):
+        if self._talent_index is None:
+            self._talent_index = TalentIndex(self.talents)
+        return self._talent_index
 
     def read_raw_table_dict(self, table_dict):
         for att_name, value in table_dict.items():
@@ -55,27 +111,50 @@ class LifePathTables:
                         getattr(self, att_name)[k] = new_val
 
 
+clean_name = re.compile('[^a-z]')
+_missing = object()
+
+
+@lru_cache(maxsize=4096)
+def flat_name(name: str) -> str:
+    """Normalizes a name to the canonical FlatNameDict key: lowercase letters only."""
+    return clean_name.sub('', name.lower())
+
+
+def flat_names(src: dict) -> dict:
+    """Plain dict copy of src keyed by canonical names, for repeated lookups with keys that are already canonical."""
+    return {flat_name(k): v.strip() if isinstance(v, str) else v for k, v in src.items()}
+
+
 class FlatNameDict(dict):
-    clean = re.compile('[^a-z]')
+    # Every stored key is canonical, so a key that is found as-is needs no normalization. Anything else is
+    # normalized through the flat_name cache before a second lookup.
+    clean = clean_name
 
     def __init__(self, src_dict: dict=None):
         super(FlatNameDict, self).__init__()
         self.update(src_dict)
 
     def __getitem__(self, k: str):
-        return super(FlatNameDict, self).__getitem__(re.sub(self.clean, '', k.lower()))
+        out = super(FlatNameDict, self).get(k, _missing)
+        if out is _missing:
+            return super(FlatNameDict, self).__getitem__(flat_name(k))
+        return out
 
     @staticmethod
     def rand_val():
         return False
 
     def get(self, k: str):
-        return super(FlatNameDict, self).get(re.sub(self.clean, '', k.lower()))
+        out = super(FlatNameDict, self).get(k, _missing)
+        if out is _missing:
+            return super(FlatNameDict, self).get(flat_name(k))
+        return out
 
     def __setitem__(self, key: str, value):
         if isinstance(value, str):
             value = value.strip()
-        super(FlatNameDict, self).__setitem__(re.sub(self.clean, '', key.lower()), value)
+        super(FlatNameDict, self).__setitem__(flat_name(key), value)
 
     def update(self, other=None, **kwargs):
         if other:
@@ -84,8 +163,25 @@ class FlatNameDict(dict):
             for k, v in kwargs.items():
                 self[k] = v
 
+    def __reduce__(self):
+        # Stored keys are already normalized, so unpickling skips __setitem__ and restores them as they are
+        return restore_flat_name_dict, (type(self), dict(self))
+
+
+def restore_flat_name_dict(cls, items: dict):
+    flat_dict = cls.__new__(cls)
+    dict.update(flat_dict, items)
+    return flat_dict
+
 
 class MinValDict(dict):
+    """Range table keyed by the highest roll covered by each entry. Looking up a roll returns the entry with the
+    lowest key at or above it. The sorted breakpoints are built on first lookup and searched with bisect, and any
+    change to the table drops them so they are rebuilt."""
+    _breakpoints = None
+    _entries = None
+    _top = None
+
     def __getitem__(self, item):
         out = self.get(item)
         if not out:
@@ -99,11 +195,26 @@ class MinValDict(dict):
     def get(self, k):
         if not isinstance(k, int):
             k = int(k)
-        out = None
-        while not out and k <= max(self.keys()):
-            out = super(MinValDict, self).get(k)
-            k += 1
-        return out
+        if self._breakpoints is None:
+            self.build_index()
+        i = bisect_left(self._breakpoints, k)
+        if i < len(self._entries):
+            return self._entries[i]
+        # Past the last non-empty entry, a roll within the table still finds the (empty) value of the highest key
+        top = self._top
+        return super(MinValDict, self).__getitem__(top) if top is not None and k <= top else None
+
+    def build_index(self):
+        # Entries with empty values are never returned by a lookup, the roll falls through to the next key instead
+        breakpoints = sorted(k for k, v in self.items() if v)
+        self._entries = [super(MinValDict, self).__getitem__(k) for k in breakpoints]
+        self._top = max(self.keys()) if self else None
+        self._breakpoints = breakpoints
+
+    def invalidate_index(self):
+        self._breakpoints = None
+        self._entries = None
+        self._top = None
 
     def __setitem__(self, key, value):
         if not isinstance(key, int):
@@ -111,15 +222,67 @@ class MinValDict(dict):
         if isinstance(value, str):
             value = value.strip()
         super(MinValDict, self).__setitem__(key, value)
+        self.invalidate_index()
+
+    def __delitem__(self, key):
+        super(MinValDict, self).__delitem__(key)
+        self.invalidate_index()
+
+    def update(self, *args, **kwargs):
+        super(MinValDict, self).update(*args, **kwargs)
+        self.invalidate_index()
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def setdefault(self, key, default=None):
+        out = super(MinValDict, self).setdefault(key, default)
+        self.invalidate_index()
+        return out
+
+    def pop(self, *args):
+        out = super(MinValDict, self).pop(*args)
+        self.invalidate_index()
+        return out
+
+    def popitem(self):
+        out = super(MinValDict, self).popitem()
+        self.invalidate_index()
+        return out
+
+    def clear(self):
+        super(MinValDict, self).clear()
+        self.invalidate_index()
+
+
+# Bonus damage by attribute value, looked up as a MinValDict
+bonus_damage_steps = {8: 0, 9: 1, 11: 2, 13: 3, 15: 5, 25: 6}
 
 
 class Talent:
+    _flat_requirements = None
+    _pre_requisites = None
+    _raw_pre_requisites = ()
+
     def __init__(self, name, definition: tuple):
         self.name = name
         self.tier = 1
-        self.attribute, self.skill, self.pre_requisites, self.max_ranks, self.description = \
+        self.attribute, self.skill, self._raw_pre_requisites, self.max_ranks, self.description = \
             self.parse_definition(definition)
 
+    def __setstate__(self, state):
+        # Talents pickled before pre-requisites were parsed lazily carry them already parsed
+        if 'pre_requisites' in state:
+            state['_pre_requisites'] = state.pop('pre_requisites')
+        self.__dict__.update(state)
+
+    @property
+    def pre_requisites(self) -> dict:
+        if self._pre_requisites is None:
+            self._pre_requisites = self.convert_pre_requisites(self._raw_pre_requisites)
+        return self._pre_requisites
+
     def __str__(self):
         return self.name
 
@@ -130,20 +293,34 @@ class Talent:
         return self.skill.lower() in [s.lower() for s in skill_list]
 
     def cost(self, skills):
+        # Focus in the talent's skill discounts it, but never past nothing: a talent does not pay XP back
         sk_foc = skills.get(self.skill)['foc']
-        return int((self.tier * 200) - (sk_foc * 25))
+        return max(0, int((self.tier * 200) - (sk_foc * 25)))
+
+    def flat_requirements(self):
+        """The talent's own name and its pre-requisite talent and skill names in canonical form, normalized once."""
+        if self._flat_requirements is None:
+            self._flat_requirements = (flat_name(self.name),
+                                       [flat_name(t) for t in self.pre_requisites['talents']],
+                                       [(flat_name(s), req) for s, req in self.pre_requisites['skills'].items()])
+        return self._flat_requirements
 
     def is_allowed(self, talents, skills):
         if not self.pre_requisites:
             return True
-        char_talents = FlatNameDict(talents) if talents else {}
-        char_skills = FlatNameDict(skills) if skills else {}
-        if char_talents.get(self.name):
+        return self.is_allowed_flat(flat_names(talents) if talents else {}, flat_names(skills) if skills else {})
+
+    def is_allowed_flat(self, char_talents: dict, char_skills: dict):
+        """is_allowed for talent and skill dicts that are already keyed by canonical names."""
+        if not self.pre_requisites:
+            return True
+        flat_self, flat_talents, flat_skills = self.flat_requirements()
+        if char_talents.get(flat_self):
             return False  # Character already has this talent
-        for req_talent in self.pre_requisites['talents']:
+        for req_talent in flat_talents:
             if not char_talents.get(req_talent):
                 return False  # Character lacks a required pre-requisite talent
-        for skill_name, skill_req in self.pre_requisites['skills'].items():
+        for skill_name, skill_req in flat_skills:
             char_skill_dict = char_skills.get(skill_name)
             if not char_skill_dict:
                 return False
@@ -153,8 +330,9 @@ class Talent:
         return True
 
     def parse_definition(self, definition):
+        # Pre-requisites are kept raw here and only converted the first time they are needed
         attribute, skill, temp_pre_requisites, max_ranks, description = definition
-        return attribute, skill, self.convert_pre_requisites(temp_pre_requisites), max_ranks, description
+        return attribute, skill, tuple(temp_pre_requisites), max_ranks, description
 
     @staticmethod
     def convert_pre_requisites(temp_pre_requisites):
@@ -175,10 +353,141 @@ class Talent:
             else:  # handling for talent requirements
                 talent_requirements.append(pre_req)
                 pass
-        pre_requisites = {talents: talent_requirements, skills: {k: v for k, v in skill_requirements.items()}}
-        if pre_requisites:
-            print(pre_requisites)
-        return pre_requisites
+        return {talents: talent_requirements, skills: {k: v for k, v in skill_requirements.items()}}
+
+
+class TalentIndex:
+    """Pre-requisite graph over the talent tree: which talents depend on each talent, and which talents have a
+    requirement on each skill. Keys are canonical names throughout."""
+    def __init__(self, talents: FlatNameDict):
+        self.order = {key: i for i, key in enumerate(talents)}
+        self.dependents = defaultdict(list)  # talent -> talents to re-check when it is gained (including itself)
+        self.skill_unlocks = defaultdict(list)  # skill -> talents with a requirement on that skill
+        self.by_skill = defaultdict(list)  # talent's own skill, as written in the tree -> talents whose cost it sets
+        for key, talent in talents.items():
+            self.by_skill[talent.skill].append(key)
+            flat_self, flat_talents, flat_skills = talent.flat_requirements()
+            self.dependents[flat_self].append(key)
+            for req_talent in flat_talents:
+                self.dependents[req_talent].append(key)
+            for skill_name, skill_req in flat_skills:
+                self.skill_unlocks[skill_name].append(key)
+
+
+class EligibleTalents:
+    """The set of talents a character currently meets the pre-requisites for. It is built with one full scan, then
+    kept current by re-checking only the talents affected when the character gains a talent or a skill changes."""
+    def __init__(self, talents: FlatNameDict, index: TalentIndex, char_talents: dict, char_skills: dict):
+        self.talents = talents
+        self.index = index
+        self.char_talents = flat_names(char_talents)
+        self.char_skills = flat_names(char_skills)  # Shares the per-skill dicts, so exp/foc values stay live
+        self.eligible = set()
+        self.listener = None  # Optional callback(key, allowed) for talents whose eligibility changes
+        self.checks = 0  # Pre-requisite checks made, for profiling
+        self.recheck(talents.keys())
+
+    def recheck(self, keys):
+        self.checks += len(keys)
+        for key in keys:
+            allowed = self.talents[key].is_allowed_flat(self.char_talents, self.char_skills)
+            if allowed == (key in self.eligible):
+                continue
+            if allowed:
+                self.eligible.add(key)
+            else:
+                self.eligible.discard(key)
+            if self.listener is not None:
+                self.listener(key, allowed)
+
+    def talent_added(self, name: str, description):
+        flat = flat_name(name)
+        self.char_talents[flat] = description.strip() if isinstance(description, str) else description
+        self.recheck(self.index.dependents.get(flat, ()))
+
+    def skill_changed(self, name: str, skill: dict):
+        flat = flat_name(name)
+        self.char_skills[flat] = skill
+        self.recheck(self.index.skill_unlocks.get(flat, ()))
+
+    def allowed(self) -> list:
+        return [self.talents[key] for key in sorted(self.eligible, key=self.index.order.__getitem__)]
+
+
+class CostBucket:
+    """Purchases of one type that fit in the budget. Keys sit in a list for O(1) uniform choice and swap-removal,
+    alongside a max-heap on cost so that entries priced out by a shrinking budget are dropped without a scan."""
+    def __init__(self):
+        self.keys = []
+        self.positions = {}
+        self.costs = {}
+        self.by_cost = []  # (-cost, sequence, key), may hold stale entries for keys re-priced or removed since
+        self.sequence = 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    def set_cost(self, key, cost: int):
+        if key not in self.positions:
+            self.positions[key] = len(self.keys)
+            self.keys.append(key)
+        self.costs[key] = cost
+        self.sequence += 1
+        heappush(self.by_cost, (-cost, self.sequence, key))
+
+    def remove(self, key):
+        position = self.positions.pop(key, None)
+        if position is None:
+            return
+        last = self.keys.pop()
+        if last is not key:
+            self.keys[position] = last
+            self.positions[last] = position
+        del self.costs[key]
+
+    def prune(self, budget: int):
+        while self.by_cost and -self.by_cost[0][0] > budget:
+            neg_cost, sequence, key = heappop(self.by_cost)
+            if self.costs.get(key) == -neg_cost:
+                self.remove(key)
+
+
+class PurchaseFrontier:
+    """Everything a character can currently afford, bucketed by purchase type. Entries are re-priced individually as
+    purchases change them, and anything costing more than the remaining budget is dropped as the budget is spent."""
+    purchase_types = ('talents', 'skill_exp', 'skill_foc', 'attributes')
+
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.buckets = {upg_type: CostBucket() for upg_type in self.purchase_types}
+
+    def __bool__(self):
+        return any(self.buckets.values())
+
+    def set_cost(self, upg_type: str, key, cost: int):
+        if cost <= self.budget:
+            self.buckets[upg_type].set_cost(key, cost)
+        else:
+            self.buckets[upg_type].remove(key)
+
+    def remove(self, upg_type: str, key):
+        self.buckets[upg_type].remove(key)
+
+    def spend(self, cost: int):
+        self.budget -= cost
+        for bucket in self.buckets.values():
+            bucket.prune(self.budget)
+
+    def choose(self, rng=random):
+        """Picks a purchase type uniformly from those with something affordable, then a purchase uniformly within it.
+        Returns (type, key, cost), or None if nothing is affordable."""
+        available = [upg_type for upg_type in self.purchase_types if self.buckets[upg_type]]
+        if not available:
+            return None
+        upg_type = rng.choice(available)
+        bucket = self.buckets[upg_type]
+        key = rng.choice(bucket.keys)
+        return upg_type, key, bucket.costs[key]
 
 
 def import_talents() -> FlatNameDict:
@@ -186,3 +495,12 @@ def import_talents() -> FlatNameDict:
     talent_file = os.path.join(script_dir, 'talent_tree.dat')
     with open(talent_file, 'rb') as talent_store_in:
         return FlatNameDict(pickle.load(talent_store_in))
+
+
+def import_tables() -> LifePathTables:
+    script_dir = os.path.dirname(os.path.realpath(__file__))
+    table_file = os.path.join(script_dir, 'tables.dat')
+    table_store = LifePathTables()
+    with open(table_file, 'rb') as table_store_in:
+        table_store.read_raw_table_dict(pickle.load(table_store_in))
+    return table_store
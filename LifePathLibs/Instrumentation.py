@@ -0,0 +1,154 @@
+import sys
+import time
+from collections import defaultdict
+from collections.abc import Mapping
+
+profile_modes = ('cprofile', 'tracemalloc')
+
+
+class CountingTable:
+    """Proxy over one table that counts lookups into it under its name, including lookups into any nested table it
+    returns (e.g. the per-caste stories)."""
+    def __init__(self, table, name: str, counts: dict):
+        self._table = table
+        self._name = name
+        self._counts = counts
+
+    def _wrap(self, value):
+        return CountingTable(value, self._name, self._counts) if isinstance(value, Mapping) else value
+
+    def get(self, k):
+        self._counts[self._name] += 1
+        return self._wrap(self._table.get(k))
+
+    def __getitem__(self, k):
+        self._counts[self._name] += 1
+        return self._wrap(self._table[k])
+
+    def __contains__(self, k):
+        return k in self._table
+
+    def __iter__(self):
+        return iter(self._table)
+
+    def __len__(self):
+        return len(self._table)
+
+    def __getattr__(self, name):
+        return getattr(self._table, name)
+
+
+class CountingTableStore:
+    """Proxy over a LifePathTables whose life path tables count their lookups. Everything else, including the talent
+    tree, is passed straight through."""
+    def __init__(self, table_store, counts: dict):
+        self._table_store = table_store
+        for name, table in table_store.table_dict().items():
+            setattr(self, name, CountingTable(table, name, counts))
+
+    def __getattr__(self, name):
+        return getattr(self._table_store, name)
+
+
+class GenerationProfile:
+    """Per-step wall time and work counters, accumulated over every character generated with it. Characters only
+    touch it when one is passed in, so generation without a profile pays nothing beyond a None check."""
+    def __init__(self):
+        self.characters = 0
+        self.step_time = defaultdict(float)
+        self.table_lookups = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.remote_stall_time = 0.0
+        self._table_stores = {}
+        self._source_start = None
+
+    def tables(self, table_store):
+        """The counting proxy for table_store, made once per table store."""
+        key = id(table_store)
+        if key not in self._table_stores:
+            # The table store is kept with its proxy, so that its id cannot be reused while cached
+            self._table_stores[key] = (table_store, CountingTableStore(table_store, self.table_lookups))
+        return self._table_stores[key][1]
+
+    def timed(self, step, *args):
+        start = time.perf_counter()
+        try:
+            return step(*args)
+        finally:
+            self.step_time[step.__name__] += time.perf_counter() - start
+
+    def character_started(self, random_source=None):
+        metrics = getattr(random_source, 'metrics', None)
+        self._source_start = (metrics, metrics.fetches, metrics.fetch_failures, metrics.stall_time) \
+            if metrics is not None else None
+
+    def character_done(self, char):
+        self.characters += 1
+        if char.eligible_talents is not None:
+            self.counters['eligibility_checks'] += char.eligible_talents.checks
+        self.counters['xp_spend_iterations'] += len(char.xp_spends)
+        if self._source_start is not None:
+            metrics, fetches, failures, stall_time = self._source_start
+            self.counters['remote_fetches'] += metrics.fetches - fetches
+            self.counters['remote_fetch_failures'] += metrics.fetch_failures - failures
+            self.remote_stall_time += metrics.stall_time - stall_time
+            self._source_start = None
+
+    def summary(self) -> dict:
+        per_char = max(self.characters, 1)
+        counters = {'table_lookups': sum(self.table_lookups.values()), 'eligibility_checks': 0,
+                    'xp_spend_iterations': 0, 'remote_fetches': 0, 'remote_fetch_failures': 0}
+        counters.update(self.counters)
+        return {'characters': self.characters,
+                'steps': {name: {'total_s': total, 'mean_s': total / per_char}
+                          for name, total in self.step_time.items()},
+                'counters': counters, 'table_lookups': dict(self.table_lookups),
+                'remote_stall_s': self.remote_stall_time}
+
+    def format_summary(self) -> str:
+        summary = self.summary()
+        total = sum(step['total_s'] for step in summary['steps'].values()) or 1.0
+        lines = ["Profile of %d characters:" % summary['characters'],
+                 "%-30s %12s %12s %7s" % ('step', 'total (ms)', 'mean (us)', 'share')]
+        for name, step in summary['steps'].items():
+            lines.append("%-30s %12.2f %12.2f %6.1f%%" % (name, step['total_s'] * 1e3, step['mean_s'] * 1e6,
+                                                         step['total_s'] / total * 100))
+        lines.append("Counters (per character):")
+        for name, count in summary['counters'].items():
+            lines.append("  %-28s %12d %12.2f" % (name, count, count / max(summary['characters'], 1)))
+        if summary['counters']['remote_fetches'] or summary['remote_stall_s']:
+            lines.append("  %-28s %12.3fs" % ('remote_stall_time', summary['remote_stall_s']))
+        lines.append("Table lookups:")
+        for name, count in sorted(summary['table_lookups'].items(), key=lambda item: -item[1]):
+            lines.append("  %-28s %12d" % (name, count))
+        return '\n'.join(lines)
+
+
+def profile_call(fn, mode: str='cprofile', dump_file: str=None, limit: int=25):
+    """Runs fn under cProfile or tracemalloc and returns its result. The profile is written to dump_file (pstats or
+    tracemalloc snapshot format) if given, or the top entries are printed to stderr."""
+    if mode == 'cprofile':
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        result = profiler.runcall(fn)
+        if dump_file:
+            profiler.dump_stats(dump_file)
+        else:
+            pstats.Stats(profiler, stream=sys.stderr).sort_stats('cumulative').print_stats(limit)
+    elif mode == 'tracemalloc':
+        import tracemalloc
+        tracemalloc.start()
+        try:
+            result = fn()
+            snapshot = tracemalloc.take_snapshot()
+        finally:
+            tracemalloc.stop()
+        if dump_file:
+            snapshot.dump(dump_file)
+        else:
+            for stat in snapshot.statistics('lineno')[:limit]:
+                print(stat, file=sys.stderr)
+    else:
+        raise ValueError("Unknown profile mode %r, expected one of %s" % (mode, ', '.join(profile_modes)))
+    return result
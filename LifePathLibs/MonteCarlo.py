@@ -0,0 +1,276 @@
+from LifePathLibs.GenUtils import LifePathTables, MinValDict, bonus_damage_steps
+from LifePathLibs.Probability import roll_layout, roll_count, attribute_order, attribute_index, skill_order, \
+    skill_index, career_token, random_career_token, skill_token, PathEffects
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def require_numpy():
+    if np is None:
+        raise ImportError("Statistics mode needs NumPy, which is not installed. Install it with: pip install numpy")
+
+
+class RollTable:
+    """Array version of a MinValDict: lut[roll] is the position in entries of the entry that roll looks up, so a whole
+    array of rolls is mapped with a single indexing operation."""
+    def __init__(self, table: MinValDict, max_roll: int=20):
+        require_numpy()
+        self.entries = []
+        positions = {}
+        self.lut = np.zeros(max_roll + 1, dtype=np.intp)
+        for roll in range(1, max_roll + 1):
+            entry = table.get(roll)
+            if entry is None:
+                raise ValueError("Roll %d is not covered by the table" % roll)
+            if id(entry) not in positions:
+                positions[id(entry)] = len(self.entries)
+                self.entries.append(entry)
+            self.lut[roll] = positions[id(entry)]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, rolls):
+        return self.lut[rolls]
+
+
+class TableArrays:
+    """Array versions of the life path tables, with each entry's effects pre-parsed into index arrays."""
+    def __init__(self, table_store: LifePathTables):
+        require_numpy()
+        self.homelands = RollTable(table_store.homelands, 40)
+        self.homeland_labels = [e[0].strip() for e in self.homelands.entries]
+
+        self.attributes = RollTable(table_store.attributes)
+        att_rows = [[attribute_index[v.strip()] for v in e[1:5]] for e in self.attributes.entries]
+        self.attribute_mandatory = np.array([r[:2] for r in att_rows], dtype=np.intp)
+        self.attribute_optional = np.array([r[2:] for r in att_rows], dtype=np.intp)
+
+        self.castes = RollTable(table_store.castes)
+        caste_info = [tuple(v.strip() for v in e) for e in self.castes.entries]
+        self.caste_labels = [c[0] for c in caste_info]
+        self.caste_skill = np.array([skill_index[c[2]] for c in caste_info], dtype=np.intp)
+        self.caste_standing = np.array([int(c[3]) for c in caste_info], dtype=np.intp)
+
+        # Stories are rolled on a table per caste, so they get one row of a 2D lookup per caste, indexing into a
+        # combined list of "caste / story" labels
+        self.story_labels = []
+        self.story_lut = np.zeros((len(self.castes), 21), dtype=np.intp)
+        for c, caste in enumerate(self.caste_labels):
+            stories = RollTable(table_store.caste_stories.get(caste))
+            self.story_lut[c] = stories.lut + len(self.story_labels)
+            self.story_labels += ['%s / %s' % (caste, e[0].strip()) for e in stories.entries]
+
+        self.archetypes = RollTable(table_store.archetypes)
+        self.archetype_labels = [e.strip() for e in self.archetypes.entries]
+        self.archetype_effects = [PathEffects(table_store.archetypes_descriptions.get(a)[1])
+                                  for a in self.archetype_labels]
+        self.archetype_career = np.array([e.career for e in self.archetype_effects], dtype=np.intp)
+
+        self.natures = RollTable(table_store.natures)
+        self.nature_labels = [e.strip() for e in self.natures.entries]
+        self.nature_effects = [PathEffects(table_store.natures_descriptions.get(n)[1]) for n in self.nature_labels]
+
+        self.educations = RollTable(table_store.educations)
+        self.education_labels = [e.strip() for e in self.educations.entries]
+        self.education_effects = [PathEffects(table_store.educations_descriptions[e][1])
+                                  for e in self.education_labels]
+
+        self.war_stories = RollTable(table_store.war_stories)
+        self.war_story_labels = [e[0].strip() for e in self.war_stories.entries]
+        self.war_story_skills = np.array([[skill_token(s) for s in e[1].split(' to ')[1].split(' and ')]
+                                          for e in self.war_stories.entries], dtype=np.intp)
+
+        self.finishing_touches = {name: RollTable(getattr(table_store, table))
+                                  for name, table in (('garment', 'garments'), ('belonging', 'belongings'),
+                                                      ('weapon', 'weapons'), ('provenance', 'provenance'))}
+
+        bonus_damage = MinValDict()
+        bonus_damage.update(bonus_damage_steps)
+        self.bonus_damage = np.array([bonus_damage[v] for v in range(max(bonus_damage_steps) + 1)], dtype=np.intp)
+
+
+class LifePathBatch:
+    """A batch of full-auto characters generated column-wise from an (n, 14) array of d20 rolls. Choices that the
+    generator makes at random (best/worst attributes, optional attributes, elective skills and random career skills)
+    are drawn in bulk from rng with the same distribution; everything else is a table lookup. XP is not spent."""
+    def __init__(self, arrays: TableArrays, rolls, rng):
+        self.arrays = arrays
+        self.rng = rng
+        n = len(rolls)
+        self.rows = np.arange(n)
+        self.attributes = np.full((n, len(attribute_order)), 7, dtype=np.intp)
+        self.skills = np.zeros((n, len(skill_order)), dtype=np.intp)  # Exp and focus always rise together here
+        self.career = np.zeros(n, dtype=np.intp)
+
+        homeland_roll = rolls[:, roll_layout['homeland'][0]] + rolls[:, roll_layout['homeland'][1]]
+        self.homeland = arrays.homelands.lookup(homeland_roll)
+        self.roll_attributes([arrays.attributes.lookup(rolls[:, col]) for col in roll_layout['attributes']])
+        self.caste = arrays.castes.lookup(rolls[:, roll_layout['caste']])
+        self.add_skill(self.rows, arrays.caste_skill[self.caste], 1)
+        self.standing = arrays.caste_standing[self.caste]
+        self.caste_story = arrays.story_lut[self.caste, rolls[:, roll_layout['caste_story']]]
+        self.archetype = arrays.archetypes.lookup(rolls[:, roll_layout['archetype']])
+        self.apply_path(self.archetype, arrays.archetype_effects)
+        self.nature = arrays.natures.lookup(rolls[:, roll_layout['nature']])
+        self.apply_path(self.nature, arrays.nature_effects)
+        self.education = arrays.educations.lookup(rolls[:, roll_layout['education']])
+        self.apply_path(self.education, arrays.education_effects)
+        self.war_story = arrays.war_stories.lookup(rolls[:, roll_layout['war_story']])
+        for col in range(arrays.war_story_skills.shape[1]):
+            self.add_skill(self.rows, arrays.war_story_skills[self.war_story, col], 1)
+        self.finishing_touches = {name: table.lookup(rolls[:, roll_layout[name]])
+                                  for name, table in arrays.finishing_touches.items()}
+
+        self.vigor = self.attribute('Brawn') + self.skill('Resistance')
+        self.resolve = self.attribute('Willpower') + self.skill('Discipline')
+        self.gold = self.attribute('Personality') + self.skill('Society')
+        self.bonus_melee = arrays.bonus_damage[self.attribute('Brawn')]
+        self.bonus_ranged = arrays.bonus_damage[self.attribute('Awareness')]
+        self.bonus_presence = arrays.bonus_damage[self.attribute('Personality')]
+
+    def attribute(self, name: str):
+        return self.attributes[:, attribute_index[name]]
+
+    def skill(self, name: str):
+        return self.skills[:, skill_index[name]]
+
+    def roll_attributes(self, entries: list):
+        arrays = self.arrays
+        mandatories = np.concatenate([arrays.attribute_mandatory[e] for e in entries], axis=1)
+        # Every mandatory attribute gets +2, then the best gets one more and the worst one less. The worst is picked
+        # from the other mandatories until it differs from the best, so it is uniform over those that do.
+        best = mandatories[self.rows, self.rng.integers(0, mandatories.shape[1], len(self.rows))]
+        others = mandatories != best[:, None]
+        other_count = others.sum(axis=1)
+        if not other_count.all():
+            raise ValueError("Attribute rolls with no possible worst attribute")
+        pick = (self.rng.random(len(self.rows)) * other_count).astype(np.intp)
+        worst = mandatories[self.rows, np.argmax(np.cumsum(others, axis=1) > pick[:, None], axis=1)]
+        for col in range(mandatories.shape[1]):
+            self.attributes[self.rows, mandatories[:, col]] += 2
+        self.attributes[self.rows, best] += 1
+        self.attributes[self.rows, worst] -= 1
+        for e in entries:
+            optional = arrays.attribute_optional[e, self.rng.integers(0, 2, len(self.rows))]
+            self.attributes[self.rows, optional] += 1
+
+    def add_skill(self, rows, token, amount: int):
+        """Adds amount to the skill given by token (one per row, or one for all rows) in each of rows."""
+        if np.ndim(token):
+            self.skills[rows, token] += amount
+        elif token == career_token:
+            self.skills[rows, self.career[rows]] += amount
+        elif token == random_career_token:
+            archetype = self.arrays.archetypes.lookup(self.rng.integers(1, 21, len(rows)))
+            self.career[rows] = self.arrays.archetype_career[archetype]
+            self.skills[rows, self.career[rows]] += 2  # An extra career skill is +2/+2, like the archetype's own
+        else:
+            self.skills[rows, token] += amount
+
+    def apply_path(self, entry, effects_list: list):
+        for e, effects in enumerate(effects_list):
+            rows = np.flatnonzero(entry == e)
+            if not len(rows):
+                continue
+            if effects.career is not None:
+                self.career[rows] = effects.career
+                self.add_skill(rows, effects.career, 2)
+            for token in effects.mandatory:
+                self.add_skill(rows, token, 1)
+            if effects.electives:
+                # Two different electives, the first uniform over all of them and the second over the rest
+                first = self.rng.integers(0, len(effects.electives), len(rows))
+                second = self.rng.integers(0, len(effects.electives) - 1, len(rows))
+                second += second >= first
+                for picks in (first, second):
+                    for p, token in enumerate(effects.electives):
+                        self.add_skill(rows[picks == p], token, 1)
+            if effects.attribute is not None:
+                self.attributes[rows, effects.attribute] += 1
+
+
+class Histogram:
+    """Counts of small non-negative integers (or of label positions, if labels are given), accumulated batch by
+    batch."""
+    def __init__(self, labels: list=None):
+        self.labels = labels
+        self.counts = np.zeros(len(labels) if labels else 0, dtype=np.int64)
+
+    def add(self, values):
+        counts = np.bincount(values, minlength=len(self.counts))
+        if len(counts) > len(self.counts):
+            self.counts = np.pad(self.counts, (0, len(counts) - len(self.counts)))
+        self.counts += counts
+
+    def summary(self) -> dict:
+        if self.labels is not None:
+            histogram = {}
+            for label, count in zip(self.labels, self.counts.tolist()):
+                histogram[label] = histogram.get(label, 0) + count
+            return histogram
+        total = int(self.counts.sum())
+        if not total:
+            return {'mean': 0.0, 'std': 0.0, 'min': 0, 'max': 0, 'histogram': {}}
+        values = np.arange(len(self.counts))
+        present = np.flatnonzero(self.counts)
+        mean = float((values * self.counts).sum() / total)
+        variance = float((((values - mean) ** 2) * self.counts).sum() / total)
+        return {'mean': mean, 'std': variance ** 0.5, 'min': int(present[0]), 'max': int(present[-1]),
+                'histogram': {int(v): int(self.counts[v]) for v in present}}
+
+
+class LifePathStats:
+    """Monte Carlo distributions of every life path step, final attributes, skills and derived stats, over as many
+    full-auto characters as wanted. Characters are generated in NumPy batches of chunk_size."""
+    numeric_stats = ('standing', 'vigor', 'resolve', 'gold', 'bonus_melee', 'bonus_ranged', 'bonus_presence')
+
+    def __init__(self, table_store: LifePathTables, seed: int=None, chunk_size: int=1 << 18):
+        require_numpy()
+        self.arrays = TableArrays(table_store)
+        self.rng = np.random.default_rng(seed)
+        self.chunk_size = chunk_size
+        self.samples = 0
+        arrays = self.arrays
+        self.steps = {'homeland': Histogram(arrays.homeland_labels), 'caste': Histogram(arrays.caste_labels),
+                      'caste_story': Histogram(arrays.story_labels), 'archetype': Histogram(arrays.archetype_labels),
+                      'nature': Histogram(arrays.nature_labels), 'education': Histogram(arrays.education_labels),
+                      'war_story': Histogram(arrays.war_story_labels)}
+        for name, table in arrays.finishing_touches.items():
+            self.steps[name] = Histogram([e.strip() for e in table.entries])
+        self.attributes = {name: Histogram() for name in attribute_order}
+        self.skills = {name: Histogram() for name in skill_order}
+        self.stats = {name: Histogram() for name in self.numeric_stats}
+
+    def run(self, samples: int):
+        while samples > 0:
+            n = min(samples, self.chunk_size)
+            self.add_batch(LifePathBatch(self.arrays, self.rng.integers(1, 21, (n, roll_count)), self.rng))
+            samples -= n
+        return self
+
+    def add_batch(self, batch: LifePathBatch):
+        self.samples += len(batch.rows)
+        for name, histogram in self.steps.items():
+            histogram.add(batch.finishing_touches[name] if name in batch.finishing_touches else getattr(batch, name))
+        for i, name in enumerate(attribute_order):
+            self.attributes[name].add(batch.attributes[:, i])
+        for i, name in enumerate(skill_order):
+            self.skills[name].add(batch.skills[:, i])
+        for name, histogram in self.stats.items():
+            histogram.add(getattr(batch, name))
+
+    def report(self) -> dict:
+        report = {'samples': self.samples, 'steps': {k: v.summary() for k, v in self.steps.items()},
+                  'attributes': {k: v.summary() for k, v in self.attributes.items()},
+                  'skills': {k: v.summary() for k, v in self.skills.items()}}
+        report.update((k, v.summary()) for k, v in self.stats.items())
+        return report
+
+
+def life_path_stats(table_store: LifePathTables, samples: int, seed: int=None) -> dict:
+    """Report of the distributions over samples full-auto characters (before any XP is spent)."""
+    return LifePathStats(table_store, seed).run(samples).report()
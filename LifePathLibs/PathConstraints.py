@@ -0,0 +1,461 @@
+import re
+from collections import defaultdict, deque
+from LifePathLibs.GenUtils import LifePathTables, flat_name
+from LifePathLibs.Probability import roll_layout, roll_count, attribute_order, attribute_index, skill_order, \
+    skill_index, base_attribute, career_token, random_career_token, skill_token, career_skill_name, PathEffects, \
+    entry_label
+
+# Life path steps in the order they are generated, each with the table it rolls on and the field of an entry that
+# labels it. Stories are rolled on a table per caste.
+stage_tables = (('homeland', 'homelands', 0), ('attributes', 'attributes', None), ('caste', 'castes', 0),
+                ('caste_story', None, 0), ('archetype', 'archetypes', None), ('nature', 'natures', None),
+                ('education', 'educations', None), ('war_story', 'war_stories', 0), ('garment', 'garments', None),
+                ('belonging', 'belongings', None), ('weapon', 'weapons', None), ('provenance', 'provenance', None))
+stage_names = tuple(stage[0] for stage in stage_tables)
+path_descriptions = {'archetype': 'archetypes_descriptions', 'nature': 'natures_descriptions',
+                     'education': 'educations_descriptions'}
+step_keys = {flat_name(name): name for name in stage_names if name != 'attributes'}
+step_keys['story'] = 'caste_story'
+attribute_keys = {flat_name(name): name for name in attribute_order}
+skill_keys = {flat_name(name): name for name in skill_order}
+spec_pattern = re.compile(r'^\s*([^<>=!]+?)\s*(?:(>=|<=|!=|=|>|<)\s*(.*?))?\s*$')
+skill_suffix = re.compile(r'\.\s*(exp|expertise|foc|focus)$', re.IGNORECASE)
+
+
+class ConstraintError(ValueError):
+    """A constraint that cannot be understood, or a character that does not meet its constraints."""
+
+
+class InfeasibleConstraints(ConstraintError):
+    """No character can meet the constraints. infeasible lists the constraints that no character can meet even on
+    their own, and is empty when only their combination is impossible."""
+    def __init__(self, message: str, infeasible: list):
+        super(InfeasibleConstraints, self).__init__(message)
+        self.infeasible = infeasible
+
+
+class Constraints:
+    """Requirements on a character's life path, before any XP is spent, parsed from specs such as 'homeland=Cimmeria',
+    'caste=Slave|Serf', 'archetype!=Pirate', 'Brawn>=10', 'standing<=2', 'Sorcery' (any expertise in the skill) or
+    'Sorcery.foc>=2'. Life path steps take entries; attributes, skills and standing take bounds. Expertise and focus
+    always rise together before XP, so a skill has one level that both bounds apply to."""
+    def __init__(self, specs=()):
+        self.specs = tuple(specs)
+        self.steps = defaultdict(list)  # Step name -> (include, flat entry names) filters
+        self.ranges = {}  # ('attribute', index), ('skill', index) or ('standing', None) -> [low, high]
+        for spec in self.specs:
+            self.add(spec)
+
+    def add(self, spec: str):
+        match = spec_pattern.match(spec)
+        if not match:
+            raise ConstraintError("Cannot parse the constraint %r" % spec)
+        name, op, value = match.groups()
+        if flat_name(name) in step_keys:
+            if op not in ('=', '!='):
+                raise ConstraintError("%r: life path steps take = or != and one or more entries separated by |" % spec)
+            entries = {flat_name(v) for v in value.split('|') if flat_name(v)}
+            if not entries:
+                raise ConstraintError("%r does not name any entries" % spec)
+            self.steps[step_keys[flat_name(name)]].append((op == '=', entries))
+            return
+        quantity = self.quantity(name, spec)
+        if op is None:
+            if quantity[0] != 'skill':
+                raise ConstraintError("%r needs a bound, e.g. %s>=10" % (spec, name))
+            low, high = 1, None
+        else:
+            try:
+                bound = int(value)
+            except ValueError:
+                raise ConstraintError("%r: the bound must be a whole number" % spec)
+            low, high = {'>=': (bound, None), '>': (bound + 1, None), '<=': (None, bound), '<': (None, bound - 1),
+                         '=': (bound, bound)}.get(op, (None, None))
+            if op == '!=':
+                raise ConstraintError("%r: attributes, skills and standing take bounds, not !=" % spec)
+        bounds = self.ranges.setdefault(quantity, [None, None])
+        if low is not None:
+            bounds[0] = low if bounds[0] is None else max(bounds[0], low)
+        if high is not None:
+            bounds[1] = high if bounds[1] is None else min(bounds[1], high)
+
+    @staticmethod
+    def quantity(name: str, spec: str) -> tuple:
+        skill_name = skill_suffix.sub('', name)
+        if flat_name(name) in attribute_keys:
+            return 'attribute', attribute_index[attribute_keys[flat_name(name)]]
+        if flat_name(skill_name) in skill_keys:
+            return 'skill', skill_index[skill_keys[flat_name(skill_name)]]
+        if flat_name(name) in ('standing', 'socialstanding'):
+            return 'standing', None
+        raise ConstraintError("%r does not name a life path step, attribute, skill or standing. Steps: %s" %
+                              (spec, ', '.join(sorted(set(step_keys.values())))))
+
+    def __repr__(self):
+        return 'Constraints(%r)' % (self.specs,)
+
+
+class Outcome:
+    """One way a life path step can turn out: its probability, the entry rolled, the attribute and skill increases
+    (as (index, amount) pairs), the career skill and caste afterwards, and the script that makes a CharacterMaker
+    produce it (dice as (columns, candidate values) pairs, choice indices by kind, and extra archetype rolls for
+    random career skills as candidate values)."""
+    __slots__ = ('p', 'label', 'attributes', 'skills', 'career', 'caste', 'standing', 'dice', 'picks', 'extra_rolls')
+
+    def __init__(self, p: float, label, attributes=(), skills=(), career=None, caste=None, standing=None, dice=(),
+                 picks=(), extra_rolls=()):
+        self.p = p
+        self.label = label
+        self.attributes = attributes
+        self.skills = skills
+        self.career = career
+        self.caste = caste
+        self.standing = standing
+        self.dice = dice
+        self.picks = picks
+        self.extra_rolls = extra_rolls
+
+
+def roll_groups(table, sides: int=20, dice: int=1) -> list:
+    """The distinct entries a table can roll, each with the dice values that roll it."""
+    groups = {}
+    for values in ([(v,) for v in range(1, sides + 1)] if dice == 1 else
+                   [(a, b) for a in range(1, sides + 1) for b in range(1, sides + 1)]):
+        entry = table.get(sum(values))
+        groups.setdefault(id(entry), (entry, []))[1].append(values)
+    return list(groups.values())
+
+
+class LifePathModel:
+    """Every outcome of every life path step, mirroring CharacterMaker in full-auto mode: the probability of each
+    entry, and of each best, worst and optional attribute, elective skill and random career skill pick. Steps that
+    depend on the career skill or caste rolled earlier have their outcomes for each of them. Built once from the
+    tables; it does not keep them."""
+    def __init__(self, table_store: LifePathTables):
+        self.outcomes = {}  # Step name -> {context: [Outcome]}, where the context is the career skill or caste
+        self.labels = defaultdict(set)
+        self.random_careers = []
+        for entry, values in roll_groups(table_store.archetypes):
+            values_by_name = table_store.archetypes_descriptions.get(entry.strip())[1]
+            self.random_careers.append((len(values) / 20, skill_token(career_skill_name(values_by_name['careerskill'])),
+                                        values))
+        careers = [None] + sorted({career for p, career, values in self.random_careers})
+        for name, table_name, field in stage_tables:
+            if name == 'attributes':
+                self.outcomes[name] = {None: self.attribute_outcomes(table_store.attributes)}
+            elif name == 'caste':
+                self.outcomes[name] = {None: self.caste_outcomes(table_store.castes)}
+            elif name == 'caste_story':
+                self.outcomes[name] = {caste: self.label_outcomes(name, table_store.caste_stories.get(caste), field)
+                                       for caste in self.labels['caste_name']}
+            elif name in path_descriptions:
+                descriptions = getattr(table_store, path_descriptions[name])
+                self.outcomes[name] = {career: self.path_outcomes(name, getattr(table_store, table_name), descriptions,
+                                                                  career) for career in careers}
+            elif name == 'war_story':
+                self.outcomes[name] = {career: self.war_story_outcomes(getattr(table_store, table_name), career)
+                                       for career in careers}
+            else:
+                self.outcomes[name] = {None: self.label_outcomes(name, getattr(table_store, table_name), field,
+                                                                 2 if name == 'homeland' else 1)}
+
+    def label_outcomes(self, name: str, table, field, dice: int=1) -> list:
+        outcomes = []
+        for entry, values in roll_groups(table, dice=dice):
+            label = entry_label(entry, field)
+            self.labels[name].add(label)
+            columns = roll_layout[name] if dice > 1 else (roll_layout[name],)
+            outcomes.append(Outcome(len(values) / 20 ** dice, label, dice=((columns, values),)))
+        return outcomes
+
+    def attribute_outcomes(self, table) -> list:
+        # Every mandatory attribute gets +2, the best one more and the worst one less. The worst is re-picked until it
+        # differs from the best, so it is uniform over the others that do.
+        outcomes = []
+        first_column, second_column = roll_layout['attributes']
+        groups = roll_groups(table)
+        for first, first_values in groups:
+            for second, second_values in groups:
+                first, second = tuple(v.strip() for v in first), tuple(v.strip() for v in second)
+                p = len(first_values) * len(second_values) / 400
+                dice = (((first_column,), first_values), ((second_column,), second_values))
+                mandatories = list(first[1:3] + second[1:3])
+                for b, best in enumerate(mandatories):
+                    rest = list(mandatories)
+                    rest.remove(best)
+                    others = [w for w, worst in enumerate(rest) if worst != best]
+                    for w in others:
+                        remaining = list(rest)
+                        remaining.remove(rest[w])
+                        for o1 in (0, 1):
+                            for o2 in (0, 1):
+                                increases = [(best, 3), (rest[w], 1), (first[3 + o1], 1), (second[3 + o2], 1)]
+                                increases += [(other, 2) for other in remaining]
+                                outcomes.append(Outcome(
+                                    p / len(mandatories) / len(others) / 4, None,
+                                    attributes=tuple((attribute_index[a], n) for a, n in increases), dice=dice,
+                                    picks=(('best_attribute', b), ('worst_attribute', w), ('optional_attribute', o1),
+                                           ('optional_attribute', o2))))
+        return outcomes
+
+    def caste_outcomes(self, table) -> list:
+        outcomes = []
+        for entry, values in roll_groups(table):
+            caste, talents, skill, standing = (v.strip() for v in entry)
+            self.labels['caste'].add(caste)
+            self.labels['caste_name'].add(caste)
+            outcomes.append(Outcome(len(values) / 20, caste, skills=((skill_index[skill], 1),), caste=caste,
+                                    standing=int(standing), dice=(((roll_layout['caste'],), values),)))
+        return outcomes
+
+    def add_skills(self, branches: list, token: int, amount: int) -> list:
+        """Applies one skill token to each (p, skills, career, extra rolls) branch, as CharacterMaker.add_skill does.
+        A random career skill branches over the archetype rolled for it."""
+        added = []
+        for p, skills, career, extra_rolls in branches:
+            if token == career_token:
+                # Before any archetype there is no career skill to raise
+                added.append((p, skills + ((career, amount),) if career is not None else skills, career, extra_rolls))
+            elif token == random_career_token:
+                for q, new_career, values in self.random_careers:
+                    added.append((p * q, skills + ((new_career, 2),), new_career, extra_rolls + (values,)))
+            else:
+                added.append((p, skills + ((token, amount),), career, extra_rolls))
+        return added
+
+    def path_outcomes(self, name: str, table, descriptions, career) -> list:
+        outcomes = []
+        for entry, values in roll_groups(table):
+            label = entry.strip()
+            self.labels[name].add(label)
+            effects = PathEffects(descriptions.get(label)[1])
+            branches = [(len(values) / 20, (), career, ())]
+            if effects.career is not None:
+                branches = self.add_skills([(p, s, effects.career, e) for p, s, c, e in branches], effects.career, 2)
+            for token in effects.mandatory:
+                branches = self.add_skills(branches, token, 1)
+            picked = [(branches, ())]
+            if effects.electives:
+                # Two different electives, the first uniform over all of them and the second over the rest
+                picked = []
+                n = len(effects.electives)
+                for i, first in enumerate(effects.electives):
+                    rest = list(effects.electives)
+                    rest.remove(first)
+                    for j, second in enumerate(rest):
+                        chosen = [(p / n / (n - 1), s, c, e) for p, s, c, e in branches]
+                        chosen = self.add_skills(self.add_skills(chosen, first, 1), second, 1)
+                        picked.append((chosen, (('elective_skill', i), ('elective_skill', j))))
+            attributes = ((effects.attribute, 1),) if effects.attribute is not None else ()
+            for chosen, picks in picked:
+                for p, skills, new_career, extra_rolls in chosen:
+                    outcomes.append(Outcome(p, label, attributes, skills, new_career,
+                                            dice=(((roll_layout[name],), values),), picks=picks,
+                                            extra_rolls=extra_rolls))
+        return outcomes
+
+    def war_story_outcomes(self, table, career) -> list:
+        outcomes = []
+        for entry, values in roll_groups(table):
+            label = entry_label(entry, 0)
+            self.labels['war_story'].add(label)
+            branches = [(len(values) / 20, (), career, ())]
+            for skill in entry[1].split(' to ')[1].split(' and '):
+                branches = self.add_skills(branches, skill_token(skill), 1)
+            for p, skills, new_career, extra_rolls in branches:
+                outcomes.append(Outcome(p, label, skills=skills, career=new_career,
+                                        dice=(((roll_layout['war_story'],), values),), extra_rolls=extra_rolls))
+        return outcomes
+
+
+class LifePathPlan:
+    """The rolls and the attribute and skill choices drawn for one constrained character. A CharacterMaker given a
+    plan takes its dice and these choices from it; every other choice is made at random as usual."""
+    def __init__(self):
+        self.dice = [0] * roll_count
+        self.extra_rolls = deque()
+        self.picks = defaultdict(deque)
+
+    def roll(self) -> int:
+        return self.extra_rolls.popleft()
+
+    def pick(self, kind: str):
+        """The planned index for the next choice of this kind, or None if the plan leaves it free."""
+        planned = self.picks.get(kind)
+        return planned.popleft() if planned else None
+
+
+class OutcomeGroup:
+    """Outcomes of a step with the same effect on the constrained quantities and the same context afterwards."""
+    __slots__ = ('p', 'delta', 'career', 'caste', 'outcomes', 'weights')
+
+    def __init__(self, delta: tuple, career, caste):
+        self.p = 0.0
+        self.delta = delta
+        self.career = career
+        self.caste = caste
+        self.outcomes = []
+        self.weights = []
+
+    def add(self, outcome: Outcome):
+        self.p += outcome.p
+        self.outcomes.append(outcome)
+        self.weights.append(self.p)
+
+
+class ConstrainedPaths:
+    """Draws life paths that meet a set of constraints, each with exactly its probability among unconstrained
+    full-auto characters that happen to meet them, without generating and discarding the others.
+
+    Each step only needs to track the constrained attributes and skills (capped just past their bounds, since they
+    only rise before XP), the career skill and the caste. For every step and tracked state, the probability that
+    the rest of the life path can still meet the constraints is computed once, by working back from the last step.
+    A plan then draws each step's outcome in proportion to its own probability times that of the constraints still
+    being met afterwards, which is the distribution conditioned on the constraints. Drawing a plan costs the same
+    however rare the constrained characters are, and constraints no character can meet are reported up front."""
+    def __init__(self, model: LifePathModel, constraints: Constraints):
+        self.setup(model, constraints)
+        if not self.probability:
+            infeasible = []
+            for spec in constraints.specs:
+                alone = ConstrainedPaths.__new__(ConstrainedPaths)
+                alone.setup(model, Constraints((spec,)))
+                if not alone.probability:
+                    infeasible.append(spec)
+            if infeasible:
+                message = "No character can meet the constraint%s %s" % ('s' if len(infeasible) > 1 else '',
+                                                                         ', '.join(infeasible))
+            else:
+                message = "No character can meet all of the constraints %s together" % ', '.join(constraints.specs)
+            raise InfeasibleConstraints(message, infeasible)
+
+    def setup(self, model: LifePathModel, constraints: Constraints):
+        self.model = model
+        self.constraints = constraints
+        self.allowed = {}
+        for step, filters in constraints.steps.items():
+            labels = {flat_name(label): label for label in model.labels[step]}
+            allowed = set(labels)
+            for include, entries in filters:
+                unknown = entries - set(labels)
+                if unknown:
+                    raise ConstraintError("Unknown %s %s. Choose from: %s" % (
+                        step.replace('_', ' '), ', '.join(sorted(unknown)), ', '.join(sorted(labels.values()))))
+                allowed = allowed & entries if include else allowed - entries
+            self.allowed[step] = allowed
+        self.standing = constraints.ranges.get(('standing', None))
+        self.tracked = [key for key in constraints.ranges if key[0] != 'standing']
+        self.bounds = [constraints.ranges[key] for key in self.tracked]
+        self.caps = [high + 1 if high is not None else low for low, high in self.bounds]
+        positions = {key: i for i, key in enumerate(self.tracked)}
+        self.attribute_positions = {k[1]: i for k, i in positions.items() if k[0] == 'attribute'}
+        self.skill_positions = {k[1]: i for k, i in positions.items() if k[0] == 'skill'}
+        self.groups = {}
+        self.memo = {}
+        start = tuple(min(base_attribute if kind == 'attribute' else 0, cap)
+                      for (kind, index), cap in zip(self.tracked, self.caps))
+        self.start = (None, None, start)
+        self.probability = self.satisfiable(0, self.start)
+
+    def step_groups(self, stage: int, career, caste) -> list:
+        """The allowed outcomes of a step, grouped by their effect on the tracked state."""
+        key = (stage, career, caste)
+        if key not in self.groups:
+            name = stage_names[stage]
+            by_context = self.model.outcomes[name]
+            outcomes = by_context[caste if name == 'caste_story' else career if len(by_context) > 1 else None]
+            allowed = self.allowed.get(name)
+            grouped = {}
+            for outcome in outcomes:
+                if allowed is not None and flat_name(outcome.label) not in allowed:
+                    continue
+                if outcome.standing is not None and self.standing is not None:
+                    low, high = self.standing
+                    if (low is not None and outcome.standing < low) or (high is not None and outcome.standing > high):
+                        continue
+                delta = [0] * len(self.tracked)
+                for index, amount in outcome.attributes:
+                    if index in self.attribute_positions:
+                        delta[self.attribute_positions[index]] += amount
+                for index, amount in outcome.skills:
+                    if index in self.skill_positions:
+                        delta[self.skill_positions[index]] += amount
+                # The caste only matters until its story has been rolled
+                after_caste = outcome.caste if name == 'caste' else None
+                group_key = (tuple(delta), outcome.career, after_caste)
+                if group_key not in grouped:
+                    grouped[group_key] = OutcomeGroup(tuple(delta), outcome.career, after_caste)
+                grouped[group_key].add(outcome)
+            self.groups[key] = list(grouped.values())
+        return self.groups[key]
+
+    def advance(self, state: tuple, group: OutcomeGroup):
+        """The tracked state after a group's outcomes, or None if a bound has already been passed for good."""
+        values = []
+        for value, change, cap, (low, high) in zip(state[2], group.delta, self.caps, self.bounds):
+            value = min(value + change, cap)
+            if high is not None and value > high:
+                return None
+            values.append(value)
+        return group.career, group.caste, tuple(values)
+
+    def satisfiable(self, stage: int, state: tuple) -> float:
+        """Probability that a life path in this state before the given step goes on to meet the constraints."""
+        key = (stage, state)
+        if key not in self.memo:
+            if stage == len(stage_names):
+                self.memo[key] = float(all(low is None or value >= low
+                                           for value, (low, high) in zip(state[2], self.bounds)))
+            else:
+                total = 0.0
+                for group in self.step_groups(stage, state[0], state[1]):
+                    after = self.advance(state, group)
+                    if after is not None:
+                        total += group.p * self.satisfiable(stage + 1, after)
+                self.memo[key] = total
+        return self.memo[key]
+
+    def plan(self, rng) -> LifePathPlan:
+        """Draws the rolls and choices of a life path that meets the constraints, using rng (random.Random-like)."""
+        plan = LifePathPlan()
+        state = self.start
+        for stage in range(len(stage_names)):
+            weighted = []
+            total = 0.0
+            for group in self.step_groups(stage, state[0], state[1]):
+                after = self.advance(state, group)
+                if after is not None:
+                    total += group.p * self.satisfiable(stage + 1, after)
+                    weighted.append((total, group, after))
+            point = rng.random() * total
+            chosen = next((w for w in weighted if w[0] > point), weighted[-1])
+            group, state = chosen[1], chosen[2]
+            point = rng.random() * group.p
+            outcome = group.outcomes[next((i for i, w in enumerate(group.weights) if w > point),
+                                          len(group.outcomes) - 1)]
+            for columns, candidates in outcome.dice:
+                for column, value in zip(columns, rng.choice(candidates)):
+                    plan.dice[column] = value
+            for kind, index in outcome.picks:
+                plan.picks[kind].append(index)
+            for candidates in outcome.extra_rolls:
+                plan.extra_rolls.append(rng.choice(candidates)[0])
+        return plan
+
+    def check(self, char):
+        """Raises ConstraintError if a generated character (before XP) does not meet the bounds, which would mean the
+        model has fallen out of step with the generator."""
+        for (kind, index), (low, high) in zip(self.tracked, self.bounds):
+            if kind == 'attribute':
+                name = attribute_order[index]
+                values = [char.attributes[name]]
+            else:
+                name = skill_order[index]
+                skill = char.skills.get(name, {'exp': 0, 'foc': 0})
+                values = [skill['exp'], skill['foc']]
+            if any((low is not None and v < low) or (high is not None and v > high) for v in values):
+                raise ConstraintError("Constrained character has %s %s, outside its bounds" % (name, values))
+        if self.standing is not None:
+            low, high = self.standing
+            if (low is not None and char.standing < low) or (high is not None and char.standing > high):
+                raise ConstraintError("Constrained character has standing %d, outside its bounds" % char.standing)
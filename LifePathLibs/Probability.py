@@ -0,0 +1,240 @@
+from collections import defaultdict
+from fractions import Fraction
+from functools import lru_cache
+from LifePathLibs.GenUtils import LifePathTables, MinValDict, bonus_damage_steps
+from LifePathLibs.SkillMaps import Skills, Attributes
+
+# Columns of the 14d20 roll made in CharacterMaker.__generate_steps_rand. Dice are popped off the end of the list, so
+# the first steps use the last columns.
+roll_layout = {'homeland': (13, 12), 'attributes': (11, 10), 'caste': 9, 'caste_story': 8, 'archetype': 7,
+               'nature': 6, 'education': 5, 'war_story': 4, 'garment': 3, 'belonging': 2, 'weapon': 1,
+               'provenance': 0}
+roll_count = 14
+
+attribute_order = sorted(a.value for a in Attributes)
+attribute_index = {name: i for i, name in enumerate(attribute_order)}
+skill_order = [s.value for s in Skills]
+skill_index = {name: i for i, name in enumerate(skill_order)}
+base_attribute = 7
+
+# Skill tokens that do not name a skill directly
+career_token = -1
+random_career_token = -2
+
+# Tables rolled on a single d20 and how each entry is labelled, matching the labels used by the statistics mode
+d20_steps = {'caste': ('castes', 0), 'archetype': ('archetypes', None), 'nature': ('natures', None),
+             'education': ('educations', None), 'war_story': ('war_stories', 0), 'garment': ('garments', None),
+             'belonging': ('belongings', None), 'weapon': ('weapons', None), 'provenance': ('provenance', None)}
+
+
+@lru_cache(maxsize=None)
+def dice_distribution(dice: int, sides: int=20) -> dict:
+    """Exact distribution of the total of dice rolls of a die with the given sides, by repeated convolution."""
+    dist = {0: Fraction(1)}
+    face = Fraction(1, sides)
+    for i in range(dice):
+        rolled = defaultdict(Fraction)
+        for total, p in dist.items():
+            for roll in range(1, sides + 1):
+                rolled[total + roll] += p * face
+        dist = dict(rolled)
+    return dist
+
+
+def split_and_clean_list(list_txt: str, list_sep: str) -> list:
+    return list_txt.split(list_sep)[1]\
+        .replace(', or ', ', ').replace(', and ', ', ').replace(', page 23', '').split(', ')
+
+
+def skill_token(skill: str) -> int:
+    if 'character’s career skill' in skill:
+        return career_token
+    elif 'random career skill' in skill:
+        return random_career_token
+    return skill_index[skill.strip()]
+
+
+def career_skill_name(career_txt: str) -> str:
+    return career_txt.split('in the ')[1].replace(' skill', '')
+
+
+class PathEffects:
+    """Skill and attribute changes from one archetype, nature or education entry, as skill tokens."""
+    def __init__(self, values: dict):
+        self.career = skill_token(career_skill_name(values['careerskill'])) if 'careerskill' in values else None
+        self.mandatory = [skill_token(s) for s in split_and_clean_list(values['mandatoryskills'], ' to ')] \
+            if 'mandatoryskills' in values else []
+        self.electives = [skill_token(s) for s in split_and_clean_list(values['electiveskills'], 'following skills: ')] \
+            if 'electiveskills' in values else []
+        self.attribute = attribute_index[values['attributeimprovement'].split(' to ')[1].strip()] \
+            if 'attributeimprovement' in values else None
+
+
+def entry_label(entry, field=None) -> str:
+    return (entry if field is None else entry[field]).strip()
+
+
+def table_distribution(table: MinValDict, dice: int=1, field=None) -> dict:
+    """Exact probability of each entry of a range table, labelled by entry (or one field of it). Every total the dice
+    can roll is mapped through the table's own lookup, so breakpoints that share an entry are summed."""
+    dist = defaultdict(Fraction)
+    for total, p in dice_distribution(dice).items():
+        dist[entry_label(table.get(total), field)] += p
+    return dict(dist)
+
+
+def combine(first: dict, second: dict) -> dict:
+    """Distribution of the element-wise sum of two independent tuple-valued outcomes."""
+    combined = defaultdict(Fraction)
+    for a, p in first.items():
+        for b, q in second.items():
+            combined[tuple(x + y for x, y in zip(a, b))] += p * q
+    return dict(combined)
+
+
+def marginal(joint: dict, position: int) -> dict:
+    dist = defaultdict(Fraction)
+    for outcome, p in joint.items():
+        dist[outcome[position]] += p
+    return dict(sorted(dist.items()))
+
+
+def total_variation(counts: dict, probabilities: dict) -> float:
+    """Total variation distance between observed counts and exact probabilities with the same keys: half the sum of
+    the absolute differences, so 0 for a perfect match and 1 for disjoint distributions."""
+    total = sum(counts.values())
+    keys = set(counts) | set(probabilities)
+    return sum(abs(counts.get(k, 0) / total - float(probabilities.get(k, 0))) for k in keys) / 2
+
+
+def as_floats(dist: dict) -> dict:
+    return {k: float(p) for k, p in dist.items()}
+
+
+class ExactDistributions:
+    """Exact outcome probabilities for the table-driven parts of a full-auto character, before any XP is spent.
+    Each distribution is computed from the tables the first time it is asked for, then memoized."""
+    def __init__(self, table_store: LifePathTables):
+        self.table_store = table_store
+        self._memo = {}
+
+    def memoized(self, key, build):
+        if key not in self._memo:
+            self._memo[key] = build()
+        return self._memo[key]
+
+    def homeland(self) -> dict:
+        return self.memoized('homeland', lambda: table_distribution(self.table_store.homelands, 2, 0))
+
+    def step(self, name: str) -> dict:
+        table_name, field = d20_steps[name]
+        return self.memoized(name, lambda: table_distribution(getattr(self.table_store, table_name), 1, field))
+
+    def caste_story(self) -> dict:
+        """Joint probability of each (caste, story), keyed 'caste / story'."""
+        def build():
+            dist = {}
+            for caste, p in self.step('caste').items():
+                for story, q in table_distribution(self.table_store.caste_stories.get(caste), 1, 0).items():
+                    dist['%s / %s' % (caste, story)] = p * q
+            return dist
+        return self.memoized('caste_story', build)
+
+    def standing(self) -> dict:
+        def build():
+            dist = defaultdict(Fraction)
+            for total, p in dice_distribution(1).items():
+                dist[int(self.table_store.castes.get(total)[3])] += p
+            return dict(sorted(dist.items()))
+        return self.memoized('standing', build)
+
+    def attribute_rolls(self) -> dict:
+        """Joint distribution of the attribute table entries for the two attribute rolls, as (first, second) tuples
+        of (aspect, mandatory1, mandatory2, optional1, optional2)."""
+        def build():
+            single = defaultdict(Fraction)
+            for total, p in dice_distribution(1).items():
+                single[tuple(v.strip() for v in self.table_store.attributes.get(total))] += p
+            return {(a, b): p * q for a, p in single.items() for b, q in single.items()}
+        return self.memoized('attribute_rolls', build)
+
+    def mandatory_attributes(self) -> dict:
+        """Joint distribution of the four mandatory attributes, as sorted tuples (so repeats show up twice)."""
+        def build():
+            dist = defaultdict(Fraction)
+            for (first, second), p in self.attribute_rolls().items():
+                dist[tuple(sorted(first[1:3] + second[1:3]))] += p
+            return dict(dist)
+        return self.memoized('mandatory_attributes', build)
+
+    def attribute_step(self) -> dict:
+        """Joint distribution of the attribute increases from the attributes step, as tuples in attribute_order.
+        Best is uniform over the four mandatories, worst is uniform over those that differ from best, and each
+        optional pair is an even choice, as in full-auto generation."""
+        def build():
+            dist = defaultdict(Fraction)
+            index = {name: i for i, name in enumerate(attribute_order)}
+            for (first, second), p in self.attribute_rolls().items():
+                mandatories = first[1:3] + second[1:3]
+                for best in mandatories:
+                    others = [m for m in mandatories if m != best]
+                    for worst in others:
+                        for opt1 in first[3:5]:
+                            for opt2 in second[3:5]:
+                                delta = [0] * len(attribute_order)
+                                for m in mandatories:
+                                    delta[index[m]] += 2
+                                delta[index[best]] += 1
+                                delta[index[worst]] -= 1
+                                delta[index[opt1]] += 1
+                                delta[index[opt2]] += 1
+                                dist[tuple(delta)] += p / len(mandatories) / len(others) / 4
+            return dict(dist)
+        return self.memoized('attribute_step', build)
+
+    def nature_attribute(self) -> dict:
+        """Distribution of the attribute improvement granted by the nature, as tuples in attribute_order."""
+        def build():
+            dist = defaultdict(Fraction)
+            for nature, p in self.step('nature').items():
+                values = self.table_store.natures_descriptions.get(nature)[1]
+                delta = [0] * len(attribute_order)
+                if 'attributeimprovement' in values:
+                    delta[attribute_order.index(values['attributeimprovement'].split(' to ')[1].strip())] += 1
+                dist[tuple(delta)] += p
+            return dict(dist)
+        return self.memoized('nature_attribute', build)
+
+    def attributes(self) -> dict:
+        """Joint distribution of the final attribute values, as tuples in attribute_order."""
+        base = {(base_attribute,) * len(attribute_order): Fraction(1)}
+        return self.memoized('attributes', lambda: combine(combine(base, self.attribute_step()),
+                                                           self.nature_attribute()))
+
+    def attribute(self, name: str) -> dict:
+        return self.memoized(('attribute', name), lambda: marginal(self.attributes(), attribute_order.index(name)))
+
+    def bonus_damage(self, attribute_name: str) -> dict:
+        """Distribution of the bonus damage derived from an attribute (Brawn for melee, Awareness for ranged and
+        Personality for presence)."""
+        def build():
+            bonus_table = MinValDict()
+            bonus_table.update(bonus_damage_steps)
+            dist = defaultdict(Fraction)
+            for value, p in self.attribute(attribute_name).items():
+                dist[bonus_table[value]] += p
+            return dict(sorted(dist.items()))
+        return self.memoized(('bonus_damage', attribute_name), build)
+
+    def report(self) -> dict:
+        """Every distribution as floats, laid out like the statistics mode report."""
+        steps = {'homeland': self.homeland(), 'caste': self.step('caste'), 'caste_story': self.caste_story()}
+        steps.update((name, self.step(name)) for name in d20_steps if name != 'caste')
+        report = {'steps': {k: as_floats(v) for k, v in steps.items()},
+                  'mandatory_attributes': {', '.join(k): float(p) for k, p in self.mandatory_attributes().items()},
+                  'attributes': {name: as_floats(self.attribute(name)) for name in attribute_order},
+                  'standing': as_floats(self.standing())}
+        for stat, attribute_name in (('bonus_melee', 'Brawn'), ('bonus_ranged', 'Awareness'),
+                                     ('bonus_presence', 'Personality')):
+            report[stat] = as_floats(self.bonus_damage(attribute_name))
+        return report
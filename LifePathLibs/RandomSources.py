@@ -0,0 +1,312 @@
+import asyncio
+import random
+import secrets
+import ssl
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections import deque
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+# Needs 3 formatted int values: number to generate, min value, max value. 13, 1, 20 for 13d20
+rand_api_path = "https://www.random.org/integers/?num=%d&min=%d&max=%d&col=1&base=10&format=plain&rnd=new"
+
+
+class SourceMetrics:
+    """Fetch and stall timings for a remote random source. A stall is any time generation spent waiting on the
+    network for random values."""
+    def __init__(self):
+        self.fetches = 0
+        self.fetch_time = 0.0
+        self.max_fetch_time = 0.0
+        self.fetch_failures = 0
+        self.stalls = 0
+        self.stall_time = 0.0
+        self.fallback_values = 0
+
+    def record_fetch(self, latency: float):
+        self.fetches += 1
+        self.fetch_time += latency
+        self.max_fetch_time = max(self.max_fetch_time, latency)
+
+    def record_stall(self, waited: float):
+        self.stalls += 1
+        self.stall_time += waited
+
+    def summary(self) -> dict:
+        return {'fetches': self.fetches, 'fetch_failures': self.fetch_failures,
+                'mean_fetch_latency': self.fetch_time / self.fetches if self.fetches else 0.0,
+                'max_fetch_latency': self.max_fetch_time, 'stalls': self.stalls, 'stall_time': self.stall_time,
+                'fallback_values': self.fallback_values}
+
+
+class EntropyPool:
+    """Buffer of raw random values fetched from a remote API in large blocks. Values are always fetched over the
+    same fixed range, then mapped onto whatever range is asked for by rejection sampling, so every value in the range
+    is equally likely. The buffer is refilled with another block whenever it drops to the low-water mark.
+
+    A failed fetch raises, unless there is a fallback: then raw values come from the fallback PRNG, and no more fetches
+    are tried for retry_delay seconds."""
+    raw_bits = 16
+    raw_range = 1 << raw_bits
+
+    def __init__(self, api_path: str=rand_api_path, block_size: int=1000, low_water: int=50,
+                 fallback: random.Random=None, retry_delay: float=0.5):
+        self.api_path = api_path
+        self.block_size = block_size
+        self.low_water = low_water
+        self.fallback = fallback
+        self.retry_delay = retry_delay
+        self.retry_at = 0.0
+        self.buffer = deque()
+        self.metrics = SourceMetrics()
+
+    def __getstate__(self):
+        # Buffered values must never be handed out twice, so a copy (e.g. one sent to a worker process) starts empty.
+        # For the same reason it falls back on a freshly seeded PRNG, rather than on a copy of the same stream.
+        state = self.__dict__.copy()
+        state['buffer'] = deque()
+        if self.fallback is not None:
+            state['fallback'] = random.Random(secrets.randbits(64))
+        return state
+
+    def fetch_block(self) -> list:
+        with urllib.request.urlopen(self.api_path % (self.block_size, 0, self.raw_range - 1)) as randoms:
+            return parse_block(randoms.read())
+
+    def refill(self):
+        start = time.perf_counter()
+        try:
+            self.buffer.extend(self.fetch_block())
+        except (OSError, ValueError):
+            if self.fallback is None:
+                raise
+            self.metrics.fetch_failures += 1
+            self.retry_at = time.perf_counter() + self.retry_delay
+        else:
+            self.metrics.record_fetch(time.perf_counter() - start)
+        finally:
+            self.metrics.record_stall(time.perf_counter() - start)  # Every synchronous refill holds up generation
+
+    def raw_value(self) -> int:
+        while len(self.buffer) <= self.low_water and time.perf_counter() >= self.retry_at:
+            self.refill()
+        if self.buffer:
+            return self.buffer.popleft()
+        self.metrics.fallback_values += 1
+        return self.fallback.getrandbits(self.raw_bits)
+
+    def randint(self, min_val: int, max_val: int) -> int:
+        span = max_val - min_val + 1
+        if span <= 1:
+            return min_val
+        # Enough raw words to cover the span, and the largest multiple of the span that fits in them. Anything at or
+        # above that multiple would over-weight the low end of the range, so it is thrown away and redrawn.
+        words = 1
+        while self.raw_range ** words < span:
+            words += 1
+        total = self.raw_range ** words
+        limit = total - total % span
+        while True:
+            val = 0
+            for i in range(words):
+                val = (val << self.raw_bits) | self.raw_value()
+            if val < limit:
+                return min_val + val % span
+
+    def randints(self, min_val: int, max_val: int, num_vals: int) -> list:
+        return [self.randint(min_val, max_val) for i in range(num_vals)]
+
+
+class AsyncPrefetchSource(EntropyPool):
+    """EntropyPool that fetches blocks on a background asyncio event loop over one persistent HTTP connection. The
+    next block is requested as soon as the buffer drops below the low-water mark, so it normally arrives before the
+    current one runs out and generation never waits on the network.
+
+    If the buffer does run dry, generation waits for the in-flight block for up to deadline seconds. After that it
+    falls back to raw values from the local PRNG until the block arrives. A deadline of None always waits."""
+    def __init__(self, api_path: str=rand_api_path, block_size: int=1000, low_water: int=500, deadline: float=None,
+                 fallback: random.Random=None, retry_delay: float=0.5):
+        super(AsyncPrefetchSource, self).__init__(api_path, block_size, low_water, fallback or random.Random(),
+                                                  retry_delay)
+        self.deadline = deadline
+        self.falling_back = False
+        self.loop = None
+        self.thread = None
+        self.pending = None
+        self.reader = None
+        self.writer = None
+
+    def __getstate__(self):
+        state = super(AsyncPrefetchSource, self).__getstate__()
+        state.update(falling_back=False, loop=None, thread=None, pending=None, reader=None, writer=None)
+        return state
+
+    def start(self):
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+            self.thread = threading.Thread(target=self.loop.run_forever, name='random-prefetch', daemon=True)
+            self.thread.start()
+
+    def close(self):
+        if self.loop is None:
+            return
+        if self.pending is not None:
+            self.pending.cancel()
+        asyncio.run_coroutine_threadsafe(self.close_connection(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.loop = self.thread = self.pending = None
+
+    def prefetch(self):
+        # After a failed fetch the next one waits for retry_delay, rather than hammering a struggling server
+        if self.pending is None and time.perf_counter() >= self.retry_at:
+            self.start()
+            self.pending = asyncio.run_coroutine_threadsafe(self.fetch_block_async(), self.loop)
+
+    def collect(self):
+        """Moves a finished prefetch into the buffer. A failed fetch is dropped, and the next prefetch retries."""
+        pending, self.pending = self.pending, None
+        try:
+            self.buffer.extend(pending.result())
+            self.falling_back = False
+        except Exception:
+            self.metrics.fetch_failures += 1
+            self.retry_at = time.perf_counter() + self.retry_delay
+
+    def raw_value(self) -> int:
+        if self.pending is not None and self.pending.done():
+            self.collect()
+        if not self.buffer and not self.falling_back:
+            self.wait_for_block()
+        if self.buffer:
+            value = self.buffer.popleft()
+        else:
+            self.metrics.fallback_values += 1
+            value = self.fallback.getrandbits(self.raw_bits)
+        # Checked after taking the value, so the next block is on its way as soon as the buffer drops below the mark
+        if len(self.buffer) < self.low_water:
+            self.prefetch()
+        return value
+
+    def wait_for_block(self):
+        start = time.perf_counter()
+        try:
+            while not self.buffer:
+                self.prefetch()
+                remaining = None if self.deadline is None else self.deadline - (time.perf_counter() - start)
+                if self.pending is None:
+                    pause = self.retry_at - time.perf_counter()
+                    if remaining is not None and remaining < pause:
+                        self.falling_back = True
+                        return
+                    time.sleep(max(0.0, pause))
+                    continue
+                try:
+                    self.pending.result(timeout=remaining)
+                except FutureTimeoutError:
+                    self.falling_back = True
+                    return
+                except Exception:
+                    if self.deadline is None:
+                        self.collect()
+                        raise  # With no fallback configured, a failed fetch is an error just as for EntropyPool
+                self.collect()
+                if self.deadline is not None and not self.buffer and time.perf_counter() - start >= self.deadline:
+                    self.falling_back = True
+                    return
+        finally:
+            self.metrics.record_stall(time.perf_counter() - start)
+
+    async def fetch_block_async(self) -> list:
+        url = urllib.parse.urlsplit(self.api_path % (self.block_size, 0, self.raw_range - 1))
+        target = '%s?%s' % (url.path or '/', url.query) if url.query else url.path or '/'
+        start = time.perf_counter()
+        for attempt in range(2):
+            # The kept-alive connection may have been closed by the server since the last block, so retry once on a
+            # fresh connection before giving up
+            try:
+                if self.writer is None:
+                    port = url.port or (443 if url.scheme == 'https' else 80)
+                    context = ssl.create_default_context() if url.scheme == 'https' else None
+                    self.reader, self.writer = await asyncio.open_connection(url.hostname, port, ssl=context)
+                body, keep_alive = await http_get(self.reader, self.writer, url.netloc, target)
+                if not keep_alive:
+                    await self.close_connection()
+                break
+            except (OSError, EOFError):
+                await self.close_connection()
+                if attempt:
+                    raise
+            except ValueError:
+                await self.close_connection()  # An error status or a garbled response: the server is not retried
+                raise
+        self.metrics.record_fetch(time.perf_counter() - start)
+        return parse_block(body)
+
+    async def close_connection(self):
+        writer, self.reader, self.writer = self.writer, None, None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+
+async def http_get(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, host: str, target: str):
+    """Minimal HTTP/1.1 GET over an open connection. Returns the body, and whether the connection can be reused."""
+    writer.write(('GET %s HTTP/1.1\r\nHost: %s\r\nConnection: keep-alive\r\n\r\n' % (target, host)).encode('ascii'))
+    await writer.drain()
+    status = (await reader.readline()).split(None, 2)
+    if len(status) < 2:
+        raise EOFError("Connection closed before a response was received")
+    if status[1] != b'200':
+        raise ValueError("Random source returned HTTP %s" % status[1].decode('ascii', 'replace'))
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    keep_alive = headers.get('connection', '').lower() != 'close' and status[0] != b'HTTP/1.0'
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        body = b''
+        while True:
+            chunk_len = int((await reader.readline()).split(b';')[0], 16)
+            if not chunk_len:
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass  # Skip trailers
+                break
+            body += await reader.readexactly(chunk_len)
+            await reader.readline()
+    elif 'content-length' in headers:
+        body = await reader.readexactly(int(headers['content-length']))
+    else:
+        body = await reader.read()
+        keep_alive = False
+    return body, keep_alive
+
+
+def parse_block(body: bytes) -> list:
+    return [int(n) for n in body.strip().split(b'\n')]
+
+
+_random_source = None
+
+
+def get_random_source():
+    """The source used for true-random values: anything with a randints(min_val, max_val, num_vals) method. Defaults
+    to an EntropyPool over random.org, created on first use."""
+    global _random_source
+    if _random_source is None:
+        _random_source = EntropyPool()
+    return _random_source
+
+
+def set_random_source(source):
+    global _random_source
+    _random_source = source
@@ -0,0 +1,165 @@
+import hashlib
+from LifePathLibs.RosterExport import RosterWriter
+from LifePathLibs.TableCompiler import source_files
+
+# Replay record layout, all integers as unsigned LEB128 varints:
+#   flags | seed | xp | choice count | choice indices... | name length | UTF-8 name
+# and, for a constrained character, constraint count | (length | UTF-8 constraint)...
+# and, for a character with XP goals, goal count | (length | UTF-8 goal)...
+# A replay log is magic | version | table fingerprint (8 bytes), then each record prefixed with its length.
+replay_magic = b'LPGREPLAY'
+replay_version = 1
+flag_full_auto = 1
+flag_constrained = 2
+flag_optimized = 4
+
+
+class ReplayError(ValueError):
+    """A replayed character did not make the same choices as the recording, e.g. because the tables changed."""
+
+
+def table_fingerprint() -> bytes:
+    """Short hash of the source tables. Replays are only exact against the tables the characters were made with."""
+    digest = hashlib.sha256()
+    for source_name in sorted(source_files):
+        with open(source_files[source_name], 'rb') as source_in:
+            digest.update(source_in.read())
+    return digest.digest()[:8]
+
+
+def write_varint(out: bytearray, value: int):
+    if value < 0:
+        raise ValueError("Replay records only hold non-negative integers")
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data: bytes, pos: int):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+class ReplayRecord:
+    """Everything needed to regenerate a character exactly: the seed the RNG was reset to before generation, the
+    index picked at each choice, the XP budget, the name and any constraints and XP goals it was generated under."""
+    __slots__ = ('seed', 'full_auto', 'xp', 'choices', 'name', 'constraints', 'xp_goals')
+
+    def __init__(self, seed: int, full_auto: bool, xp: int, choices: tuple, name: str='', constraints: tuple=(),
+                 xp_goals: tuple=()):
+        self.seed = seed
+        self.full_auto = full_auto
+        self.xp = xp
+        self.choices = tuple(choices)
+        self.name = name
+        self.constraints = tuple(constraints)
+        self.xp_goals = tuple(xp_goals)
+
+    def __eq__(self, other):
+        return isinstance(other, ReplayRecord) and all(getattr(self, f) == getattr(other, f) for f in self.__slots__)
+
+    def __repr__(self):
+        return 'ReplayRecord(%s)' % ', '.join('%s=%r' % (f, getattr(self, f)) for f in self.__slots__)
+
+    def pack(self) -> bytes:
+        out = bytearray()
+        write_varint(out, (flag_full_auto if self.full_auto else 0) | (flag_constrained if self.constraints else 0) |
+                     (flag_optimized if self.xp_goals else 0))
+        write_varint(out, self.seed)
+        write_varint(out, self.xp)
+        write_varint(out, len(self.choices))
+        for choice in self.choices:
+            write_varint(out, choice)
+        name = self.name.encode('utf-8')
+        write_varint(out, len(name))
+        out += name
+        for strings in (self.constraints, self.xp_goals):
+            if strings:
+                write_varint(out, len(strings))
+                for string in strings:
+                    string = string.encode('utf-8')
+                    write_varint(out, len(string))
+                    out += string
+        return bytes(out)
+
+    @classmethod
+    def unpack(cls, data: bytes) -> 'ReplayRecord':
+        flags, pos = read_varint(data, 0)
+        seed, pos = read_varint(data, pos)
+        xp, pos = read_varint(data, pos)
+        count, pos = read_varint(data, pos)
+        choices = []
+        for i in range(count):
+            choice, pos = read_varint(data, pos)
+            choices.append(choice)
+        name_len, pos = read_varint(data, pos)
+        name = data[pos:pos + name_len].decode('utf-8')
+        pos += name_len
+        constraints, xp_goals = [], []
+        for flag, strings in ((flag_constrained, constraints), (flag_optimized, xp_goals)):
+            if flags & flag:
+                count, pos = read_varint(data, pos)
+                for i in range(count):
+                    length, pos = read_varint(data, pos)
+                    strings.append(data[pos:pos + length].decode('utf-8'))
+                    pos += length
+        if pos != len(data):
+            raise ValueError("Malformed replay record")
+        return cls(seed, bool(flags & flag_full_auto), xp, choices, name, constraints, xp_goals)
+
+
+def replay_record(char) -> ReplayRecord:
+    """The replay record of a CharacterMaker or CharacterRecord."""
+    if char.seed is None or char.true_random:
+        raise ValueError("Only characters generated from a known seed with psuedo-random numbers can be replayed")
+    return ReplayRecord(char.seed, char.full_auto, char.xp + char.xp_spent, char.choice_log, char.name,
+                        char.constraints, char.xp_goals)
+
+
+class ReplayLogWriter(RosterWriter):
+    """Writes each character's replay record to a replay log file."""
+    def __init__(self, path: str):
+        self.log_out = open(path, 'wb')
+        self.log_out.write(replay_magic + bytes((replay_version,)) + table_fingerprint())
+
+    def add(self, char):
+        packed = replay_record(char).pack()
+        prefix = bytearray()
+        write_varint(prefix, len(packed))
+        self.log_out.write(prefix + packed)
+
+    def close(self):
+        self.log_out.close()
+
+
+def read_replay_log(path: str, check_tables: bool=True):
+    """Yields the replay records from a replay log file, streaming it. Unless check_tables is off, a log made with
+    different tables is refused, since its characters could not be replayed exactly."""
+    with open(path, 'rb') as log_in:
+        header = log_in.read(len(replay_magic) + 1 + 8)
+        if header[:len(replay_magic)] != replay_magic or header[len(replay_magic):len(replay_magic) + 1] != \
+                bytes((replay_version,)):
+            raise ValueError("%s is not a replay log of a supported version" % path)
+        if check_tables and header[len(replay_magic) + 1:] != table_fingerprint():
+            raise ReplayError("%s was recorded with different tables" % path)
+        while True:
+            length = shift = 0
+            byte = log_in.read(1)
+            if not byte:
+                return
+            while byte[0] & 0x80:
+                length |= (byte[0] & 0x7f) << shift
+                shift += 7
+                byte = log_in.read(1)
+            length |= byte[0] << shift
+            packed = log_in.read(length)
+            if len(packed) != length:
+                raise ValueError("Truncated replay log %s" % path)
+            yield ReplayRecord.unpack(packed)
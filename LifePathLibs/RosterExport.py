@@ -0,0 +1,110 @@
+import io
+import json
+import sys
+import time
+from abc import ABC, abstractmethod
+
+record_fields = ('name', 'gender', 'age', 'height', 'homeland', 'languages', 'caste', 'caste_story', 'trait',
+                 'archetype', 'career_skill', 'nature', 'education', 'war_story', 'attribute_aspects', 'standing',
+                 'vigor', 'resolve', 'gold', 'bonus_melee', 'bonus_ranged', 'bonus_presence', 'equipment', 'xp_spent',
+                 'xp_spends')
+
+
+def character_record(char) -> dict:
+    """Structured, JSON-ready summary of a generated character."""
+    record = {field: getattr(char, field) for field in record_fields}
+    record['xp'] = char.xp + char.xp_spent
+    record['attributes'] = dict(char.attributes)
+    record['skills'] = {name: {'exp': skill['exp'], 'foc': skill['foc']} for name, skill in char.skills.items()}
+    record['talents'] = list(char.talents)
+    return record
+
+
+class RosterWriter(ABC):
+    """Base for bulk exporters: characters are added one at a time, and nothing is kept once it has been written."""
+    @abstractmethod
+    def add(self, char):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ArchiveRosterWriter(RosterWriter):
+    """Writes each character's FG XML sheet into a single zip or tar archive (chosen by the file extension: .zip, .tar,
+    .tar.gz/.tgz or .tar.bz2). Zip entries are streamed straight from the sheet writer; tar needs each entry's size up
+    front, so one sheet at a time is rendered in memory first. The archive and sheet modules are only imported once
+    an archive is actually written."""
+    def __init__(self, path: str):
+        import tarfile
+        import zipfile
+        self.path = path
+        self.entry_names = {}
+        if path.lower().endswith('.zip'):
+            self.zip_file = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
+            self.tar_file = None
+        else:
+            compression = next((c for ext, c in (('.tar.gz', 'gz'), ('.tgz', 'gz'), ('.tar.bz2', 'bz2'))
+                                if path.lower().endswith(ext)), '')
+            self.tar_file = tarfile.open(path, 'w|%s' % compression)
+            self.zip_file = None
+
+    def entry_name(self, char) -> str:
+        base = "FG_import_" + (char.name.replace(' ', '') or 'character')
+        count = self.entry_names.get(base, 0) + 1
+        self.entry_names[base] = count
+        return '%s.xml' % base if count == 1 else '%s_%d.xml' % (base, count)
+
+    def add(self, char):
+        import tarfile
+        from LifePathLibs.SheetMaker import CharacterSheet
+        sheet = CharacterSheet(char)
+        entry_name = self.entry_name(char)
+        if self.zip_file is not None:
+            with self.zip_file.open(entry_name, 'w') as entry_out, \
+                    io.TextIOWrapper(entry_out, encoding='utf-8') as xml_out:
+                sheet.write_fg_xml(xml_out)
+        else:
+            xml = sheet.create_fg_xml().encode('utf-8')
+            entry_info = tarfile.TarInfo(entry_name)
+            entry_info.size = len(xml)
+            entry_info.mtime = int(time.time())
+            self.tar_file.addfile(entry_info, io.BytesIO(xml))
+
+    def close(self):
+        if self.zip_file is not None:
+            self.zip_file.close()
+        else:
+            self.tar_file.close()
+
+
+class JsonLinesRosterWriter(RosterWriter):
+    """Writes one JSON character record per line to a file, or to stdout for '-'. Records are written and flushed in
+    chunks of chunk_size."""
+    def __init__(self, path: str, chunk_size: int=256):
+        self.owns_stream = path != '-'
+        self.stream = open(path, 'w', encoding='utf-8') if self.owns_stream else sys.stdout
+        self.chunk_size = chunk_size
+        self.pending = []
+
+    def add(self, char):
+        self.pending.append(json.dumps(character_record(char), ensure_ascii=False))
+        if len(self.pending) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.stream.write('\n'.join(self.pending) + '\n')
+            self.pending = []
+        self.stream.flush()
+
+    def close(self):
+        self.flush()
+        if self.owns_stream:
+            self.stream.close()
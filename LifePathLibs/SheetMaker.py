@@ -1,7 +1,10 @@
+import io
+import re
 from LifePathLibs import att_map, Attributes
 from os.path import join, dirname, realpath
 
 template_file = 'FG2MoreCoreTemplate.xmlt'
+template_field = re.compile(r'%\((\w+)\)([sd])|%%')
 # Template numbers = 5 digit number, starting at 00001
 
 ability_temp = '<id-%(ability_num)s><name type="string">%(ability_name)s</name>' \
@@ -28,9 +31,37 @@ attacks_temp = 'Unarmed: (Reach 1-Improvised-Stun-2D): %dd6,\\n' \
                'Intimidate: (Close-Mental-Stun-2D): %dd6,\\n'  # 2+bonus_melee, 2+ bonus_range, 2+ bonus_presence
 
 
+# Template split into (static text, field name, field format) segments, parsed once per process on first use
+_compiled_template = None
+
+
+def compile_template(template: str) -> list:
+    segments = []
+    static = []
+    pos = 0
+    for field in template_field.finditer(template):
+        static.append(template[pos:field.start()])
+        pos = field.end()
+        if field.group(1) is None:
+            static.append('%')  # Escaped literal %
+            continue
+        segments.append((''.join(static), field.group(1), '%' + field.group(2)))
+        static = []
+    static.append(template[pos:])
+    segments.append((''.join(static), None, None))
+    return segments
+
+
+def compiled_template() -> list:
+    global _compiled_template
+    if _compiled_template is None:
+        with open(join(dirname(realpath(__file__)), template_file)) as fg_template:
+            _compiled_template = compile_template(fg_template.read())
+    return _compiled_template
+
+
 class CharacterSheet:
     def __init__(self, char):
-        self.script_dir = dirname(realpath(__file__))
         # Declare all variables to be interpolated into the XML
         self.name = char.name
         self.race = char.homeland
@@ -64,63 +95,52 @@ class CharacterSheet:
     def format_attacks(self):
         return attacks_temp % (2 + self.bonus_melee, 2 + self.bonus_ranged, 2 + self.bonus_presence)
 
-    def read_template(self):
-        with open(join(self.script_dir, template_file)) as fg_template:
-            return fg_template.read()
-
     def create_fg_xml(self):
-        body_template = self.read_template()
-        formatter = self.create_template_formatter()
-        return body_template % formatter
-
-    def create_template_formatter(self):
+        xml_out = io.StringIO()
+        self.write_fg_xml(xml_out)
+        return xml_out.getvalue()
+
+    def write_fg_xml(self, xml_out):
+        """Streams the sheet to a file-like object, writing each list section piece by piece as it is generated."""
+        fields = self.create_scalar_formatter()
+        sections = {'abilities': self.iter_abilities, 'attributes_and_skills': self.iter_attributes_and_skills,
+                    'equipment': self.iter_equipment, 'languages': self.iter_languages}
+        for static, field_name, field_fmt in compiled_template():
+            xml_out.write(static)
+            if field_name in sections:
+                for piece in sections[field_name]():
+                    xml_out.write(piece)
+            elif field_name:
+                xml_out.write(field_fmt % (fields[field_name],))
+
+    def create_scalar_formatter(self):
         fmt_dict = {'char_age': self.char_age, 'char_summary': self.char_summary, 'renown': self.renown,
                     'name': self.name, 'standing': self.standing, 'bonus_ranged': self.bonus_ranged,
                     'bonus_melee': self.bonus_melee, 'bonus_presence': self.bonus_presence, 'vigor': self.vigor,
                     'resolve': self.resolve, 'race': self.race, 'notes': self.notes.replace('\n', '\\n'),
                     'gold': self.gold, 'gender': self.gender, 'height': self.height, 'attacks': self.attacks,
-                    'abilities': self.parse_abilities(),
-                    'attributes_and_skills': self.parse_attributes_and_skills(),
-                    'equipment': self.parse_equipment(),
-                    'languages': self.parse_langauges(),
                     'xp': self.xp, 'xp_spent': self.xp_spent
                     }
         return fmt_dict
 
-    def parse_langauges(self):
-        languages = ''
-        i = 1
-        for language in self.languages:
+    def iter_languages(self):
+        for i, language in enumerate(self.languages, 1):
             lang_fmt = {'language_num': '%05d' % i, 'language': language}
-            languages += language_temp % lang_fmt
-            i += 1
-        return languages
-
-    def parse_equipment(self):
-        equipment = ''
-        i = 1
-        for item_name in self.equipment:
+            yield language_temp % lang_fmt
+
+    def iter_equipment(self):
+        for i, item_name in enumerate(self.equipment, 1):
             equip_fmt = {'equip_num': '%05d' % i, 'item_name': item_name}
-            equipment += equip_temp % equip_fmt
-            i += 1
-        return equipment
-
-    def parse_abilities(self):
-        abilities = ''
-        i = 1
-        # print(self.talents)
-        for ability_name, ability_text in self.talents.items():
-            # print(ability)
+            yield equip_temp % equip_fmt
+
+    def iter_abilities(self):
+        for i, (ability_name, ability_text) in enumerate(self.talents.items(), 1):
             ability_fmt = {
                 'ability_num': '%05d' % i,
                 "ability_name": ability_name,
                 "ability_text": ability_text
             }
-            # ability_fmt['ability_name'] = ability_name
-            # ability_fmt['ability_text'] = ability_text
-            abilities += ability_temp % ability_fmt
-            i += 1
-        return abilities
+            yield ability_temp % ability_fmt
 
     def parse_attribute(self, attribute_name, att_num=1):
         attribute_val = self.char_attributes.get(attribute_name)
@@ -129,31 +149,32 @@ class CharacterSheet:
         skills = [s.value for s in att_map.get(Attributes[attribute_name.lower()])]
         att_fmt = {'att_skill_name': '%s - %d' % (attribute_name, attribute_val), 'foc_mod': 0,
                    'att_skill_val': attribute_val, 'att_skill_num': '%05d' % att_num}
-        att_body = att_skill_temp % att_fmt
+        att_body = [att_skill_temp % att_fmt]
 
         for skill in skills:
             att_num += 1
-            exp = self.char_skills[skill]['exp']
-            foc = self.char_skills[skill]['foc']
+            # .get rather than indexing, so that rendering never adds empty skills to the character's defaultdict
+            skill_vals = self.char_skills.get(skill) or {'exp': 0, 'foc': 0}
+            exp = skill_vals['exp']
+            foc = skill_vals['foc']
             skill_fmt = {'att_skill_num': '%05d' % att_num, 'foc_mod': foc, 'att_skill_val': attribute_val + exp}
             if exp or foc:
                 skill_fmt['att_skill_name'] = '%s - %dEXP/%dFOC' % (skill, exp, foc)
             else:
                 skill_fmt['att_skill_name'] = skill
-            att_body += att_skill_temp % skill_fmt
-        return att_body, att_num
+            att_body.append(att_skill_temp % skill_fmt)
+        return ''.join(att_body), att_num
 
-    def parse_attributes_and_skills(self):
-        attributes_and_skills = ''
+    def iter_attributes_and_skills(self):
         for cli_num, att_name in sorted(cli_list_map.items()):
             if att_name == 'Brawn/Willpower':
-                att_body = ''
+                att_bodies = []
                 att_num = 1
                 for attribute_name in att_name.split('/'):
                     body_tmp, num_tmp = self.parse_attribute(attribute_name, att_num)
-                    att_body += body_tmp
+                    att_bodies.append(body_tmp)
                     att_num += num_tmp
+                att_body = ''.join(att_bodies)
             else:
                 att_body, att_num = self.parse_attribute(att_name)
-            attributes_and_skills += cli_list_wrapper % {'att_map': cli_num, 'att_skill_body': att_body}
-        return attributes_and_skills
+            yield cli_list_wrapper % {'att_map': cli_num, 'att_skill_body': att_body}
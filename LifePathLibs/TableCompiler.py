@@ -0,0 +1,156 @@
+import hashlib
+import json
+import mmap
+import os
+import os.path
+import pickle
+import struct
+from contextlib import contextmanager
+from functools import partial
+from LifePathLibs.GenUtils import LifePathTables, MinValDict, import_tables, import_talents
+
+# Compiled table artifact layout:
+#   magic (8 bytes) | version, header length (struct header_fmt) | JSON header | section payloads
+# The header records the size, mtime and sha256 of each source .dat file the artifact was built from, and the offset,
+# length and sha256 of each section. Sections are pickles of fully normalized table objects, with the MinValDict roll
+# indexes already built, so loading one is a single read and unpickle. Each table, and the talent tree, has its own
+# section, so that only the tables something actually looks up are read.
+magic = b'LPGTABLE'
+artifact_version = 2
+table_section_prefix = 'table:'
+header_fmt = '<HI'
+
+script_dir = os.path.dirname(os.path.realpath(__file__))
+source_files = {'tables': os.path.join(script_dir, 'tables.dat'),
+                'talents': os.path.join(script_dir, 'talent_tree.dat')}
+compiled_table_file = os.path.join(script_dir, 'tables.compiled')
+
+
+def file_sha256(path: str) -> str:
+    with open(path, 'rb') as f_in:
+        return hashlib.sha256(f_in.read()).hexdigest()
+
+
+def source_info(path: str) -> dict:
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': file_sha256(path)}
+
+
+def source_is_fresh(path: str, info: dict) -> bool:
+    stat = os.stat(path)
+    if stat.st_size != info['size']:
+        return False
+    if stat.st_mtime_ns == info['mtime_ns']:
+        return True
+    # Touched but possibly unchanged (e.g. a fresh checkout), so fall back to comparing contents
+    return file_sha256(path) == info['sha256']
+
+
+def build_indexes(table_store: LifePathTables):
+    for table in vars(table_store).values():
+        if isinstance(table, MinValDict):
+            table.build_index()
+        elif isinstance(table, dict):
+            for nested in table.values():
+                if isinstance(nested, MinValDict):
+                    nested.build_index()
+
+
+def compile_tables(out_file: str=compiled_table_file) -> LifePathTables:
+    """Builds the table store from the source .dat files and writes it out as a compiled artifact."""
+    table_store = import_tables()
+    build_indexes(table_store)
+    payloads = {table_section_prefix + name: pickle.dumps(table, pickle.HIGHEST_PROTOCOL)
+                for name, table in table_store.table_dict().items()}
+    payloads['talents'] = pickle.dumps(table_store.talents, pickle.HIGHEST_PROTOCOL)
+    sections = {}
+    offset = 0
+    for section_name, payload in payloads.items():
+        sections[section_name] = {'offset': offset, 'length': len(payload),
+                                  'sha256': hashlib.sha256(payload).hexdigest()}
+        offset += len(payload)
+    header = json.dumps({'sources': {k: source_info(v) for k, v in source_files.items()},
+                         'sections': sections}).encode()
+    tmp_file = '%s.%d.tmp' % (out_file, os.getpid())
+    with open(tmp_file, 'wb') as compiled_out:
+        compiled_out.write(magic + struct.pack(header_fmt, artifact_version, len(header)) + header)
+        for payload in payloads.values():
+            compiled_out.write(payload)
+    os.replace(tmp_file, out_file)
+    return table_store
+
+
+def read_section(payload, section: dict):
+    if len(payload) != section['length'] or hashlib.sha256(payload).hexdigest() != section['sha256']:
+        raise ValueError("Compiled table section failed its checksum")
+    return pickle.loads(payload)
+
+
+@contextmanager
+def mapped_artifact(compiled_file: str):
+    """Memory-maps a compiled artifact and yields (view, header), with the header's section offsets made absolute.
+    Yields (None, None) if the file is not an artifact of the current version."""
+    with open(compiled_file, 'rb') as compiled_in, \
+            mmap.mmap(compiled_in.fileno(), 0, access=mmap.ACCESS_READ) as mapped, \
+            memoryview(mapped) as view:
+        prefix_len = len(magic) + struct.calcsize(header_fmt)
+        if view[:len(magic)] != magic:
+            yield None, None
+            return
+        version, header_len = struct.unpack_from(header_fmt, view, len(magic))
+        if version != artifact_version:
+            yield None, None
+            return
+        header = json.loads(bytes(view[prefix_len:prefix_len + header_len]))
+        for section in header['sections'].values():
+            section['offset'] += prefix_len + header_len
+        yield view, header
+
+
+def source_table(name: str):
+    return getattr(import_tables(), name)
+
+
+def load_compiled_section(compiled_file: str, section: dict, fallback):
+    """Reads one section of a compiled artifact, falling back to building it from the source .dat files if the
+    artifact has been replaced or damaged since the table store was loaded from it (caught by the checksum)."""
+    try:
+        with open(compiled_file, 'rb') as compiled_in:
+            compiled_in.seek(section['offset'])
+            return read_section(compiled_in.read(section['length']), section)
+    except (OSError, ValueError, pickle.UnpicklingError):
+        return fallback()
+
+
+def load_compiled_tables(compiled_file: str=compiled_table_file):
+    """Loads the table store from a compiled artifact, or returns None if it is missing or stale. Only the header is
+    read here: each table, and the talent tree, is read the first time something looks it up."""
+    try:
+        with mapped_artifact(compiled_file) as (view, header):
+            if view is None:
+                return None
+            for source_name, path in source_files.items():
+                if not source_is_fresh(path, header['sources'][source_name]):
+                    return None
+            sections = header['sections']
+    except (OSError, ValueError, KeyError, struct.error):
+        return None
+    table_loaders = {name[len(table_section_prefix):]: partial(load_compiled_section, compiled_file, section,
+                                                              partial(source_table, name[len(table_section_prefix):]))
+                     for name, section in sections.items() if name.startswith(table_section_prefix)}
+    if 'talents' not in sections or not table_loaders:
+        return None
+    return LifePathTables.from_tables({}, partial(load_compiled_section, compiled_file, sections['talents'],
+                                                  import_talents), table_loaders)
+
+
+def load_table_store(compiled_file: str=compiled_table_file) -> LifePathTables:
+    """Loads the compiled table store, recompiling it first if it is missing or older than the source .dat files."""
+    table_store = load_compiled_tables(compiled_file)
+    if table_store is None:
+        try:
+            table_store = compile_tables(compiled_file)
+        except OSError:
+            # Read-only install, so just use the freshly built tables without caching them
+            table_store = import_tables()
+    return table_store
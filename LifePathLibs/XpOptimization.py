@@ -0,0 +1,541 @@
+from collections import defaultdict
+from itertools import chain, product
+from LifePathLibs.GenUtils import flat_name
+from LifePathLibs.SkillMaps import Skills, Attributes, skill_map
+
+# Every XP cost is a multiple of this: attributes cost hundreds, skills two hundreds and talents two hundreds less 25
+# per point of focus. Budgets are counted in these units.
+cost_unit = 25
+# Scores closer than this are treated as equal, so that the cheaper of two equally good builds is kept
+tolerance = 1e-9
+unreachable = float('-inf')
+
+skill_keys = {flat_name(s.value): s.value for s in Skills}
+skill_names = set(skill_keys.values())
+attribute_keys = {flat_name(a.value): a.value for a in Attributes}
+
+
+class XpObjective:
+    """What an optimized XP spend aims for. A build scores the sum of a value for the level of each attribute, each
+    skill's expertise and focus, and each talent it has, so that the search can weigh every purchase on its own.
+    Subclasses override the values that matter to them; objectives can be added together."""
+    def attribute_value(self, name: str, level: int) -> float:
+        return 0.0
+
+    def expertise_value(self, skill: str, level: int) -> float:
+        return 0.0
+
+    def focus_value(self, skill: str, level: int) -> float:
+        return 0.0
+
+    def talent_value(self, talent) -> float:
+        return 0.0
+
+    def __add__(self, other: 'XpObjective') -> 'XpObjective':
+        return CombinedObjective(self, other)
+
+
+class CombinedObjective(XpObjective):
+    def __init__(self, *objectives):
+        self.objectives = objectives
+
+    def attribute_value(self, name: str, level: int) -> float:
+        return sum(o.attribute_value(name, level) for o in self.objectives)
+
+    def expertise_value(self, skill: str, level: int) -> float:
+        return sum(o.expertise_value(skill, level) for o in self.objectives)
+
+    def focus_value(self, skill: str, level: int) -> float:
+        return sum(o.focus_value(skill, level) for o in self.objectives)
+
+    def talent_value(self, talent) -> float:
+        return sum(o.talent_value(talent) for o in self.objectives)
+
+
+class SkillTestObjective(XpObjective):
+    """The dice pool for tests of one skill, as expected successes per d20: a die succeeds on the skill's attribute
+    plus its expertise or under, and scores a second success on its focus or under. Talents of the skill add
+    talent_value each."""
+    def __init__(self, skill: str, talent_value: float=0.05):
+        self.skill = skill
+        self.attribute = skill_map[Skills(skill)].value
+        self.per_talent = talent_value
+
+    def attribute_value(self, name: str, level: int) -> float:
+        return level / 20 if name == self.attribute else 0.0
+
+    def expertise_value(self, skill: str, level: int) -> float:
+        return level / 20 if skill == self.skill else 0.0
+
+    def focus_value(self, skill: str, level: int) -> float:
+        return min(level, 20) / 20 if skill == self.skill else 0.0
+
+    def talent_value(self, talent) -> float:
+        return self.per_talent if talent.skill == self.skill else 0.0
+
+
+class AttributeObjective(XpObjective):
+    def __init__(self, attribute: str, weight: float=1.0):
+        self.attribute = attribute
+        self.weight = weight
+
+    def attribute_value(self, name: str, level: int) -> float:
+        return level * self.weight if name == self.attribute else 0.0
+
+
+class TalentGoal(XpObjective):
+    """Reaching the named talents, along with the talents and skill levels they require. Each is worth more than
+    any amount of anything else, so other objectives only get the XP the goal does not need."""
+    def __init__(self, *names, value: float=1000.0):
+        self.keys = {flat_name(name) for name in names}
+        self.value = value
+
+    def talent_value(self, talent) -> float:
+        return self.value if flat_name(talent.name) in self.keys else 0.0
+
+
+def objective_from_specs(specs) -> XpObjective:
+    """The sum of the objectives named by specs: a skill name for its dice pool, an attribute name to raise it, or
+    talent=Name to reach a talent."""
+    objectives = []
+    for spec in specs:
+        name, separator, value = spec.partition('=')
+        if separator and flat_name(name) == 'talent':
+            objectives.append(TalentGoal(*value.split('|')))
+        elif flat_name(spec) in skill_keys:
+            objectives.append(SkillTestObjective(skill_keys[flat_name(spec)]))
+        elif flat_name(spec) in attribute_keys:
+            objectives.append(AttributeObjective(attribute_keys[flat_name(spec)]))
+        else:
+            raise ValueError("Unknown XP objective %r: expected a skill, an attribute or talent=Name" % spec)
+    return objectives[0] if len(objectives) == 1 else CombinedObjective(*objectives)
+
+
+class XpPlan:
+    """An optimized XP spend: the purchases in the order they can be made, as (type, key, cost) like the random
+    spend's frontier, and the objective score they add."""
+    def __init__(self, purchases: list, score: float):
+        self.purchases = purchases
+        self.score = score
+
+    @property
+    def cost(self) -> int:
+        return sum(cost for upg_type, key, cost in self.purchases)
+
+
+class Track:
+    """The levels one attribute, skill expertise or skill focus can be raised to within the budget: the cumulative
+    cost (in cost units) and the score gained for each number of raises."""
+    def __init__(self, kind: str, name: str, start: int, step_cost, value, budget: int):
+        self.kind = kind
+        self.name = name
+        self.start = start
+        self.steps = []  # XP cost of each raise
+        self.options = [(0, 0.0)]
+        base = value(start)
+        spent = 0
+        level = start
+        while True:
+            step = step_cost(level)
+            if spent + step // cost_unit > budget:
+                break
+            spent += step // cost_unit
+            level += 1
+            self.steps.append(step)
+            self.options.append((spent, value(level) - base))
+
+    def useful(self) -> bool:
+        return any(gain > tolerance for spent, gain in self.options)
+
+    def purchases(self, raises: int) -> list:
+        upg_type = {'attribute': 'attributes', 'exp': 'skill_exp', 'foc': 'skill_foc'}[self.kind]
+        return [(upg_type, self.name, step) for step in self.steps[:raises]]
+
+
+def add_track(table: list, track) -> list:
+    """Multiple-choice knapsack step: table[b] is the best score within b units, and exactly one of the (cost, gain)
+    options of track (a Track, TalentGroup or TalentCluster) is taken; returns the new table and the option taken at
+    each b. Budgets no option fits score -inf."""
+    best = [unreachable] * len(table)
+    picks = [0] * len(table)
+    for option, (spent, gain) in enumerate(track.options):
+        for b in range(spent, len(table)):
+            candidate = table[b - spent] + gain
+            if candidate > best[b] + tolerance:
+                best[b] = candidate
+                picks[b] = option
+    return best, picks
+
+
+def add_items(table: list, items: tuple, keep: list=None) -> list:
+    """0/1 knapsack of (key, cost, value) items on top of table. If keep is given, it is filled with which items were
+    taken at each b, for reconstruction."""
+    table = list(table)
+    for key, spent, gain in items:
+        taken = [False] * len(table)
+        for b in range(len(table) - 1, spent - 1, -1):
+            candidate = table[b - spent] + gain
+            if candidate > table[b] + tolerance:
+                table[b] = candidate
+                taken[b] = True
+        if keep is not None:
+            keep.append(taken)
+    return table
+
+
+def cheapest(table: list, cap: int) -> int:
+    """The least budget within cap that reaches the best score within cap."""
+    best = table[cap]
+    return next(b for b in range(cap + 1) if table[b] >= best - tolerance)
+
+
+def improving_options(best: list):
+    """(options, choices) from best[b], the (score, choice) reached with b units or None: the cheapest budget for
+    every score that beats all cheaper ones."""
+    options, choices = [], []
+    for b, entry in enumerate(best):
+        if entry is not None and (not options or entry[0] > options[-1][1] + tolerance):
+            options.append((b, entry[0]))
+            choices.append(entry[1])
+    return options, choices
+
+
+class TalentGroup:
+    """A skill and its wanted talents, searched under one assignment of its cluster's links: banned talents are left
+    out, assumed ones count as owned, forced ones must be taken and the skill must reach floor (exp, foc). options
+    are (cost units, gain) pairs, each the cheapest way to a gain that beats every cheaper one, and choices what
+    reaches each: (raises of the exp and foc tracks, levels, pre-requisite talents taken, leaf items, leaf units)."""
+    def __init__(self, skill: str, talents: set, floor: tuple):
+        self.skill = skill
+        self.talents = talents
+        self.floor = floor
+        self.tracks = []
+        self.options = []
+        self.choices = []
+
+
+class TalentCluster:
+    """Skills tied together by links, the talents that require a skill other than their own, as ('skill', key, name,
+    exp, foc), or a talent of another skill, as ('talent', key, required). Deciding which links are met splits the
+    cluster into independent TalentGroups, so it is searched once per assignment of the links (nearly always a
+    single skill with none). options are as for a TalentGroup, and choices are (assignment, units)."""
+    def __init__(self, skills: list, links: list):
+        self.skills = skills
+        self.links = links
+        self.assignments = []  # (groups, their tables and picks) for each feasible assignment
+        self.options = []
+        self.choices = []
+
+
+class XpOptimizer:
+    """Finds the build a character's remaining XP buys that scores highest on an objective, using the same costs as
+    the random spend (CharacterMaker.att_cost and skill_cost, and Talent.cost) and only raising skills the character
+    already has.
+
+    The cost of a build does not depend on the order of its purchases, provided talents are bought last (their cost
+    falls with focus), so the search is over final levels and talent sets rather than purchase sequences. Attributes
+    and the skills no wanted talent depends on are independent tracks. Each other skill is searched with its talents
+    as a TalentGroup: its levels are enumerated, and for each, the pre-requisite talents are taken as sets closed
+    under their own pre-requisites and the remaining talents are a 0/1 knapsack, memoized on the talents on offer and
+    their costs, which many levels share. That gives the best gain at every cost. The few talents that tie two skills
+    together are handled by TalentClusters, and the tracks, groups and clusters are combined by a multiple-choice
+    knapsack over the budget, so the work grows with the number of goals rather than exponentially."""
+    def __init__(self, char, objective: XpObjective):
+        self.char = char
+        self.objective = objective
+        self.talents = char.table_store.talents
+        self.budget = max(char.xp, 0) // cost_unit
+        # Only skills the character has can be raised, as in the random spend
+        self.skills = {name: (skill['exp'], skill['foc']) for name, skill in char.skills.items()
+                       if name in skill_names}
+        self.owned = {flat_name(name) for name in char.talents}
+        self.requirements = {}
+        self.relevant = self.relevant_talents()
+        self.order = self.topological(self.relevant)
+        prerequisites = {req for key in self.relevant for req in self.requirements[key][0] if req in self.relevant}
+        self.prerequisites = [key for key in self.order if key in prerequisites]
+        self.leaves = [key for key in self.order if key not in prerequisites]
+        self.skill_talents = defaultdict(set)
+        for key in self.relevant:
+            self.skill_talents[self.talents[key].skill].add(key)
+        self.groups = {}
+        self.items = {}
+        self.leaf_tables = {}
+
+    def requirement(self, key: str):
+        """(required talent keys, {skill name: (exp, foc)}) for a talent, or None if the character can never meet
+        them (a required talent is not in the tree, or a skill is one the character does not have)."""
+        if key not in self.requirements:
+            flat_self, flat_talents, flat_skills = self.talents[key].flat_requirements()
+            skills = {}
+            for skill_key, required in flat_skills:
+                name = skill_keys.get(skill_key)
+                if name not in self.skills:
+                    self.requirements[key] = None
+                    return None
+                skills[name] = (required.get('exp', 0), required.get('foc', 0))
+            if self.talents[key].skill not in self.skills or any(t not in self.talents for t in flat_talents):
+                self.requirements[key] = None
+            else:
+                self.requirements[key] = (tuple(flat_talents), skills)
+        return self.requirements[key]
+
+    def relevant_talents(self) -> set:
+        """Talents the objective values and the character could still buy, with every talent they require."""
+        relevant = set()
+        pending = [key for key, talent in self.talents.items()
+                   if key not in self.owned and self.objective.talent_value(talent) > tolerance]
+        while pending:
+            key = pending.pop()
+            if key in relevant or key in self.owned or self.requirement(key) is None:
+                continue
+            relevant.add(key)
+            pending.extend(self.requirements[key][0])
+        # Drop talents that need one that could not be reached, until none are left
+        changed = True
+        while changed:
+            changed = False
+            for key in list(relevant):
+                if any(t not in relevant and t not in self.owned for t in self.requirements[key][0]):
+                    relevant.discard(key)
+                    changed = True
+        return relevant
+
+    def topological(self, keys: set) -> list:
+        order = []
+        seen = set()
+
+        def visit(key):
+            if key in seen:
+                return
+            seen.add(key)
+            for required in self.requirements[key][0]:
+                if required in keys:
+                    visit(required)
+            order.append(key)
+        for key in sorted(keys):
+            visit(key)
+        return order
+
+    def tracks(self, names) -> list:
+        objective, char = self.objective, self.char
+        tracks = []
+        for name in names:
+            if name in self.skills:
+                exp, foc = self.skills[name]
+                tracks.append(Track('exp', name, exp, lambda level: char.skill_cost({'exp': level, 'foc': 0})['exp'],
+                                    lambda level, name=name: objective.expertise_value(name, level), self.budget))
+                tracks.append(Track('foc', name, foc, lambda level: char.skill_cost({'exp': 0, 'foc': level})['foc'],
+                                    lambda level, name=name: objective.focus_value(name, level), self.budget))
+            else:
+                tracks.append(Track('attribute', name, char.attributes[name], char.att_cost,
+                                    lambda level, name=name: objective.attribute_value(name, level), self.budget))
+        return tracks
+
+    def talent_item(self, key: str, levels: dict):
+        """(key, cost units, value) for a talent given the final levels of its skill, or None if they do not meet its
+        pre-requisites. Requirements on other skills are left to the links of its cluster."""
+        talent = self.talents[key]
+        memo_key = (key, levels[talent.skill])
+        if memo_key not in self.items:
+            item = None
+            required_talents, required_skills = self.requirements[key]
+            if all(name not in levels or (levels[name][0] >= exp and levels[name][1] >= foc)
+                   for name, (exp, foc) in required_skills.items()):
+                cost = talent.cost({talent.skill: {'exp': levels[talent.skill][0], 'foc': levels[talent.skill][1]}})
+                item = key, cost // cost_unit, self.objective.talent_value(talent)
+            self.items[memo_key] = item
+        return self.items[memo_key]
+
+    def closed_sets(self, prerequisites: list, levels: dict, owned: set, cap: int) -> list:
+        """Every (talents, cost, value) set of pre-requisite talents closed under their own pre-requisites, within
+        cap."""
+        sets = [(frozenset(), 0, 0.0)]
+        for key in prerequisites:
+            item = self.talent_item(key, levels)
+            if item is None:
+                continue
+            for taken, spent, gain in list(sets):
+                if spent + item[1] <= cap and all(t in taken or t in owned for t in self.requirements[key][0]):
+                    sets.append((taken | {key}, spent + item[1], gain + item[2]))
+        return sets
+
+    def leaf_items(self, leaves: list, levels: dict, owned: set, taken: frozenset) -> tuple:
+        items = []
+        for key in leaves:
+            if all(t in taken or t in owned for t in self.requirements[key][0]):
+                item = self.talent_item(key, levels)
+                if item is not None and item[2] > tolerance:
+                    items.append(item)
+        return tuple(items)
+
+    def leaf_table(self, items: tuple):
+        """The 0/1 knapsack table of items, and the budgets at which it improves."""
+        if items not in self.leaf_tables:
+            table = add_items([0.0] * (self.budget + 1), items)
+            steps = [0] + [b for b in range(1, len(table)) if table[b] > table[b - 1] + tolerance]
+            self.leaf_tables[items] = table, steps
+        return self.leaf_tables[items]
+
+    def clusters(self) -> list:
+        """The TalentClusters of the skills wanted talents depend on."""
+        parent = {}
+
+        def find(skill):
+            while parent.setdefault(skill, skill) != skill:
+                parent[skill] = parent[parent[skill]]
+                skill = parent[skill]
+            return skill
+        links = []
+        for key in sorted(self.relevant):
+            own = self.talents[key].skill
+            find(own)
+            required_talents, required_skills = self.requirements[key]
+            for name, (exp, foc) in sorted(required_skills.items()):
+                if name != own:
+                    links.append(('skill', key, name, exp, foc))
+                    parent[find(name)] = find(own)
+            for required in required_talents:
+                if required in self.relevant and self.talents[required].skill != own:
+                    links.append(('talent', key, required))
+                    parent[find(self.talents[required].skill)] = find(own)
+        members = defaultdict(list)
+        for skill in list(parent):
+            members[find(skill)].append(skill)
+        clusters = [TalentCluster(sorted(skills), [link for link in links if find(self.talents[link[1]].skill) == root])
+                    for root, skills in members.items()]
+        return sorted(clusters, key=lambda cluster: cluster.skills)
+
+    def coupled_levels(self, tracks: list, index: int=0, spent: int=0, gain: float=0.0, raises: tuple=()):
+        """Every combination of raises to a skill's tracks within the budget."""
+        if index == len(tracks):
+            yield raises, spent, gain
+            return
+        for count, (track_spent, track_gain) in enumerate(tracks[index].options):
+            if spent + track_spent > self.budget:
+                break
+            yield from self.coupled_levels(tracks, index + 1, spent + track_spent, gain + track_gain, raises + (count,))
+
+    def search_group(self, skill: str, banned: frozenset, assumed: frozenset, forced: frozenset,
+                     floor: tuple) -> TalentGroup:
+        talents = self.skill_talents[skill] - banned
+        memo_key = (skill, frozenset(talents), assumed, forced & talents, floor)
+        if memo_key in self.groups:
+            return self.groups[memo_key]
+        group = self.groups[memo_key] = TalentGroup(skill, talents, floor)
+        if not forced & self.skill_talents[skill] <= talents:
+            return group  # A forced talent is banned
+        owned = self.owned | assumed
+        prerequisites = [key for key in self.prerequisites if key in talents]
+        leaves = [key for key in self.leaves if key in talents]
+        group.tracks = self.tracks([skill])
+        best = [None] * (self.budget + 1)
+        for raises, spent, gain in self.coupled_levels(group.tracks):
+            exp, foc = self.skills[skill]
+            levels = {skill: (exp + raises[0], foc + raises[1])}
+            if levels[skill][0] < floor[0] or levels[skill][1] < floor[1]:
+                continue
+            for taken, taken_spent, taken_gain in self.closed_sets(prerequisites, levels, owned, self.budget - spent):
+                if not forced & talents <= taken:
+                    continue
+                items = self.leaf_items(leaves, levels, owned, taken)
+                table, steps = self.leaf_table(items)
+                base = spent + taken_spent
+                # Only the budgets where the leaves improve can be best; improving_options passes over the rest
+                for cap in steps:
+                    b = base + cap
+                    if b > self.budget:
+                        break
+                    score = gain + taken_gain + table[cap]
+                    if best[b] is None or score > best[b][0] + tolerance:
+                        best[b] = (score, (raises, levels, taken, items, cap))
+        group.options, group.choices = improving_options(best)
+        return group
+
+    def search_cluster(self, cluster: TalentCluster):
+        best = [None] * (self.budget + 1)
+        for met in product((False, True), repeat=len(cluster.links)):
+            banned, assumed, forced, floors = set(), set(), set(), {}
+            for link, link_met in zip(cluster.links, met):
+                if not link_met:
+                    banned.add(link[1])
+                elif link[0] == 'skill':
+                    kind, key, name, exp, foc = link
+                    floor = floors.get(name, (0, 0))
+                    floors[name] = (max(floor[0], exp), max(floor[1], foc))
+                else:
+                    assumed.add(link[2])
+                    forced.add(link[2])
+            groups = [self.search_group(skill, frozenset(banned), frozenset(assumed), frozenset(forced),
+                                        floors.get(skill, (0, 0))) for skill in cluster.skills]
+            if not all(group.options for group in groups):
+                continue
+            table = [0.0] * (self.budget + 1)
+            group_picks = []
+            for group in groups:
+                table, picks = add_track(table, group)
+                group_picks.append(picks)
+            assignment = len(cluster.assignments)
+            cluster.assignments.append((groups, table, group_picks))
+            for b, score in enumerate(table):
+                if score > unreachable and (best[b] is None or score > best[b][0] + tolerance):
+                    best[b] = (score, (assignment, b))
+        cluster.options, cluster.choices = improving_options(best)
+
+    def optimize(self) -> XpPlan:
+        clusters = self.clusters()
+        clustered = {skill for cluster in clusters for skill in cluster.skills}
+        free_tracks = [t for t in self.tracks(chain(sorted(self.char.attributes),
+                                                    (s for s in self.skills if s not in clustered)))
+                       if t.useful()]
+        for cluster in clusters:
+            self.search_cluster(cluster)
+        merged = free_tracks + clusters
+        table = [0.0] * (self.budget + 1)
+        merged_picks = []
+        for track in merged:
+            table, picks = add_track(table, track)
+            merged_picks.append(picks)
+        score = table[self.budget]
+        purchases = []
+        talent_costs = {}
+        b = cheapest(table, self.budget)
+        for track, option in self.walk_back(merged, merged_picks, b):
+            if isinstance(track, Track):
+                purchases += track.purchases(option)
+                continue
+            assignment, units = track.choices[option]
+            groups, group_table, group_picks = track.assignments[assignment]
+            for group, group_option in self.walk_back(groups, group_picks, units):
+                raises, levels, taken, items, cap = group.choices[group_option]
+                for skill_track, count in zip(group.tracks, raises):
+                    purchases += skill_track.purchases(count)
+                keep = []
+                leaf_table = add_items([0.0] * (self.budget + 1), items, keep)
+                leaf_b = cheapest(leaf_table, cap)
+                chosen = set(taken)
+                for (key, spent, gain), kept in reversed(list(zip(items, keep))):
+                    if kept[leaf_b]:
+                        chosen.add(key)
+                        leaf_b -= spent
+                for key in chosen:
+                    talent_costs[key] = self.talent_item(key, levels)[1] * cost_unit
+        # Talents last, each after the talents it requires
+        for key in self.order:
+            if key in talent_costs:
+                purchases.append(('talents', self.talents[key], talent_costs[key]))
+        return XpPlan(purchases, score)
+
+    @staticmethod
+    def walk_back(tracks: list, track_picks: list, b: int) -> list:
+        """The option of each track taken to reach a knapsack table at b, in track order."""
+        taken = []
+        for track, picks in reversed(list(zip(tracks, track_picks))):
+            taken.append((track, picks[b]))
+            b -= track.options[picks[b]][0]
+        return taken[::-1]
+
+
+def optimize_xp(char, objective: XpObjective) -> XpPlan:
+    """The purchases that spend a CharacterMaker's remaining XP to score highest on objective."""
+    return XpOptimizer(char, objective).optimize()
@@ -1,3 +1,45 @@
-from LifePathLibs.SkillMaps import skill_map, att_map, Skills, Attributes
-from LifePathLibs.GenUtils import LifePathTables, MinValDict, FlatNameDict, Talent, import_talents
-from LifePathLibs.SheetMaker import CharacterSheet
+import importlib
+
+# Public names and the submodule each comes from. A submodule is only imported the first time one of its names is
+# used, so e.g. the network, numpy and sheet code cost nothing at startup unless a run needs them.
+# No submodule may share a name with a public name: importing the submodule binds it on the package, which would
+# then shadow the name it exports.
+_exports = {
+    'SkillMaps': ('skill_map', 'att_map', 'Skills', 'Attributes'),
+    'GenUtils': ('LifePathTables', 'MinValDict', 'FlatNameDict', 'Talent', 'TalentIndex', 'EligibleTalents',
+                 'PurchaseFrontier', 'bonus_damage_steps', 'import_talents', 'import_tables'),
+    'TableCompiler': ('compile_tables', 'load_compiled_tables', 'load_table_store'),
+    'RandomSources': ('EntropyPool', 'AsyncPrefetchSource', 'SourceMetrics', 'rand_api_path', 'get_random_source',
+                      'set_random_source'),
+    'CharacterRecords': ('CharacterRecord', 'describe_character', 'un_camel', 'articelize'),
+    'SheetMaker': ('CharacterSheet',),
+    'RosterExport': ('character_record', 'ArchiveRosterWriter', 'JsonLinesRosterWriter'),
+    'MonteCarlo': ('RollTable', 'TableArrays', 'LifePathBatch', 'LifePathStats', 'life_path_stats'),
+    'Probability': ('ExactDistributions', 'dice_distribution', 'table_distribution', 'total_variation'),
+    'Instrumentation': ('GenerationProfile', 'CountingTableStore', 'profile_call', 'profile_modes'),
+    'Replay': ('ReplayRecord', 'ReplayError', 'ReplayLogWriter', 'read_replay_log', 'replay_record',
+               'table_fingerprint'),
+    'PathConstraints': ('Constraints', 'ConstraintError', 'InfeasibleConstraints', 'LifePathModel', 'ConstrainedPaths',
+                        'LifePathPlan'),
+    'CorpusIndex': ('CharacterCorpus', 'CorpusRosterWriter'),
+    'ColumnarRosters': ('ColumnarRoster', 'ColumnarRosterWriter'),
+    'ChoicePolicies': ('ChoicePolicy', 'UniformChoices', 'WeightedChoices', 'ScriptedChoices', 'InteractiveChoices',
+                       'SyllableNames', 'choice_kinds', 'weights_from_specs'),
+    'XpOptimization': ('XpObjective', 'CombinedObjective', 'SkillTestObjective', 'AttributeObjective', 'TalentGoal',
+                       'XpPlan', 'XpOptimizer', 'optimize_xp', 'objective_from_specs'),
+}
+_export_modules = {name: module for module, names in _exports.items() for name in names}
+__all__ = list(_export_modules)
+
+
+def __getattr__(name):
+    module = _export_modules.get(name)
+    if module is None:
+        raise AttributeError("module '%s' has no attribute '%s'" % (__name__, name))
+    value = getattr(importlib.import_module('%s.%s' % (__name__, module)), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
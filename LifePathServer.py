@@ -0,0 +1,315 @@
+"""Long-running local generation service. The tables are loaded once into each worker process and kept warm, so a
+request pays only for rolling and rendering its characters.
+
+Run:
+    python LifePathServer.py --port 8642            (or --unix /tmp/lifepath.sock)
+    curl 'http://127.0.0.1:8642/generate?count=3&xp=1000&seed=7'
+    curl 'http://127.0.0.1:8642/generate?seed=7&format=xml'
+    curl -X POST -d '{"count": 10, "xp": 500}' http://127.0.0.1:8642/generate
+    curl http://127.0.0.1:8642/metrics
+
+Endpoints:
+    GET|POST /generate  Parameters (query string or JSON body): count, xp, seed, name, full_auto and format (json or
+                        xml). Characters are always generated in full-auto mode, and the same seed gives the same
+                        characters as `LifePathGen.py -f -n COUNT -s SEED`. xml returns a single character's FG sheet.
+    GET /metrics        Request counts and latency percentiles as JSON.
+    GET /health         Returns ok once the workers are up.
+"""
+import argparse
+import asyncio
+import json
+import os
+import secrets
+import sys
+import time
+import urllib.parse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import LifePathGen
+from LifePathLibs import CharacterSheet, character_record
+
+status_text = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+               500: 'Internal Server Error', 503: 'Service Unavailable'}
+max_body = 1 << 16
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def render_characters(seeds: list, xp: int, name: str, output_format: str) -> list:
+    """Worker side: generates a character for each seed with the worker's warm tables, and renders it."""
+    rendered = []
+    for seed in seeds:
+        char = LifePathGen.seeded_character(LifePathGen._worker_table_store, seed, full_auto=True, xp=xp, name=name)
+        if output_format == 'xml':
+            rendered.append(CharacterSheet(char).create_fg_xml())
+        else:
+            rendered.append(character_record(char))
+    return rendered
+
+
+class LatencyMetrics:
+    """Request counters plus the latencies of the most recent requests, for percentiles."""
+    def __init__(self, window: int=10000):
+        self.started = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.rejected = 0
+        self.characters = 0
+        self.latencies = deque(maxlen=window)
+        self.queue_waits = deque(maxlen=window)
+
+    def record(self, latency: float, queue_wait: float, characters: int):
+        self.requests += 1
+        self.characters += characters
+        self.latencies.append(latency)
+        self.queue_waits.append(queue_wait)
+
+    @staticmethod
+    def percentiles(values) -> dict:
+        ordered = sorted(values)
+        if not ordered:
+            return {}
+        pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+        return {'p50_ms': pick(0.5) * 1e3, 'p90_ms': pick(0.9) * 1e3, 'p99_ms': pick(0.99) * 1e3,
+                'max_ms': ordered[-1] * 1e3, 'mean_ms': sum(ordered) / len(ordered) * 1e3}
+
+    def summary(self) -> dict:
+        return {'uptime_s': time.time() - self.started, 'requests': self.requests, 'errors': self.errors,
+                'rejected': self.rejected, 'characters': self.characters,
+                'latency': self.percentiles(self.latencies), 'queue_wait': self.percentiles(self.queue_waits)}
+
+
+class GenerationService:
+    """Generates characters on a pool of worker processes, each holding warm tables. At most max_concurrent requests
+    generate at once; up to max_queue more wait for a slot, and anything beyond that is turned away with a 503.
+    With workers=0, generation runs on a single thread in the server process instead."""
+    def __init__(self, workers: int=None, max_concurrent: int=None, max_queue: int=64, max_count: int=1000,
+                 max_xp: int=100000, chunk_size: int=32):
+        self.workers = os.cpu_count() if workers is None else workers
+        self.max_concurrent = max_concurrent or max(1, self.workers) * 2
+        self.max_queue = max_queue
+        self.max_count = max_count
+        self.max_xp = max_xp
+        self.chunk_size = chunk_size
+        self.metrics = LatencyMetrics()
+        self.slots = None
+        self.waiting = 0
+        self.in_flight = 0
+        self.executor = None
+
+    async def start(self):
+        self.slots = asyncio.Semaphore(self.max_concurrent)
+        if self.workers:
+            self.executor = ProcessPoolExecutor(self.workers, initializer=LifePathGen._init_worker, initargs=({}, None))
+        else:
+            self.executor = ThreadPoolExecutor(1, initializer=LifePathGen._init_worker, initargs=({}, None))
+        # Start every worker now, so that no request waits for a worker to load its tables
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.executor, render_characters, [], 0, '', 'json')
+                               for i in range(max(1, self.workers))))
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    def parse_params(self, params: dict) -> dict:
+        try:
+            count = int(params.get('count', 1))
+            xp = int(params.get('xp', 0))
+            # Not the global random: with workers=0, generation reseeds that from each request's own seed
+            seed = int(params['seed']) if params.get('seed') not in (None, '') else secrets.randbits(64)
+        except (TypeError, ValueError):
+            raise BadRequest("count, xp and seed must be integers")
+        full_auto = str(params.get('full_auto', 'true')).lower() not in ('0', 'false', 'no')
+        output_format = params.get('format', 'json')
+        if not full_auto:
+            raise BadRequest("The service only generates full-auto characters")
+        if output_format not in ('json', 'xml'):
+            raise BadRequest("format must be json or xml")
+        if not 1 <= count <= self.max_count:
+            raise BadRequest("count must be between 1 and %d" % self.max_count)
+        if output_format == 'xml' and count != 1:
+            raise BadRequest("xml returns a single character's sheet, so count must be 1")
+        if not 0 <= xp <= self.max_xp:
+            raise BadRequest("xp must be between 0 and %d" % self.max_xp)
+        if seed < 0:
+            raise BadRequest("seed must not be negative")
+        return {'count': count, 'xp': xp, 'seed': seed, 'name': str(params.get('name', '')),
+                'format': output_format}
+
+    async def generate(self, params: dict):
+        """Returns (status, content type, body, extra headers)."""
+        start = time.perf_counter()
+        request = self.parse_params(params)
+        if self.waiting >= self.max_queue:
+            self.metrics.rejected += 1
+            return 503, 'application/json', json.dumps({'error': 'Too many requests queued'}), {}
+        self.waiting += 1
+        try:
+            await self.slots.acquire()
+        finally:
+            self.waiting -= 1
+        queue_wait = time.perf_counter() - start
+        self.in_flight += 1
+        try:
+            seeds = list(LifePathGen.character_seeds(request['seed'], request['count']))
+            loop = asyncio.get_running_loop()
+            chunks = await asyncio.gather(*(
+                loop.run_in_executor(self.executor, render_characters, seeds[i:i + self.chunk_size], request['xp'],
+                                     request['name'], request['format'])
+                for i in range(0, len(seeds), self.chunk_size)))
+        finally:
+            self.in_flight -= 1
+            self.slots.release()
+        rendered = [item for chunk in chunks for item in chunk]
+        self.metrics.record(time.perf_counter() - start, queue_wait, len(rendered))
+        headers = {'X-Seed': str(request['seed'])}
+        if request['format'] == 'xml':
+            return 200, 'application/xml; charset=iso-8859-1', rendered[0], headers
+        return 200, 'application/json', json.dumps({'seed': request['seed'], 'characters': rendered},
+                                                   ensure_ascii=False), headers
+
+    def metrics_summary(self) -> dict:
+        summary = self.metrics.summary()
+        summary.update(in_flight=self.in_flight, waiting=self.waiting, workers=self.workers,
+                       max_concurrent=self.max_concurrent, max_queue=self.max_queue)
+        return summary
+
+
+async def read_request(reader: asyncio.StreamReader):
+    """Reads one HTTP/1.1 request. Returns None when the client has closed the connection."""
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    parts = request_line.decode('latin-1').split()
+    if len(parts) != 3:
+        raise BadRequest("Malformed request line")
+    method, target, version = parts
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        header_name, _, value = line.decode('latin-1').partition(':')
+        headers[header_name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get('content-length', 0) or 0)
+    except ValueError:
+        raise BadRequest("Malformed Content-Length")
+    if length < 0:
+        raise BadRequest("Malformed Content-Length")
+    if length > max_body:
+        raise BadRequest("Request body too large")
+    body = await reader.readexactly(length) if length else b''
+    keep_alive = headers.get('connection', '').lower() != 'close' and version != 'HTTP/1.0'
+    return method, target, body, keep_alive
+
+
+def write_response(writer: asyncio.StreamWriter, status: int, content_type: str, body: str, headers: dict=None,
+                   keep_alive: bool=True):
+    # The body is encoded as its content type declares (FG sheets declare iso-8859-1), defaulting to UTF-8
+    charset = content_type.partition('charset=')[2] or 'utf-8'
+    payload = body.encode(charset, 'xmlcharrefreplace')
+    head = ['HTTP/1.1 %d %s' % (status, status_text.get(status, '')), 'Content-Type: %s' % content_type,
+            'Content-Length: %d' % len(payload), 'Connection: %s' % ('keep-alive' if keep_alive else 'close')]
+    head += ['%s: %s' % item for item in (headers or {}).items()]
+    writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + payload)
+
+
+async def route(service: GenerationService, method: str, target: str, body: bytes):
+    url = urllib.parse.urlsplit(target)
+    if url.path == '/health':
+        return 200, 'text/plain', 'ok\n', {}
+    if url.path == '/metrics':
+        return 200, 'application/json', json.dumps(service.metrics_summary()), {}
+    if url.path != '/generate':
+        return 404, 'application/json', json.dumps({'error': 'Unknown path %s' % url.path}), {}
+    if method not in ('GET', 'POST'):
+        return 405, 'application/json', json.dumps({'error': 'Use GET or POST'}), {}
+    params = dict(urllib.parse.parse_qsl(url.query))
+    if body:
+        try:
+            posted = json.loads(body)
+        except ValueError:
+            raise BadRequest("Body must be a JSON object")
+        if not isinstance(posted, dict):
+            raise BadRequest("Body must be a JSON object")
+        params.update(posted)
+    return await service.generate(params)
+
+
+async def handle_connection(service: GenerationService, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        keep_alive = True
+        while keep_alive:
+            request = None
+            try:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, target, body, keep_alive = request
+                status, content_type, response, headers = await route(service, method, target, body)
+            except BadRequest as e:
+                service.metrics.errors += 1
+                if request is None:
+                    keep_alive = False  # A request that could not be read leaves no way to tell where the next starts
+                status, content_type, response, headers = 400, 'application/json', json.dumps({'error': str(e)}), {}
+            except (asyncio.IncompleteReadError, ConnectionError):
+                break
+            except Exception as e:
+                service.metrics.errors += 1
+                status, content_type, response, headers = 500, 'application/json', json.dumps({'error': repr(e)}), {}
+            write_response(writer, status, content_type, response, headers, keep_alive)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(args):
+    service = GenerationService(args.workers, args.max_concurrent, args.max_queue, args.max_count, args.max_xp)
+    await service.start()
+    handler = lambda reader, writer: handle_connection(service, reader, writer)
+    if args.unix:
+        server = await asyncio.start_unix_server(handler, args.unix)
+        where = args.unix
+    else:
+        server = await asyncio.start_server(handler, args.host, args.port)
+        where = 'http://%s:%d' % (args.host, server.sockets[0].getsockname()[1])
+    print("Serving on %s with %d workers" % (where, service.workers), file=sys.stderr)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Local character generation service with warm tables.")
+    parser.add_argument("--host", type=str, default='127.0.0.1')
+    parser.add_argument("--port", type=int, default=8642)
+    parser.add_argument("--unix", type=str, default=None, help="Listen on this Unix socket instead of TCP.")
+    parser.add_argument('-w', "--workers", type=int, default=None,
+                        help="Worker processes for generation (default one per CPU). 0 generates on a single thread "
+                             "in the server process.")
+    parser.add_argument("--max-concurrent", type=int, default=None,
+                        help="Requests generating at once (default twice the workers).")
+    parser.add_argument("--max-queue", type=int, default=64,
+                        help="Requests allowed to wait for a slot before new ones are refused with a 503.")
+    parser.add_argument("--max-count", type=int, default=1000, help="Most characters allowed in one request.")
+    parser.add_argument("--max-xp", type=int, default=100000, help="Largest XP budget allowed in a request.")
+    return parser.parse_args()
+
+
+def main():
+    try:
+        asyncio.run(serve(parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
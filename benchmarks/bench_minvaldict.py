@@ -0,0 +1,60 @@
+"""Microbenchmark comparing MinValDict lookups with the original linear-probing implementation.
+
+Run from the repository root: python benchmarks/bench_minvaldict.py
+"""
+import os.path
+import pickle
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from LifePathLibs import MinValDict  # noqa: E402
+
+
+class LegacyMinValDict(dict):
+    """The original MinValDict, which walks upward one roll at a time until it finds a key."""
+    def __getitem__(self, item):
+        out = self.get(item)
+        if not out:
+            raise ValueError
+        return out
+
+    def get(self, k):
+        if not isinstance(k, int):
+            k = int(k)
+        out = None
+        while not out and k <= max(self.keys()):
+            out = super(LegacyMinValDict, self).get(k)
+            k += 1
+        return out
+
+
+def load_raw_tables():
+    lib_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'LifePathLibs')
+    with open(os.path.join(lib_dir, 'tables.dat'), 'rb') as table_store_in:
+        return pickle.load(table_store_in)
+
+
+def bench_table(label, table, rolls, number):
+    legacy, current = LegacyMinValDict(table), MinValDict(table)
+    for roll in rolls:
+        assert legacy.get(roll) == current.get(roll), "Lookup mismatch for roll %d in %s" % (roll, label)
+    legacy_time = timeit.timeit(lambda: [legacy.get(r) for r in rolls], number=number)
+    current_time = timeit.timeit(lambda: [current.get(r) for r in rolls], number=number)
+    lookups = number * len(rolls)
+    print("%-14s legacy %7.3f us/lookup   bisect %7.3f us/lookup   speedup %5.1fx" %
+          (label, legacy_time / lookups * 1e6, current_time / lookups * 1e6, legacy_time / current_time))
+
+
+def main(number=2000):
+    raw_tables = load_raw_tables()
+    d20 = list(range(1, 21))
+    bench_table('homelands', raw_tables['homelands'], list(range(2, 41)), number)
+    for table_name in ('attributes', 'castes', 'archetypes', 'war_stories'):
+        bench_table(table_name, raw_tables[table_name], d20, number)
+    bench_table('caste_stories', raw_tables['caste_stories']['farmer'], d20, number)
+    bench_table('bonus_damage', {8: 0, 9: 1, 11: 2, 13: 3, 15: 5, 25: 6}, list(range(7, 26)), number)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Startup benchmark: wall time of fresh interpreters importing the package and running short CLI invocations, which
+startup dominates. Each case runs in a new process, so nothing is cached between repeats beyond the OS file cache.
+
+Cases: importing LifePathLibs and LifePathGen, `LifePathGen.py --help`, and single full-auto characters with and
+without XP. Results are reported as seconds per run (median and best) in the same JSON layout as bench_suite.py, and
+compared with a baseline the same way.
+
+It also checks that a plain single-character run never imports the modules only some runs need (the network random
+sources, NumPy, multiprocessing, the sheet and archive code, the profilers). Any that creep back into startup are
+reported, and the exit status is 1.
+
+Run from the repository root:
+    python benchmarks/bench_startup.py --out startup.json
+    python benchmarks/bench_startup.py --baseline startup.json --threshold 0.25
+"""
+import argparse
+import json
+import os.path
+import platform
+import subprocess
+import sys
+import time
+
+from bench_suite import compare, measure
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+cli = os.path.join(repo_dir, 'LifePathGen.py')
+cases = {
+    'import_LifePathLibs': ['-c', 'import LifePathLibs'],
+    'import_LifePathGen': ['-c', 'import LifePathGen'],
+    'cli_help': [cli, '--help'],
+    'cli_one_character': [cli, '-f', '-s', '1'],
+    'cli_one_character.xp5000': [cli, '-f', '-s', '1', '-x', '5000'],
+}
+# Modules a plain single-character run should never import
+deferred_modules = ('asyncio', 'ssl', 'urllib.request', 'http.client', 'numpy', 'multiprocessing', 'zipfile',
+                    'tarfile', 'cProfile', 'tracemalloc', 'LifePathLibs.RandomSources', 'LifePathLibs.SheetMaker',
+                    'LifePathLibs.MonteCarlo', 'LifePathLibs.Probability', 'LifePathLibs.PathConstraints',
+                    'LifePathLibs.CorpusIndex', 'LifePathLibs.ColumnarRosters', 'LifePathLibs.XpOptimization')
+loaded_check = """
+import contextlib, io, json, sys
+sys.argv = ['LifePathGen.py', '-f', '-s', '1']
+import LifePathGen
+with contextlib.redirect_stdout(io.StringIO()):
+    LifePathGen.main()
+print(json.dumps([m for m in %r if m in sys.modules]))
+""" % (deferred_modules,)
+
+
+def run_python(args: list) -> subprocess.CompletedProcess:
+    # Full-auto runs never read stdin, but an empty line keeps an accidental prompt from hanging the benchmark
+    return subprocess.run([sys.executable] + args, cwd=repo_dir, input=b'\n', stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, check=True)
+
+
+def time_run(args: list) -> float:
+    start = time.perf_counter()
+    run_python(args)
+    return time.perf_counter() - start
+
+
+def run_suite(repeats: int=10) -> dict:
+    run_python(['-c', 'from LifePathLibs import load_table_store; load_table_store()'])  # Compile tables if stale
+    results = {}
+    for case, args in cases.items():
+        results[case] = measure(lambda: time_run(args), repeats)['']
+    return {'meta': {'python': platform.python_version(), 'platform': platform.platform(), 'repeats': repeats},
+            'results': results}
+
+
+def eagerly_loaded() -> list:
+    """Modules in deferred_modules that a plain single-character run imported anyway."""
+    return json.loads(run_python(['-c', loaded_check]).stdout)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Time package imports and short CLI runs in fresh interpreters.")
+    parser.add_argument("--out", type=str, default='-', help="File to write the JSON results to (default stdout).")
+    parser.add_argument("--baseline", type=str, default=None, help="JSON results of an earlier run to compare with.")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Fraction by which a case may be slower than the baseline before it is flagged.")
+    parser.add_argument("--repeats", type=int, default=10)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    current = run_suite(args.repeats)
+    output = json.dumps(current, indent=2)
+    if args.out == '-':
+        print(output)
+    else:
+        with open(args.out, 'w') as results_out:
+            results_out.write(output + '\n')
+    for case, result in current['results'].items():
+        print("%-40s %10.1f ms" % (case, result['median_s'] * 1e3), file=sys.stderr)
+    failed = False
+    loaded = eagerly_loaded()
+    if loaded:
+        print("EAGER IMPORTS in a plain run: %s" % ', '.join(loaded), file=sys.stderr)
+        failed = True
+    if args.baseline:
+        with open(args.baseline) as baseline_in:
+            regressions = compare(current, json.load(baseline_in), args.threshold)
+        for case, base, now in regressions:
+            print("REGRESSION %s: %.1f ms -> %.1f ms (%+.0f%%)" % (case, base * 1e3, now * 1e3,
+                                                                   (now / base - 1) * 100), file=sys.stderr)
+        failed = failed or bool(regressions)
+        if not regressions:
+            print("No regressions beyond %.0f%% of the baseline" % (args.threshold * 100), file=sys.stderr)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
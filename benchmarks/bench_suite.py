@@ -0,0 +1,184 @@
+"""Offline benchmark suite timing each stage of character generation separately.
+
+Stages: table loading (compiled and from source), LifePathTables.read_raw_table_dict, import_talents, every stepN_*
+method of CharacterMaker, step11_randomize_xp at several XP budgets, whole characters, and CharacterSheet.create_fg_xml.
+Characters are generated in full-auto mode from fixed seeds, so no input is needed and every run does the same work.
+
+Each stage is timed over several repeats and reported as seconds per operation (median and best) in JSON. Given a
+baseline file from an earlier run, stages whose median is slower than the baseline by more than the threshold are
+flagged as regressions, and the exit status is 1.
+
+Run from the repository root:
+    python benchmarks/bench_suite.py --out baseline.json
+    python benchmarks/bench_suite.py --baseline baseline.json --threshold 0.25
+"""
+import argparse
+import copy
+import json
+import os.path
+import pickle
+import platform
+import random
+import re
+import statistics
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import LifePathGen  # noqa: E402
+from LifePathLibs import CharacterSheet, LifePathTables, import_talents, import_tables, load_table_store  # noqa: E402
+
+table_file = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'LifePathLibs', 'tables.dat')
+step_names = sorted((n for n in vars(LifePathGen.CharacterMaker) if re.match(r'step\d+_', n)),
+                    key=lambda n: int(re.match(r'step(\d+)_', n).group(1)))
+
+
+class TimedCharacterMaker(LifePathGen.CharacterMaker):
+    """CharacterMaker that adds the time spent in each step method to step_times."""
+    step_times = None
+
+
+def timed_step(name: str):
+    step = getattr(LifePathGen.CharacterMaker, name)
+
+    def timed(self, *args):
+        start = time.perf_counter()
+        try:
+            return step(self, *args)
+        finally:
+            self.step_times[name] += time.perf_counter() - start
+    return timed
+
+
+for step_name in step_names:
+    setattr(TimedCharacterMaker, step_name, timed_step(step_name))
+
+
+def time_calls(fn, calls: int) -> float:
+    start = time.perf_counter()
+    for i in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls
+
+
+def measure(run, repeats: int) -> dict:
+    """Runs a stage repeats times. run returns seconds per operation for one repeat (or a dict of them, for stages
+    that time several things at once)."""
+    samples = defaultdict(list)
+    for i in range(repeats):
+        result = run()
+        for name, seconds in (result.items() if isinstance(result, dict) else (('', result),)):
+            samples[name].append(seconds)
+    return {name: {'median_s': statistics.median(times), 'min_s': min(times), 'repeats': len(times)}
+            for name, times in samples.items()}
+
+
+def seeded_characters(table_store: LifePathTables, seed: int, count: int, maker=LifePathGen.CharacterMaker) -> list:
+    chars = []
+    for char_seed in LifePathGen.character_seeds(seed, count):
+        random.seed(char_seed)
+        chars.append(maker(table_store, full_auto=True, name=''))
+    return chars
+
+
+def run_suite(repeats: int=5, characters: int=200, budgets=(1000, 5000, 20000), seed: int=1) -> dict:
+    results = {}
+    table_store = load_table_store()  # Compiles the table artifact first if it is out of date
+    table_store.talents
+
+    def add(prefix, measured):
+        for name, result in measured.items():
+            results[prefix + ('.' + name if name else '')] = result
+
+    add('load_table_store', measure(lambda: time_calls(lambda: load_table_store().talents, 5), repeats))
+    add('import_tables', measure(lambda: time_calls(import_tables, 3), repeats))
+    with open(table_file, 'rb') as table_in:
+        raw_tables = pickle.load(table_in)
+    add('read_raw_table_dict', measure(lambda: time_calls(lambda: LifePathTables().read_raw_table_dict(raw_tables), 3),
+                                       repeats))
+    add('import_talents', measure(lambda: time_calls(import_talents, 3), repeats))
+
+    def steps():
+        TimedCharacterMaker.step_times = defaultdict(float)
+        seeded_characters(table_store, seed, characters, TimedCharacterMaker)
+        return {name: TimedCharacterMaker.step_times[name] / characters for name in step_names}
+    add('step', measure(steps, repeats))
+
+    def whole_characters():
+        start = time.perf_counter()
+        seeded_characters(table_store, seed, characters)
+        return (time.perf_counter() - start) / characters
+    add('gen_character', measure(whole_characters, repeats))
+
+    chars = seeded_characters(table_store, seed, characters)
+    xp_chars = chars[:max(1, characters // 10)]
+    for budget in budgets:
+        def spend(budget=budget):
+            elapsed = 0.0
+            random.seed(seed)
+            for base_char in xp_chars:
+                char = copy.deepcopy(base_char)  # Pickling state, so the copy drops the shared tables
+                char.table_store = table_store
+                char.xp = budget
+                start = time.perf_counter()
+                char.step11_randomize_xp()
+                elapsed += time.perf_counter() - start
+            return elapsed / len(xp_chars)
+        add('step11_randomize_xp.xp%d' % budget, measure(spend, repeats))
+
+    add('create_fg_xml', measure(lambda: time_calls(lambda: [CharacterSheet(c).create_fg_xml() for c in chars], 1)
+                                 / len(chars), repeats))
+    return {'meta': {'python': platform.python_version(), 'platform': platform.platform(), 'seed': seed,
+                     'repeats': repeats, 'characters': characters, 'budgets': list(budgets)},
+            'results': results}
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """Stages present in both runs whose median is more than threshold (a fraction) slower than the baseline, as
+    (stage, baseline seconds, current seconds) tuples."""
+    regressions = []
+    for stage, result in current['results'].items():
+        base = baseline['results'].get(stage)
+        if base and result['median_s'] > base['median_s'] * (1 + threshold):
+            regressions.append((stage, base['median_s'], result['median_s']))
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Time each stage of character generation.")
+    parser.add_argument("--out", type=str, default='-', help="File to write the JSON results to (default stdout).")
+    parser.add_argument("--baseline", type=str, default=None, help="JSON results of an earlier run to compare with.")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Fraction by which a stage may be slower than the baseline before it is flagged.")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--characters", type=int, default=200)
+    parser.add_argument("--budgets", type=int, nargs='+', default=[1000, 5000, 20000])
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    current = run_suite(args.repeats, args.characters, args.budgets, args.seed)
+    output = json.dumps(current, indent=2)
+    if args.out == '-':
+        print(output)
+    else:
+        with open(args.out, 'w') as results_out:
+            results_out.write(output + '\n')
+    for stage, result in current['results'].items():
+        print("%-40s %12.3f us" % (stage, result['median_s'] * 1e6), file=sys.stderr)
+    if args.baseline:
+        with open(args.baseline) as baseline_in:
+            regressions = compare(current, json.load(baseline_in), args.threshold)
+        for stage, base, now in regressions:
+            print("REGRESSION %s: %.3f us -> %.3f us (%+.0f%%)" % (stage, base * 1e6, now * 1e6,
+                                                                   (now / base - 1) * 100), file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print("No regressions beyond %.0f%% of the baseline" % (args.threshold * 100), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
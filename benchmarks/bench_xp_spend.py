@@ -0,0 +1,86 @@
+"""Benchmark of step11_randomize_xp as the XP budget grows, against the original rebuild-everything-per-purchase loop,
+and of the goal-directed spend (spend_xp_on_goals) for single and combined goals, reporting the median and worst
+time per character.
+
+Run from the repository root: python benchmarks/bench_xp_spend.py
+"""
+import copy
+import os.path
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import LifePathGen  # noqa: E402
+from LifePathLibs import load_table_store  # noqa: E402
+
+
+def legacy_randomize_xp(char):
+    """The original spend loop: recompute every affordable purchase after each one."""
+    all_affordable = char.affordable_purchases()
+    while all_affordable:
+        upg_type = random.choice(list(all_affordable))
+        upg_key = random.choice(list(all_affordable[upg_type]))
+        upg_cost = all_affordable[upg_type][upg_key]
+        if upg_type == 'attributes':
+            char.attributes[upg_key] += 1
+        elif upg_type == 'talents':
+            char.add_talent(upg_key.name, upg_key.description)
+        elif 'exp' in upg_type:
+            char.raise_skill(upg_key, 1, 0)
+        elif 'foc' in upg_type:
+            char.raise_skill(upg_key, 0, 1)
+        char.xp -= upg_cost
+        char.xp_spent += upg_cost
+        all_affordable = char.affordable_purchases()
+
+
+goal_sets = (('Melee',), ('talent=Living Shadow', 'Stealth'), ('Melee', 'Sorcery', 'Parry', 'Lore', 'Brawn'))
+goal_budgets = (1000, 5000, 10000)
+
+
+def spend_times(table_store, base_chars, budget, spend, xp_goals=()) -> list:
+    times = []
+    for base_char in base_chars:
+        char = copy.deepcopy(base_char)
+        char.table_store = table_store
+        char.xp = budget
+        char.xp_goals = xp_goals
+        start = time.perf_counter()
+        spend(char)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def time_spend(table_store, base_chars, budget, spend):
+    return statistics.mean(spend_times(table_store, base_chars, budget, spend))
+
+
+def main(budgets=(1000, 5000, 20000, 50000, 100000), characters=10, legacy_limit=50000):
+    table_store = load_table_store()
+    random.seed(1)
+    base_chars = []
+    for i in range(characters):
+        char = LifePathGen.gen_character(full_auto=True, table_store=table_store, name='')
+        char.table_store = None  # Keep the shared tables out of the per-run deep copies
+        base_chars.append(char)
+    print("%8s %14s %14s %9s" % ('xp', 'frontier (ms)', 'legacy (ms)', 'speedup'))
+    for budget in budgets:
+        current = time_spend(table_store, base_chars, budget, LifePathGen.CharacterMaker.step11_randomize_xp)
+        if budget <= legacy_limit:
+            legacy = time_spend(table_store, base_chars, budget, legacy_randomize_xp)
+            print("%8d %14.2f %14.2f %8.1fx" % (budget, current * 1e3, legacy * 1e3, legacy / current))
+        else:
+            print("%8d %14.2f %14s %9s" % (budget, current * 1e3, '-', '-'))
+    print()
+    print("%-44s %8s %12s %12s" % ('goals', 'xp', 'median (ms)', 'worst (ms)'))
+    for goals in goal_sets:
+        for budget in goal_budgets:
+            times = spend_times(table_store, base_chars, budget, LifePathGen.CharacterMaker.spend_xp_on_goals, goals)
+            print("%-44s %8d %12.2f %12.2f" % (', '.join(goals), budget, statistics.median(times) * 1e3,
+                                                max(times) * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,12 @@
+import os.path
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from LifePathLibs import load_table_store  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def table_store():
+    return load_table_store()
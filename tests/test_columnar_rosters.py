@@ -0,0 +1,57 @@
+import copy
+
+import pytest
+
+import LifePathGen
+from LifePathLibs import ColumnarRoster, ColumnarRosterWriter
+from LifePathLibs.CharacterRecords import small_array
+
+
+def record_state(record) -> tuple:
+    return record.__getstate__()
+
+
+def seeded_records(table_store) -> list:
+    records = [char.to_record() for char in LifePathGen.generate_batch(40, full_auto=True, xp=2000,
+                                                                        table_store=table_store, seed=8)]
+    records += [char.to_record() for char in LifePathGen.generate_batch(
+        10, full_auto=True, xp=1000, table_store=table_store, seed=9, xp_goals=('Melee',),
+        constrained=LifePathGen.constrained_paths(table_store, ['homeland=Cimmeria']))]
+    named = LifePathGen.seeded_character(table_store, 10, full_auto=True, name='Þórunn Ætheling').to_record()
+    records.append(named)
+    # Values past a byte, as a large enough XP spend could give, and a character with no seed
+    big = copy.copy(records[0])
+    big.attribute_values = small_array([300] + big.attribute_values.tolist()[1:])
+    big.skill_exp = small_array([65535] + big.skill_exp.tolist()[1:])
+    big.skill_foc = small_array([256] + big.skill_foc.tolist()[1:])
+    big.seed = None
+    big.true_random = True
+    records.append(big)
+    return records
+
+
+def test_round_trip_and_append(table_store, tmp_path):
+    records = seeded_records(table_store)
+    path = str(tmp_path / 'roster')
+    writer = ColumnarRosterWriter(path, chunk_size=16)
+    for record in records[:30]:
+        writer.add(record)
+    writer.close()
+    with ColumnarRoster(path) as roster:
+        assert len(roster) == 30
+        assert [record_state(roster[i]) for i in range(30)] == [record_state(r) for r in records[:30]]
+        # Reopened for appending, with the first rows left as they were
+        writer = ColumnarRosterWriter(path, chunk_size=7)
+        for record in records[30:]:
+            writer.add(record)
+        writer.close()
+        assert len(roster) == 30
+        roster.reopen()
+        assert len(roster) == len(records)
+        for i, record in enumerate(records):
+            assert record_state(roster[i]) == record_state(record), i
+            assert str(roster[i]) == str(record)
+        assert record_state(roster[-1]) == record_state(records[-1])
+        assert [record_state(r) for r in roster] == [record_state(r) for r in records]
+        with pytest.raises(IndexError):
+            roster[len(records)]
@@ -0,0 +1,90 @@
+from collections import Counter
+
+import pytest
+
+import LifePathGen
+from LifePathLibs import CharacterCorpus, ConstraintError, CorpusIndex
+
+
+def exp(record, skill: str) -> int:
+    return record.skills.get(skill, {}).get('exp', 0)
+
+
+def foc(record, skill: str) -> int:
+    return record.skills.get(skill, {}).get('foc', 0)
+
+
+def queries(records) -> list:
+    """(specs, the same query as a filter over records) pairs."""
+    talent = Counter(t for record in records for t in record.talents).most_common(3)[-1][0]
+    return [
+        (('homeland=Cimmeria|Nordheim: Asgard or Vanaheim',),
+         lambda r: r.homeland in ('Cimmeria', 'Nordheim: Asgard or Vanaheim')),
+        (('archetype!=Pirate', 'gender=Female'), lambda r: r.archetype != 'Pirate' and r.gender == 'Female'),
+        (('talent=%s' % talent,), lambda r: talent in r.talents),
+        (('talent!=%s' % talent, 'Melee'), lambda r: talent not in r.talents and exp(r, 'Melee') >= 1),
+        (('Melee>=2', 'Melee.foc>=1'), lambda r: exp(r, 'Melee') >= 2 and foc(r, 'Melee') >= 1),
+        (('Sorcery<1',), lambda r: exp(r, 'Sorcery') < 1),
+        (('Parry.foc=0', 'Stealth!=2'), lambda r: foc(r, 'Parry') == 0 and exp(r, 'Stealth') != 2),
+        (('Brawn>=10', 'standing<=2'), lambda r: r.attributes['Brawn'] >= 10 and r.standing <= 2),
+        (('Agility>8', 'vigor<10', 'gold>=9'), lambda r: r.attributes['Agility'] > 8 and r.vigor < 10 and r.gold >= 9),
+        (('caste=Farmer', 'caste=Herder'), lambda r: False),
+        ((), lambda r: True),
+    ]
+
+
+def check_queries(corpus: CharacterCorpus, records: list):
+    assert len(corpus) == len(records)
+    for specs, keep in queries(records):
+        expected = [i for i, record in enumerate(records) if keep(record)]
+        assert corpus.query(*specs) == expected, specs
+        assert corpus.count(*specs) == len(expected)
+        assert corpus.query(*specs, limit=5) == expected[:5]
+        assert [record.__getstate__() for record in corpus.characters(*specs, limit=3)] == \
+            [records[i].__getstate__() for i in expected[:3]]
+
+
+@pytest.fixture
+def small_blocks(monkeypatch):
+    # Blocks of 64 ids, so that a few hundred characters span several of them
+    monkeypatch.setattr(CorpusIndex, 'block_shift', 6)
+    monkeypatch.setattr(CorpusIndex, 'block_bits', 64)
+
+
+@pytest.fixture(scope='module')
+def seeded_records(table_store) -> list:
+    return [char.to_record() for char in LifePathGen.generate_batch(300, full_auto=True, xp=1500,
+                                                                     table_store=table_store, seed=17)]
+
+
+def test_queries_match_filter(seeded_records):
+    corpus = CharacterCorpus()
+    corpus.add_batch(seeded_records)
+    check_queries(corpus, seeded_records)
+
+
+def test_queries_across_blocks(seeded_records, small_blocks, tmp_path):
+    corpus = CharacterCorpus()
+    corpus.add_batch(seeded_records[:100])
+    check_queries(corpus, seeded_records[:100])
+    # Added after the first flush, and partly left unflushed until the next query
+    corpus.add_batch(seeded_records[100:250])
+    for record in seeded_records[250:]:
+        corpus.add(record)
+    assert sorted(corpus.postings['gender']['male']) == [0, 1, 2, 3]
+    check_queries(corpus, seeded_records)
+    assert sorted(corpus.postings['gender']['male']) == [0, 1, 2, 3, 4]
+    path = str(tmp_path / 'roster.corpus')
+    corpus.save(path)
+    loaded = CharacterCorpus.load(path)
+    check_queries(loaded, seeded_records)
+    loaded.add_batch(seeded_records[:40])
+    check_queries(loaded, seeded_records + seeded_records[:40])
+
+
+@pytest.mark.parametrize('spec', ('height=6', 'homeland>=Cimmeria', 'Brawn', 'Brawn>=ten', 'Melee.exp=>2'))
+def test_bad_queries(seeded_records, spec):
+    corpus = CharacterCorpus()
+    corpus.add_batch(seeded_records[:10])
+    with pytest.raises(ConstraintError):
+        corpus.query(spec)
@@ -0,0 +1,73 @@
+import pickle
+import random
+
+import pytest
+
+from LifePathLibs.GenUtils import MinValDict
+
+
+def linear_probe(table: dict, k):
+    """The original lookup: step up from the roll until a key with a non-empty value is found."""
+    k = int(k)
+    out = None
+    while not out and k <= max(table.keys()):
+        out = dict.get(table, k)
+        k += 1
+    return out
+
+
+def check_lookups(table: MinValDict):
+    for k in range(min(table) - 3, max(table) + 3):
+        assert table.get(k) == linear_probe(table, k), k
+        if linear_probe(table, k):
+            assert table[k] == table[str(k)] == linear_probe(table, k)
+        else:
+            with pytest.raises(ValueError):
+                table[k]
+
+
+def test_lookups():
+    table = MinValDict()
+    table.update({2: 'Low', 5: 'Middle', 6: '', 9: 'High', 13: 0, 20: 'Top', 22: ''})
+    assert table.get(0) == table.get(2) == 'Low'
+    assert table.get(3) == table.get(5) == 'Middle'
+    assert table.get(6) == table.get(9) == 'High'  # Empty values fall through to the next key
+    assert table.get(13) == 'Top' and table.get(21) == '' and table.get(23) is None
+    check_lookups(table)
+
+
+def test_lookups_after_mutation():
+    table = MinValDict()
+    table.update({2: 'a', 5: 'b', 9: 'c'})
+    check_lookups(table)
+    table[7] = ' d '
+    assert table.get(6) == 'd'
+    check_lookups(table)
+    del table[5]
+    check_lookups(table)
+    table.pop(9)
+    table.setdefault(12, 'e')
+    check_lookups(table)
+    table[2] = ''
+    table |= {1: 'f', 15: 'g'}
+    check_lookups(table)
+    table.popitem()
+    check_lookups(table)
+    table.clear()
+    table[4] = 'h'
+    check_lookups(table)
+
+
+def test_random_tables():
+    rng = random.Random(4)
+    for i in range(200):
+        table = MinValDict()
+        for k in rng.sample(range(-5, 40), rng.randint(1, 12)):
+            table[k] = rng.choice(('x', 'y', '', None, 0, {'nested': 1}))
+        if not any(table.values()):
+            table[rng.randint(-5, 40)] = 'z'
+        check_lookups(table)
+        # A copy loaded from a pickle, as table stores are, must not keep a stale index
+        copy = pickle.loads(pickle.dumps(table))
+        copy[rng.randint(-5, 40)] = 'w'
+        check_lookups(copy)
@@ -0,0 +1,55 @@
+import pytest
+
+import LifePathGen
+from LifePathLibs import ConstraintError, InfeasibleConstraints
+from LifePathLibs.GenUtils import flat_name
+
+# Constraint specs, and the same constraints checked directly on a generated character
+constrained_cases = (
+    (('homeland=Cimmeria', 'Brawn>=10', 'Melee.foc>=2'),
+     lambda char: char.homeland == 'Cimmeria' and char.attributes['Brawn'] >= 10 and
+     char.skills['Melee']['foc'] >= 2),
+    (('caste=Farmer|Herder', 'archetype!=Pirate', 'standing<=2', 'Sorcery'),
+     lambda char: char.caste in ('Farmer', 'Herder') and flat_name(char.archetype) != 'pirate' and
+     char.standing <= 2 and char.skills.get('Sorcery', {}).get('exp', 0) >= 1),
+    (('Willpower>=12', 'Lore<=1', 'education=Under Duress'),
+     lambda char: char.attributes['Willpower'] >= 12 and char.skills.get('Lore', {}).get('exp', 0) <= 1 and
+     char.education == 'Under Duress'),
+)
+
+
+@pytest.mark.parametrize('specs, meets', constrained_cases)
+def test_constrained_characters_meet_constraints(table_store, specs, meets):
+    constrained = LifePathGen.constrained_paths(table_store, specs)
+    # No XP, since the constraints are on the life path before any is spent
+    chars = list(LifePathGen.generate_batch(100, full_auto=True, table_store=table_store, seed=31,
+                                            constrained=constrained))
+    assert all(meets(char) for char in chars)
+    assert all(char.constraints == specs for char in chars)
+
+
+def test_probability_matches_unconstrained_frequency(table_store):
+    chars = list(LifePathGen.generate_batch(2000, full_auto=True, table_store=table_store, seed=5))
+    for specs, meets in ((('caste=Farmer|Herder',), lambda char: char.caste in ('Farmer', 'Herder')),
+                         (('Brawn>=10',), lambda char: char.attributes['Brawn'] >= 10),
+                         (('caste=Farmer|Herder', 'Brawn>=10'),
+                          lambda char: char.caste in ('Farmer', 'Herder') and char.attributes['Brawn'] >= 10)):
+        p = LifePathGen.constrained_paths(table_store, specs).probability
+        frequency = sum(map(meets, chars)) / len(chars)
+        assert abs(frequency - p) < 4 * (p * (1 - p) / len(chars)) ** 0.5, specs
+
+
+def test_infeasible_constraints(table_store):
+    with pytest.raises(InfeasibleConstraints) as excinfo:
+        LifePathGen.constrained_paths(table_store, ['homeland=Cimmeria', 'Sorcery.foc>=3'])
+    assert excinfo.value.infeasible == ['Sorcery.foc>=3']
+    with pytest.raises(InfeasibleConstraints) as excinfo:
+        LifePathGen.constrained_paths(table_store, ['homeland=Cimmeria', 'homeland!=Cimmeria'])
+    assert excinfo.value.infeasible == []
+
+
+@pytest.mark.parametrize('spec', ('homeland=Atlantis', 'Strength>=10', 'caste>=Farmer', 'Brawn!=10', 'Brawn>=ten',
+                                  'Brawn'))
+def test_constraint_errors(table_store, spec):
+    with pytest.raises(ConstraintError):
+        LifePathGen.constrained_paths(table_store, [spec])
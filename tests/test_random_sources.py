@@ -0,0 +1,183 @@
+import pickle
+import random
+import threading
+import time
+import urllib.error
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from LifePathLibs import AsyncPrefetchSource, EntropyPool
+
+
+class CannedHandler(BaseHTTPRequestHandler):
+    """Serves the server's canned replies in turn, repeating the last: (status, body, delay, chunked)."""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(self.path)
+            server.clients.add(self.client_address)
+            status, body, delay, chunked = server.replies.pop(0) if len(server.replies) > 1 else server.replies[0]
+        time.sleep(delay)
+        self.send_response(status)
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for at in range(0, len(body), 7):
+                part = body[at:at + 7]
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(part), part))
+            self.wfile.write(b'0\r\n\r\n')
+        else:
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def payload(values) -> bytes:
+    return b''.join(b'%d\n' % value for value in values)
+
+
+def reply(values=(), status=200, body=None, delay=0.0, chunked=False) -> tuple:
+    return status, payload(values) if body is None else body, delay, chunked
+
+
+@pytest.fixture
+def random_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), CannedHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.requests = []
+    server.clients = set()
+    server.replies = [reply(range(1000))]
+    server.api_path = 'http://127.0.0.1:%d/integers/?num=%%d&min=%%d&max=%%d' % server.server_address[1]
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def test_values_come_from_the_server(random_server):
+    random_server.replies = [reply([3, 1, 4, 1, 5, 9, 2, 6])]
+    pool = EntropyPool(random_server.api_path, block_size=8, low_water=0)
+    assert [pool.raw_value() for i in range(8)] == [3, 1, 4, 1, 5, 9, 2, 6]
+    assert random_server.requests[0] == '/integers/?num=8&min=0&max=%d' % (EntropyPool.raw_range - 1)
+
+
+def test_refill_at_low_water_mark(random_server):
+    random_server.replies = [reply(range(10)), reply(range(10, 20))]
+    pool = EntropyPool(random_server.api_path, block_size=10, low_water=3)
+    assert [pool.raw_value() for i in range(7)] == list(range(7))
+    assert pool.metrics.fetches == 1 and len(pool.buffer) == 3
+    assert pool.raw_value() == 7
+    assert pool.metrics.fetches == 2 and list(pool.buffer) == [8, 9] + list(range(10, 20))
+
+
+def test_rejection_sampling(random_server):
+    # For a span of 3 the top raw value would over-weight the low end, so it is redrawn
+    random_server.replies = [reply([EntropyPool.raw_range - 1, 4, EntropyPool.raw_range - 2])]
+    pool = EntropyPool(random_server.api_path, block_size=3, low_water=0)
+    assert pool.randint(10, 12) == 11
+    assert pool.randint(10, 12) == 12
+    rng = random.Random(1)
+    random_server.replies = [reply(rng.randrange(EntropyPool.raw_range) for i in range(1000))]
+    pool = EntropyPool(random_server.api_path, block_size=1000)
+    for min_val, max_val in ((1, 20), (0, 1), (-5, 5), (1, 65535), (0, 1 << 20)):
+        assert all(min_val <= val <= max_val for val in pool.randints(min_val, max_val, 200))
+    assert pool.randint(7, 7) == 7
+
+
+def test_http_error(random_server):
+    random_server.replies = [reply(status=503)]
+    with pytest.raises(urllib.error.HTTPError):
+        EntropyPool(random_server.api_path).raw_value()
+
+
+def test_fallback_on_http_errors(random_server):
+    random_server.replies = [reply(status=500), reply(body=b'<html>busy</html>'), reply(range(100))]
+    pool = EntropyPool(random_server.api_path, block_size=100, low_water=0, fallback=random.Random(5),
+                       retry_delay=0.05)
+    expected = random.Random(5).getrandbits(EntropyPool.raw_bits)
+    assert pool.raw_value() == expected
+    assert pool.metrics.fetch_failures == 1 and pool.metrics.fallback_values == 1
+    # No fetch is retried until retry_delay has passed
+    pool.randints(1, 20, 10)
+    assert len(random_server.requests) == 1
+    time.sleep(0.06)
+    pool.raw_value()  # The malformed block fails as well
+    time.sleep(0.06)
+    assert pool.raw_value() == 0
+    assert len(random_server.requests) == 3 and pool.metrics.fetch_failures == 2 and pool.metrics.fetches == 1
+
+
+@pytest.fixture
+def prefetch_source():
+    sources = []
+
+    def make_source(*args, **kwargs):
+        sources.append(AsyncPrefetchSource(*args, **kwargs))
+        return sources[-1]
+    yield make_source
+    for source in sources:
+        source.close()
+
+
+def test_prefetch(random_server, prefetch_source):
+    random_server.replies = [reply(range(100)), reply(range(100, 200))]
+    source = prefetch_source(random_server.api_path, block_size=100, low_water=50)
+    values = [source.raw_value() for i in range(50)]
+    assert source.pending is None and len(source.buffer) == 50
+    values.append(source.raw_value())
+    assert source.pending is not None  # Requested once the buffer dropped below the mark, well before it ran out
+    source.pending.result(timeout=5)
+    values += [source.raw_value() for i in range(149)]
+    assert values == list(range(200))
+    assert source.metrics.stalls == 1 and source.metrics.fallback_values == 0
+    assert source.metrics.fetches >= 2 and len(random_server.clients) == 1  # One kept-alive connection
+
+
+def test_chunked_response(random_server, prefetch_source):
+    random_server.replies = [reply(range(100), chunked=True)]
+    source = prefetch_source(random_server.api_path, block_size=100, low_water=0)
+    assert [source.raw_value() for i in range(100)] == list(range(100))
+
+
+def test_slow_response_falls_back(random_server, prefetch_source):
+    random_server.replies = [reply(range(100), delay=0.5)]
+    source = prefetch_source(random_server.api_path, block_size=100, low_water=0, deadline=0.05,
+                             fallback=random.Random(3))
+    fallback = random.Random(3)
+    assert [source.raw_value() for i in range(5)] == [fallback.getrandbits(16) for i in range(5)]
+    assert source.metrics.fallback_values == 5 and source.metrics.stalls == 1
+    assert source.metrics.stall_time < 0.5
+    source.pending.result(timeout=5)
+    assert source.raw_value() == 0
+    assert source.metrics.fallback_values == 5
+
+
+def test_malformed_response(random_server, prefetch_source):
+    random_server.replies = [reply(body=b'<html>busy</html>'), reply(range(100))]
+    source = prefetch_source(random_server.api_path, block_size=100)
+    with pytest.raises(ValueError):
+        source.raw_value()
+    random_server.replies = [reply(status=503), reply(body=b'1\n2\nthree\n'), reply(range(100))]
+    source = prefetch_source(random_server.api_path, block_size=100, low_water=0, deadline=1.0,
+                             fallback=random.Random(3), retry_delay=0.05)
+    source.raw_value()
+    assert source.metrics.fetch_failures == 2 and source.buffer.popleft() == 1
+
+
+def test_copies_fall_back_on_their_own_streams():
+    for source in (AsyncPrefetchSource(deadline=0.1, fallback=random.Random(3)),
+                   EntropyPool(fallback=random.Random(3))):
+        copies = [pickle.loads(pickle.dumps(source)) for i in range(2)]
+        streams = [[copy.fallback.getrandbits(EntropyPool.raw_bits) for i in range(20)] for copy in copies]
+        original = random.Random(3)
+        assert streams[0] != streams[1]
+        assert [original.getrandbits(EntropyPool.raw_bits) for i in range(20)] not in streams
@@ -0,0 +1,58 @@
+import pytest
+
+import LifePathGen
+from LifePathLibs import ReplayError, ReplayLogWriter, ReplayRecord, ScriptedChoices, WeightedChoices, \
+    read_replay_log
+from LifePathLibs.Replay import replay_magic, replay_version
+
+
+def record_state(char) -> tuple:
+    return char.to_record().__getstate__()
+
+
+def recorded_batch(table_store) -> list:
+    chars = list(LifePathGen.generate_batch(20, full_auto=True, xp=2000, table_store=table_store, seed=11))
+    chars += list(LifePathGen.generate_batch(5, full_auto=True, xp=1000, table_store=table_store, seed=12,
+                                             xp_goals=('Melee',)))
+    chars += list(LifePathGen.generate_batch(5, full_auto=True, table_store=table_store, seed=13,
+                                             policy=WeightedChoices({'gender': {'Female': 5}})))
+    # An interactive character, with its answers scripted
+    chars.append(LifePathGen.seeded_character(table_store, 14, xp=500, name='Conan', policy=ScriptedChoices([0] * 50)))
+    return chars
+
+
+def test_replay_log_is_bit_exact(table_store, tmp_path):
+    chars = recorded_batch(table_store)
+    log_path = str(tmp_path / 'roster.replay')
+    writer = ReplayLogWriter(log_path)
+    for char in chars:
+        writer.add(char)
+    writer.close()
+    records = list(read_replay_log(log_path))
+    assert records == [char.to_replay() for char in chars]
+    assert [ReplayRecord.unpack(record.pack()) for record in records] == records
+    replayed = list(LifePathGen.replay_batch(log_path, table_store))
+    assert [record_state(char) for char in replayed] == [record_state(char) for char in chars]
+    assert [str(char) for char in replayed] == [str(char) for char in chars]
+
+
+def test_fingerprint_mismatch(table_store, tmp_path):
+    log_path = tmp_path / 'roster.replay'
+    writer = ReplayLogWriter(str(log_path))
+    writer.add(LifePathGen.seeded_character(table_store, 1, full_auto=True, name=''))
+    writer.close()
+    data = bytearray(log_path.read_bytes())
+    fingerprint_at = len(replay_magic) + 1
+    assert data[len(replay_magic)] == replay_version
+    data[fingerprint_at] ^= 0xff
+    log_path.write_bytes(bytes(data))
+    with pytest.raises(ReplayError):
+        list(read_replay_log(str(log_path)))
+    assert len(list(read_replay_log(str(log_path), check_tables=False))) == 1
+
+
+def test_changed_choices_are_refused(table_store):
+    record = LifePathGen.seeded_character(table_store, 2, full_auto=True, name='').to_replay()
+    record.choices = tuple((choice + 1) % 2 for choice in record.choices)
+    with pytest.raises(ReplayError):
+        LifePathGen.replay_character(record, table_store)
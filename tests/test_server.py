@@ -0,0 +1,101 @@
+import asyncio
+import json
+import random
+import urllib.error
+import urllib.request
+
+import LifePathGen
+import LifePathServer
+from LifePathLibs import character_record
+
+
+def get(port: int, target: str):
+    """(status, headers, decoded JSON body) for a GET, run off the event loop."""
+    def fetch():
+        try:
+            with urllib.request.urlopen('http://127.0.0.1:%d%s' % (port, target), timeout=30) as response:
+                return response.status, response.headers, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers, json.loads(e.read())
+    return asyncio.to_thread(fetch)
+
+
+async def wait_until(condition, timeout: float=10.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.01)
+
+
+def run_service(scenario, **service_args):
+    """Runs scenario(service, port) against the service on an ephemeral localhost port."""
+    async def main():
+        service = LifePathServer.GenerationService(workers=0, **service_args)
+        await service.start()
+        server = await asyncio.start_server(
+            lambda reader, writer: LifePathServer.handle_connection(service, reader, writer), '127.0.0.1', 0)
+        try:
+            async with server:
+                await scenario(service, server.sockets[0].getsockname()[1])
+        finally:
+            service.close()
+    asyncio.run(main())
+
+
+def test_generate(table_store):
+    async def scenario(service, port):
+        status, headers, body = await get(port, '/generate?count=3&xp=500&seed=7')
+        assert status == 200 and headers['X-Seed'] == '7'
+        expected = LifePathGen.generate_batch(3, full_auto=True, xp=500, table_store=table_store, seed=7)
+        assert body == {'seed': 7, 'characters': [character_record(char) for char in expected]}
+        status, headers, body = await get(port, '/generate?count=0')
+        assert status == 400 and 'count' in body['error']
+    run_service(scenario)
+
+
+def test_unseeded_requests_differ():
+    async def scenario(service, port):
+        seeds = set()
+        for i in range(3):
+            random.seed(0)  # Generating on the server's own thread reseeds the global random like this
+            status, headers, body = await get(port, '/generate')
+            seeds.add(body['seed'])
+        assert len(seeds) == 3
+    run_service(scenario)
+
+
+def test_concurrency_limit_and_metrics():
+    async def scenario(service, port):
+        await service.slots.acquire()  # Hold the only slot, as a long request would
+        queued = asyncio.ensure_future(get(port, '/generate?seed=3'))
+        await wait_until(lambda: service.waiting == 1)
+        status, headers, body = await get(port, '/generate?seed=4')
+        assert status == 503
+        status, headers, metrics = await get(port, '/metrics')
+        assert metrics['waiting'] == 1 and metrics['in_flight'] == 0 and metrics['rejected'] == 1
+        await asyncio.sleep(0.1)
+        assert not queued.done()
+        service.slots.release()
+        status, headers, body = await queued
+        assert status == 200 and body['seed'] == 3
+        status, headers, metrics = await get(port, '/metrics')
+        assert metrics['requests'] == 1 and metrics['characters'] == 1 and metrics['waiting'] == 0
+        assert metrics['queue_wait']['max_ms'] >= 100
+        assert metrics['latency']['p50_ms'] >= metrics['queue_wait']['p50_ms']
+        assert set(metrics['latency']) == {'p50_ms', 'p90_ms', 'p99_ms', 'max_ms', 'mean_ms'}
+    run_service(scenario, max_concurrent=1, max_queue=1)
+
+
+def test_malformed_content_length():
+    async def scenario(service, port):
+        for length in ('abc', '-5'):
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b'POST /generate HTTP/1.1\r\nHost: localhost\r\nContent-Length: %s\r\n\r\n{}' %
+                         length.encode('ascii'))
+            response = await asyncio.wait_for(reader.read(), 10)  # The connection is closed after the error
+            writer.close()
+            head, _, body = response.partition(b'\r\n\r\n')
+            assert head.startswith(b'HTTP/1.1 400 ') and b'Connection: close' in head
+            assert 'Content-Length' in json.loads(body)['error']
+        assert service.metrics.errors == 2
+    run_service(scenario)
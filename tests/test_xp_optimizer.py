@@ -0,0 +1,42 @@
+import pytest
+
+import LifePathGen
+from LifePathLibs import TalentGoal, objective_from_specs, optimize_xp
+
+
+def test_high_focus_talent_goal(table_store):
+    # Focus above 8 takes Talent.cost below zero, which used to index the knapsack tables out of range
+    for seed, goals in ((0, ['talent=Force of Presence']), (1, ['talent=Living Shadow', 'Melee'])):
+        char = LifePathGen.seeded_character(table_store, seed, full_auto=True, xp=10000, name='', xp_goals=goals)
+        assert char.xp >= 0
+        assert goals[0].partition('=')[2] in char.talents
+
+
+def test_free_talents_cost_nothing(table_store):
+    char = LifePathGen.seeded_character(table_store, 2, full_auto=True, name='')
+    char.talents.pop('No Mercy', None)
+    char.skills['Melee'] = {'exp': 12, 'foc': 12}  # A tier 1 talent would cost 200 - 12 * 25 < 0
+    char.xp = 0
+    plan = optimize_xp(char, TalentGoal('No Mercy'))
+    assert [(upg_type, key.name, cost) for upg_type, key, cost in plan.purchases] == [('talents', 'No Mercy', 0)]
+    # Random spends price it the same way, rather than being paid to take it
+    assert table_store.talents['No Mercy'].cost(char.skills) == 0
+    char.eligible_talents = None
+    char.step11_randomize_xp()
+    assert char.xp == 0 and char.xp_spent == 0
+    assert 'Spent 0 xp to purchase the talent No Mercy' in char.xp_spends
+
+
+def test_plan_is_affordable_and_allowed(table_store):
+    for seed in range(10):
+        char = LifePathGen.seeded_character(table_store, seed, full_auto=True, name='')
+        char.xp = 3000
+        char.xp_goals = ('Melee', 'talent=Agile')
+        char.spend_xp_on_goals()  # Raises if a talent is bought before its pre-requisites
+        assert 0 <= char.xp <= 3000
+        assert char.xp + char.xp_spent == 3000
+
+
+def test_unknown_goal():
+    with pytest.raises(ValueError):
+        objective_from_specs(['Bogus'])
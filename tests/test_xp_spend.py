@@ -0,0 +1,40 @@
+import LifePathGen
+
+
+def frontier_purchases(frontier) -> dict:
+    """The frontier in the shape of CharacterMaker.affordable_purchases: {type: {key: cost}} for non-empty types."""
+    purchases = {}
+    for upg_type, bucket in frontier.buckets.items():
+        assert sorted(bucket.positions.values()) == list(range(len(bucket.keys)))
+        assert set(bucket.costs) == set(bucket.keys)
+        if bucket:
+            purchases[upg_type] = {key: bucket.costs[key] for key in bucket.keys}
+    return purchases
+
+
+def test_eligibility_and_frontier_match_rescan(table_store, monkeypatch):
+    spend_xp = LifePathGen.CharacterMaker.spend_xp
+    checked = []
+
+    def check(char, frontier):
+        talents = table_store.talents
+        assert char.eligible_talents.eligible == {key for key, talent in talents.items()
+                                                  if talent.is_allowed(char.talents, char.skills)}
+        assert frontier.budget == char.xp
+        assert frontier_purchases(frontier) == char.affordable_purchases()
+        checked.append(char)
+
+    def checked_spend_xp(self, frontier):
+        choose = frontier.choose
+
+        def checked_choose(*args):
+            check(self, frontier)
+            return choose(*args)
+        frontier.choose = checked_choose
+        return spend_xp(self, frontier)
+    monkeypatch.setattr(LifePathGen.CharacterMaker, 'spend_xp', checked_spend_xp)
+    chars = list(LifePathGen.generate_batch(12, full_auto=True, xp=4000, table_store=table_store, seed=21))
+    # Checked before the first purchase and after every one, until nothing more is affordable
+    assert len(checked) == sum(len(char.xp_spends) + 1 for char in chars)
+    assert any(spend.startswith('Spent') and 'talent' in spend for char in chars for spend in char.xp_spends)
+    assert any('foc in' in spend for char in chars for spend in char.xp_spends)